@@ -5,9 +5,12 @@ import common.config
 import common.file
 import params
 from common.config import create_node_info_dir
+from common.file_watcher import get_file_watcher
+from common.profiler import get_profiler
 from node import Node, NodeService
 from common.logger import log, add_logs_handler_file
-from core import pre_shared_key
+from core import pre_shared_key, psk_candidates, qrng
+from core.qkd import key_pool
 from web.local_server import LocalServerWrapper
 from web.external_server import ExternalServerWrapper
 from time import sleep
@@ -17,6 +20,8 @@ common.config.init_config(params.args.config_file)
 common.file.initialise_file_managers()
 
 create_node_info_dir()
+if get_file_watcher() is not None:
+    common.file.watch_files(get_file_watcher())
 add_logs_handler_file()
 params.args.startup_args.append("--rpc-port")
 params.args.startup_args.append(str(common.config.config_service.config.node_http_rpc_port))
@@ -28,17 +33,29 @@ params.args.startup_args.append("--node-key-file")
 params.args.startup_args.append(common.config.config_service.config.node_key_file_path)
 node.node_service = NodeService(Node(params.args.startup_args))
 
+external_server = None
+
 try:
     log.info("Starting QMC runner...")
-    if not common.file.psk_file_manager.exists():
+    get_profiler()
+    qrng.get_entropy_pool().prime(common.config.config_service.config.qrng_prime_timeout)
+    common.file.psk_state.sync_files()
+    last_epoch = common.file.psk_journal.last()
+    if not common.file.psk_file_manager.exists() and last_epoch is not None:
+        log.info("Starting the node with the last verified pre-shared key")
+        common.file.psk_state.update(last_epoch.psk, last_epoch.signature, last_epoch.block_number)
+        node.node_service.warm_restart_psk = last_epoch.psk
+    elif not common.file.psk_file_manager.exists():
         psk_obj = None
         while psk_obj is None:
             psk_obj = pre_shared_key.get_psk_from_peers()
             sleep(10)
-        common.file.psk_file_manager.create(psk_obj.psk)
-        common.file.psk_sig_file_manager.create(psk_obj.signature)
+        common.file.psk_state.update(psk_obj.psk, psk_obj.signature, psk_obj.block_number)
+        common.file.psk_journal.record(psk_obj.psk, psk_obj.signature, psk_obj.block_number, "peers")
 
     node.node_service.current_node.start()
+    psk_candidates.get_psk_candidates()
+    key_pool.start_key_pools()
 
     external_server = ExternalServerWrapper()
     external_thread = Thread(target=external_server.run, args=())
@@ -53,4 +70,6 @@ except Exception as e:
     log.error(str(e))
 finally:
     log.info("Closing QMC processes...")
+    if external_server is not None:
+        external_server.stop()
     node.node_service.current_node.terminate()
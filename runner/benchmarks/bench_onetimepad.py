@@ -0,0 +1,39 @@
+"""
+Compares the one-time pad engine with the onetimepad package it replaced.
+
+Run from the runner directory:
+    python -m benchmarks.bench_onetimepad
+"""
+import os
+import timeit
+
+import onetimepad
+
+from core import onetimepad as engine
+
+KEY_SIZES = [("32 B", 32), ("4 KiB", 4 * 1024), ("1 MiB", 1024 * 1024)]
+
+
+def measure(function, *args) -> float:
+    timer = timeit.Timer(lambda: function(*args))
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=3, number=number)) / number
+
+
+def main():
+    print(f"{'key size':>10} {'operation':>10} {'onetimepad':>14} {'engine':>14} {'speedup':>9}")
+    for name, size in KEY_SIZES:
+        psk = os.urandom(size).hex()
+        qkd_key = os.urandom(size).hex()
+        ciphertext = engine.encrypt(psk, qkd_key)
+        operations = [("encrypt", onetimepad.encrypt, engine.encrypt, psk),
+                      ("decrypt", onetimepad.decrypt, engine.decrypt, ciphertext)]
+        for operation, reference, candidate, text in operations:
+            reference_time = measure(reference, text, qkd_key)
+            engine_time = measure(candidate, text, qkd_key)
+            print(f"{name:>10} {operation:>10} {reference_time * 1e6:>12.1f}us {engine_time * 1e6:>12.1f}us "
+                  f"{reference_time / engine_time:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
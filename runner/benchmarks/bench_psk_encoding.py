@@ -0,0 +1,41 @@
+"""
+Compares the binary PSK encoding with pickle, for encoding alone and for signature verification.
+
+Run from the runner directory:
+    python -m benchmarks.bench_psk_encoding
+"""
+import os
+import timeit
+
+import common.config
+from common import crypto
+from core.pre_shared_key import Psk, signing_payload, BINARY_ENCODING, PICKLE_ENCODING
+
+PRIVATE_KEY = "df432c8e967aa21fdd287d3ea61fa85640a8309577f65b4ea78d49d514661654"
+PEER_ID = "12D3KooWKzWKFojk7A1Hw23dpiQRbLs6HrXFf4EGLsN4oZ1WsWCc"
+
+
+def throughput(function) -> float:
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return number / min(timer.repeat(repeat=3, number=number))
+
+
+def main():
+    common.config.init_config()
+    psk = os.urandom(32).hex()
+    block_number = 1234
+    public_key = crypto.public_key_from_peerid(PEER_ID)
+
+    print(f"{'encoding':>10} {'encode/s':>12} {'serialize/s':>12} {'size':>6} {'verify/s':>10}")
+    for encoding in (PICKLE_ENCODING, BINARY_ENCODING):
+        signature = crypto.sign(signing_payload(psk, block_number, encoding), PRIVATE_KEY)
+        encode = throughput(lambda: signing_payload(psk, block_number, encoding))
+        serialize = throughput(lambda: Psk(psk, block_number=block_number).serialize(encoding))
+        verify = throughput(lambda: crypto.verify(signing_payload(psk, block_number, encoding), signature, public_key))
+        size = len(signing_payload(psk, block_number, encoding))
+        print(f"{encoding:>10} {encode:>12.0f} {serialize:>12.0f} {size:>6} {verify:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
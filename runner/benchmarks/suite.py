@@ -0,0 +1,232 @@
+"""
+Micro-benchmarks of the runner's hot paths. The results are written as JSON, and compared with a stored baseline
+they flag the benchmarks which got slower by more than the threshold. The KME and the peers are mocked,
+so the suite runs offline.
+
+Run from the runner directory:
+    python -m benchmarks.suite --output baseline.json
+    python -m benchmarks.suite --baseline baseline.json --threshold 0.2
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import re
+import statistics
+import sys
+import tempfile
+import timeit
+from contextlib import ExitStack
+
+import requests_mock
+
+import common.config
+import common.file
+from common import crypto
+from common.config import Config
+from common.file import PskJournal
+from common.logger import log
+from core import onetimepad, pre_shared_key
+from core.pre_shared_key import Psk, signing_payload
+from web.external_server import ExternalServerWrapper
+
+PRIVATE_KEY = "df432c8e967aa21fdd287d3ea61fa85640a8309577f65b4ea78d49d514661654"
+PEER_ID = "12D3KooWKzWKFojk7A1Hw23dpiQRbLs6HrXFf4EGLsN4oZ1WsWCc"
+BLOCK_NUMBER = 1234
+CONFIG_PEERS = 1000
+VALIDATED_PSKS = 16
+QKD_KEY = "qV4XorklC1EbehIbsovSaRGlWhyw3jETpt/laDSr3BQ="
+DEFAULT_THRESHOLD = 0.2
+DEFAULT_REPEAT = 5
+
+benchmarks = {}
+
+
+def benchmark(name):
+    """
+    Registers a function which prepares the benchmark and returns the call to measure.
+    """
+    def register(setup):
+        benchmarks[name] = setup
+        return setup
+    return register
+
+
+@benchmark("onetimepad.encrypt")
+def bench_onetimepad_encrypt(_resources):
+    psk, qkd_key = os.urandom(32).hex(), os.urandom(32).hex()
+    return lambda: onetimepad.encrypt(psk, qkd_key)
+
+
+@benchmark("onetimepad.decrypt")
+def bench_onetimepad_decrypt(_resources):
+    qkd_key = os.urandom(32).hex()
+    ciphertext = onetimepad.encrypt(os.urandom(32).hex(), qkd_key)
+    return lambda: onetimepad.decrypt(ciphertext, qkd_key)
+
+
+@benchmark("crypto.sign")
+def bench_crypto_sign(_resources):
+    payload = signing_payload(os.urandom(32).hex(), BLOCK_NUMBER)
+    return lambda: crypto.sign(payload, PRIVATE_KEY)
+
+
+@benchmark("crypto.verify")
+def bench_crypto_verify(_resources):
+    payload = signing_payload(os.urandom(32).hex(), BLOCK_NUMBER)
+    signature = crypto.sign(payload, PRIVATE_KEY)
+    public_key = crypto.public_key_from_peerid(PEER_ID)
+    return lambda: crypto.verify(payload, signature, public_key)
+
+
+@benchmark("crypto.to_public_from_peerid")
+def bench_crypto_to_public_from_peerid(_resources):
+    return lambda: crypto.to_public_from_peerid(PEER_ID)
+
+
+@benchmark("Psk.serialize")
+def bench_psk_serialize(_resources):
+    psk = os.urandom(32).hex()
+    signature = crypto.sign(signing_payload(psk, BLOCK_NUMBER), PRIVATE_KEY).hex()
+    psk_obj = Psk(psk, block_number=BLOCK_NUMBER, signature=signature)
+    return lambda: psk_obj.serialize()
+
+
+@benchmark(f"Config.from_json[peers={CONFIG_PEERS}]")
+def bench_config_from_json(_resources):
+    config_dict = dict(common.config.default_config)
+    peer_config = config_dict["peers"][PEER_ID]
+    config_dict["peers"] = {f"peer-{index}": json.loads(json.dumps(peer_config)) for index in range(CONFIG_PEERS)}
+    config_json = json.dumps(config_dict)
+    return lambda: Config.from_json(config_json)
+
+
+@benchmark(f"validate_psk[matching={VALIDATED_PSKS}]")
+def bench_validate_matching_psks(_resources):
+    psk = os.urandom(32).hex()
+    signature = crypto.sign(signing_payload(psk, BLOCK_NUMBER), PRIVATE_KEY).hex()
+    psks = [Psk(psk, signature=signature) for _ in range(VALIDATED_PSKS)]
+    validate_psk = getattr(pre_shared_key, "__validate_psk")
+    return lambda: validate_psk(psks, BLOCK_NUMBER)
+
+
+@benchmark(f"validate_psk[creator,invalid={VALIDATED_PSKS - 1}]")
+def bench_validate_psks_of_creator(_resources):
+    # Every signature but the last one is wrong, so each of them is checked
+    psks = [Psk(os.urandom(32).hex(), signature=os.urandom(64).hex()) for _ in range(VALIDATED_PSKS - 1)]
+    psk = os.urandom(32).hex()
+    psks.append(Psk(psk, signature=crypto.sign(signing_payload(psk, BLOCK_NUMBER), PRIVATE_KEY).hex()))
+    validate_psk = getattr(pre_shared_key, "__validate_psk")
+    return lambda: validate_psk(psks, BLOCK_NUMBER, PEER_ID)
+
+
+@benchmark("get_psk round trip")
+def bench_get_psk_round_trip(resources):
+    """
+    The peer encrypts the journaled PSK with a key of the mocked KME in its external server,
+    this runner fetches it, decrypts it with the same key and checks the signature of its creator.
+    """
+    config = common.config.config_service.config
+    peer_config = config.peers[PEER_ID]
+    psk = os.urandom(32).hex()
+    signature = crypto.sign(signing_payload(psk, BLOCK_NUMBER), PRIVATE_KEY).hex()
+    journal_dir = resources.enter_context(tempfile.TemporaryDirectory())
+    common.file.psk_journal = PskJournal(os.path.join(journal_dir, "psk.journal"), 4)
+    common.file.psk_journal.record(psk, signature, BLOCK_NUMBER, "peers")
+    peer_server = ExternalServerWrapper().external_server.test_client()
+
+    def peer_psk_response(request, context):
+        response = peer_server.get(f"/peer/{PEER_ID}/psk?{request.query}")
+        context.status_code = response.status_code
+        return response.get_json()
+
+    kme = resources.enter_context(requests_mock.Mocker())
+    qkd_keys = {"keys": [{"key_ID": "bench", "key": QKD_KEY}]}
+    kme.get(re.compile(re.escape(peer_config["qkd"]["url"]) + "/(enc|dec)_keys"), json=qkd_keys)
+    kme.get(re.compile(re.escape(peer_config["server_addr"]) + "/peer/[^/]+/psk"), json=peer_psk_response)
+
+    def round_trip():
+        if pre_shared_key.get_psk_from_peers(BLOCK_NUMBER, PEER_ID) is None:
+            raise RuntimeError("The round trip didn't return the psk")
+    return round_trip
+
+
+def measure(function, repeat) -> dict:
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    times = [total / number for total in timer.repeat(repeat=repeat, number=number)]
+    return {"seconds": min(times), "median": statistics.median(times), "number": number, "repeat": repeat}
+
+
+def run(names, repeat) -> dict:
+    common.config.init_config()
+    # Fetches and invalid signatures are logged, their cost shouldn't be measured
+    log.setLevel(logging.CRITICAL)
+    results = {}
+    for name in names:
+        with ExitStack() as resources:
+            results[name] = measure(benchmarks[name](resources), repeat)
+        print(f"{name:<40} {results[name]['seconds'] * 1e6:>12.2f}us", file=sys.stderr)
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> list:
+    """
+    Prints each benchmark against its baseline, returns the names of those slower by more than the threshold.
+    """
+    regressions = []
+    print(f"{'benchmark':<40} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, result in report["results"].items():
+        baseline_result = baseline["results"].get(name)
+        if baseline_result is None:
+            print(f"{name:<40} {'-':>12} {result['seconds'] * 1e6:>10.2f}us {'new':>8}")
+            continue
+        change = result["seconds"] / baseline_result["seconds"] - 1
+        regressed = change > threshold
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<40} {baseline_result['seconds'] * 1e6:>10.2f}us {result['seconds'] * 1e6:>10.2f}us "
+              f"{change:>+7.1%}{' REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the runner's hot paths")
+    parser.add_argument("--output", help="path of the JSON results, printed to the standard output by default")
+    parser.add_argument("--baseline", help="path of stored JSON results to compare with")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"relative slowdown reported as a regression (default {DEFAULT_THRESHOLD})")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help=f"number of timed runs of each benchmark, the fastest is kept (default {DEFAULT_REPEAT})")
+    parser.add_argument("--filter", default="", help="run only the benchmarks whose name contains this text")
+    return parser.parse_args(args)
+
+
+def main(args=None) -> int:
+    args = parse_args(args)
+    names = [name for name in benchmarks if args.filter in name]
+    report = run(names, args.repeat)
+
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    elif args.baseline is None:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline is not None:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} benchmark(s) slower than the baseline by more than {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -32,6 +32,61 @@ default_config = {
 
 
 class Config:
+    # Optional settings, overridden when present in the config file
+    psk_fetch_timeout = 5
+    psk_fetch_deadline = 15
+    psk_fetch_quorum = None
+    qkd_key_pool_low_watermark = 2
+    qkd_key_pool_high_watermark = 0
+    qkd_key_pool_batch_size = 8
+    qkd_key_ttl = 300
+    qkd_kme_reserve = 10
+    qrng_buffer_size = 1024
+    qrng_refill_threshold = 256
+    qrng_timeout = 10
+    qrng_prime_timeout = 10
+    qrng_retry_min_delay = 1
+    qrng_retry_max_delay = 300
+    psk_state_check_interval = 1
+    psk_encoding = "pickle"
+    psk_accept_legacy_encoding = True
+    psk_journal_path = None
+    psk_journal_size = 16
+    psk_journal_max_age = 0
+    psk_record_path = None
+    file_watcher = "inotify"
+    file_watch_poll_interval = 1
+    psk_rotation_workers = 2
+    psk_rotation_max_attempts = 0
+    psk_rotation_time_budget = 120
+    psk_candidate_window = 8
+    node_log_max_bytes = 100 * 1024 * 1024
+    node_log_max_age = 0
+    node_log_backup_count = 5
+    node_log_compression = "gzip"
+    node_log_flush_interval = 1
+    node_log_queue_size = 10000
+    node_log_console = True
+    node_log_buffer_lines = 10000
+    node_rpc_timeout = 5
+    node_health_min_interval = 5
+    node_health_failure_threshold = 3
+    node_ws_rpc_port = 9944
+    node_block_stall_timeout = 30
+    node_finality_stall_timeout = 60
+    node_ws_reconnect_max_interval = 60
+    node_stop_grace_period = 10
+    node_ready_timeout = 60
+    node_crash_restart_min_delay = 1
+    node_crash_restart_max_delay = 60
+    external_server_mode = "asgi"
+    asgi_workers = 32
+    asgi_max_connections = 1024
+    asgi_keep_alive_timeout = 30
+    asgi_graceful_shutdown_timeout = 10
+    profiler_enabled = False
+    profiler_interval = 0.01
+
     def __init__(self, config_dict):
         for key, value in config_dict.items():
             if key.endswith("path") and value is not None:
@@ -68,6 +123,10 @@ def init_config(config_path=None):
 
     global config_service
     config_service = ConfigService(config)
+    # Imported here, because crypto depends on the logger, which depends on the config
+    from common import crypto
+    peer_ids = [config.local_peer_id, *config.peers] if hasattr(config, "local_peer_id") else list(config.peers)
+    crypto.cache_public_keys(peer_ids)
 
 
 def create_node_info_dir():
@@ -1,5 +1,7 @@
 import base64
 import binascii
+from functools import lru_cache
+from typing import Union
 
 import base58
 from cryptography.exceptions import InvalidSignature
@@ -21,14 +23,33 @@ def to_public_from_peerid(peer_id: str) -> bytes:
     return bytes.fromhex(peerid_hex)
 
 
+@lru_cache(maxsize=None)
+def public_key_from_peerid(peer_id: str) -> ed25519.Ed25519PublicKey:
+    """
+    Returns the public key object of the peer, decoding the peer id only the first time it's needed.
+    """
+    return ed25519.Ed25519PublicKey.from_public_bytes(to_public_from_peerid(peer_id))
+
+
+def cache_public_keys(peer_ids):
+    for peer_id in peer_ids:
+        try:
+            public_key_from_peerid(peer_id)
+        except ValueError:
+            log.warning(f"Couldn't decode public key of peer {peer_id}")
+
+
 def sign(data: bytes, priv_key_str: str) -> bytes:
     priv_key_bytes = bytearray.fromhex(priv_key_str)
     private_key = ed25519.Ed25519PrivateKey.from_private_bytes(priv_key_bytes)
     return private_key.sign(data)
 
 
-def verify(data: bytes, signature: bytes, pub_key_bytes: bytes) -> bool:
-    public_key = ed25519.Ed25519PublicKey.from_public_bytes(pub_key_bytes)
+def verify(data: bytes, signature: bytes, pub_key: Union[bytes, ed25519.Ed25519PublicKey]) -> bool:
+    if isinstance(pub_key, ed25519.Ed25519PublicKey):
+        public_key = pub_key
+    else:
+        public_key = ed25519.Ed25519PublicKey.from_public_bytes(pub_key)
     try:
         public_key.verify(signature, data)
         return True
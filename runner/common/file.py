@@ -1,36 +1,531 @@
+import errno
+import json
 import os
+import time
+import zlib
+from dataclasses import dataclass, asdict, replace
+from threading import Lock, get_ident
+from typing import Optional
 
 import common.config
+from common.logger import log
+
+# PSK records are tiny, a single read of this size always gets the whole record
+MAX_RECORD_SIZE = 64 * 1024
+
+
+def write_atomically(file_path, data: bytes):
+    """
+    Writes the file through a synced temporary file renamed over it, so readers see either the old or the new content.
+    """
+    temp_path = f"{file_path}.{os.getpid()}.{get_ident()}.tmp"
+    try:
+        with open(temp_path, "wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, file_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def write_in_place(file_path, data: bytes):
+    """
+    Truncates the file and writes it through the same inode, synced before returning.
+    """
+    with open(file_path, "wb") as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
 
 
 class FileManager:
 
     def __init__(self, file_path):
         self.file_path = file_path
+        self.watched = False
+        self.lock = Lock()
+        # (exists, data) of a watched file, data is None until it's read. It's dropped on every change of the file
+        self.cache = None
+        self.version = 0
+
+    def watch(self, file_watcher):
+        """
+        Keeps the file in memory until the watcher reports a change, instead of checking it on every access.
+        """
+        try:
+            file_watcher.subscribe(self.file_path, self.__changed)
+        except OSError as e:
+            log.warning(f"Couldn't watch {self.file_path}, it's checked on every access: {e}")
+            return
+        self.watched = True
 
     def exists(self) -> bool:
-        return os.path.exists(self.file_path)
+        cache = self.cache
+        if cache is not None:
+            return cache[0]
+        version = self.version
+        exists = os.path.exists(self.file_path)
+        self.__store(version, (exists, None))
+        return exists
 
     def create(self, data: str):
-        with open(self.file_path, 'w') as file:
-            file.write(data)
+        try:
+            write_atomically(self.file_path, data.encode())
+        except OSError as e:
+            if e.errno not in (errno.EBUSY, errno.EXDEV):
+                raise
+            # The file can't be replaced when it's a mount point, e.g. a single file bind-mounted into a container
+            write_in_place(self.file_path, data.encode())
+        self.__store(None, (True, data))
 
     def read(self) -> str:
+        cache = self.cache
+        if cache is not None and cache[1] is not None:
+            return cache[1]
+        version = self.version
         with open(self.file_path, 'r') as file:
-            return file.read()
+            data = file.read()
+        self.__store(version, (True, data))
+        return data
 
     def remove(self):
         if self.exists():
             os.remove(self.file_path)
+            self.__store(None, (False, None))
         else:
             raise FileNotFoundError
 
+    def __changed(self, _file_path, _event):
+        with self.lock:
+            self.version += 1
+            self.cache = None
+
+    def __store(self, version, cache):
+        """
+        Caches what was seen at `version`, unless the file changed since. Writes of the process pass no version.
+        """
+        if not self.watched:
+            return
+        with self.lock:
+            if version is None:
+                self.version += 1
+            elif version != self.version:
+                return
+            self.cache = cache
+
+
+@dataclass(frozen=True)
+class PskRecord:
+    psk: str
+    # None once the signature was removed, the PSK isn't served then
+    signature: Optional[str]
+    block_number: Optional[int] = None
+    # Stats of the PSK and signature files written from the record, None until they're written.
+    # Files with other stats were changed outside the runner and win over the record
+    file_stats: Optional[list] = None
+
+
+class PskRecordStore:
+    """
+    Stores the PSK, its signature and block number as a single record, replaced atomically and read with one read,
+    so the PSK is never seen next to the signature of another one.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+    def write(self, record: PskRecord):
+        write_atomically(self.file_path, json.dumps(asdict(record)).encode())
+
+    def read(self) -> Optional[PskRecord]:
+        try:
+            fd = os.open(self.file_path, os.O_RDONLY)
+        except FileNotFoundError:
+            return None
+        try:
+            data = os.read(fd, MAX_RECORD_SIZE)
+        finally:
+            os.close(fd)
+        try:
+            return PskRecord(**json.loads(data))
+        except (ValueError, TypeError):
+            log.warning(f"Couldn't parse the pre-shared key record {self.file_path}")
+            return None
+
+    def exists(self) -> bool:
+        return os.path.exists(self.file_path)
+
+    def remove(self):
+        if self.exists():
+            os.remove(self.file_path)
+
+
+class PskState:
+    """
+    Keeps the current PSK and its signature in memory.
+    Files are checked for changes made outside the process at most once per `check_interval` seconds,
+    or only after a file watcher reported a change, and reloaded only when their inode, modification time
+    or size changed.
+    With a record store the pair is served from the record: it's written first, as the commit point,
+    and the separate PSK file for the node and the signature file are derived from it.
+    The separate files are read when there's no record, e.g. before the first rotation, or when they were changed
+    outside the runner since the record was written, then the record is written again from them.
+    """
+
+    def __init__(self, psk_file_manager: FileManager, psk_sig_file_manager: FileManager, check_interval,
+                 record_store: PskRecordStore = None):
+        self.psk_file_manager = psk_file_manager
+        self.psk_sig_file_manager = psk_sig_file_manager
+        self.check_interval = check_interval
+        self.record_store = record_store
+        self.lock = Lock()
+        # (psk, signature, file stats, check time), replaced as a whole
+        self.state = (None, None, None, None)
+        self.watched = False
+        self.changed = True
+
+    def watch(self, file_watcher):
+        file_paths = [self.psk_file_manager.file_path, self.psk_sig_file_manager.file_path]
+        if self.record_store is not None:
+            file_paths.append(self.record_store.file_path)
+        try:
+            for file_path in file_paths:
+                file_watcher.subscribe(file_path, self.__changed)
+        except OSError as e:
+            log.warning(f"Couldn't watch pre-shared key files, they're checked every {self.check_interval}s: {e}")
+            return
+        self.watched = True
+
+    def get(self) -> Optional[tuple[str, str]]:
+        psk, signature, _, checked_at = self.state
+        if self.watched:
+            stale = checked_at is None or self.changed
+        else:
+            stale = checked_at is None or time.monotonic() - checked_at >= self.check_interval
+        if stale:
+            with self.lock:
+                psk, signature = self.__revalidate()
+        if psk is None or signature is None:
+            return None
+        return psk, signature
+
+    def get_record(self) -> Optional[PskRecord]:
+        """
+        Returns the current record with the block number of the PSK, None without a record.
+        """
+        if self.record_store is None:
+            return None
+        return self.record_store.read()
+
+    def update(self, psk: str, signature: str, block_number: int = None):
+        with self.lock:
+            if self.record_store is None:
+                self.psk_file_manager.create(psk)
+                self.psk_sig_file_manager.create(signature)
+                self.state = (psk, signature, self.__file_stats(), time.monotonic())
+                return
+            previous = self.__current_record()
+            record = PskRecord(psk, signature, block_number)
+            self.record_store.write(record)
+            try:
+                self.psk_file_manager.create(psk)
+                self.psk_sig_file_manager.create(signature)
+            except OSError:
+                log.error("Couldn't write the pre-shared key files, the previous pre-shared key is kept")
+                self.__roll_back(previous)
+                raise
+            self.__confirm_files(record)
+            self.state = (psk, signature, self.__file_stats(), time.monotonic())
+
+    def remove_signature(self, signature: str = None) -> Optional[str]:
+        """
+        Removes the signature, with `signature` only when it's still the current one,
+        so a signature written in the meantime is kept. Returns the removed signature.
+        """
+        with self.lock:
+            record = self.record_store.read() if self.record_store is not None else None
+            try:
+                current_signature = record.signature if record is not None else self.psk_sig_file_manager.read()
+            except FileNotFoundError:
+                return None
+            if current_signature is None or (signature is not None and current_signature != signature):
+                return None
+            if record is not None:
+                record = PskRecord(record.psk, None, record.block_number)
+                self.record_store.write(record)
+            if self.psk_sig_file_manager.exists():
+                self.psk_sig_file_manager.remove()
+            if record is not None:
+                self.__confirm_files(record)
+            self.state = (None, None, None, None)
+            return current_signature
+
+    def clear(self):
+        """
+        Removes the PSK and its signature, so nothing is served until the next update.
+        """
+        with self.lock:
+            if self.record_store is not None:
+                self.record_store.remove()
+            for file_manager in (self.psk_file_manager, self.psk_sig_file_manager):
+                if file_manager.exists():
+                    file_manager.remove()
+            self.state = (None, None, None, None)
+
+    def sync_files(self):
+        """
+        Writes the separate PSK and signature files again from the record, when the runner stopped
+        after the record was written but before the files were.
+        Files changed outside the runner since the record was written are kept and the record is written from them.
+        """
+        with self.lock:
+            record = self.record_store.read() if self.record_store is not None else None
+            if record is None:
+                return
+            psk_stat, sig_stat, _ = self.__file_stats()
+            if record.file_stats is not None and record.file_stats != _stat_lists(psk_stat, sig_stat):
+                log.info("Pre-shared key files were changed outside the runner, keeping them")
+                self.__adopt_files(psk_stat, sig_stat)
+                self.state = (None, None, None, None)
+                return
+            if _read_or_none(self.psk_file_manager) != record.psk:
+                log.info("Writing the pre-shared key file from the pre-shared key record")
+                self.psk_file_manager.create(record.psk)
+            if record.signature is None and self.psk_sig_file_manager.exists():
+                self.psk_sig_file_manager.remove()
+            elif record.signature is not None and _read_or_none(self.psk_sig_file_manager) != record.signature:
+                self.psk_sig_file_manager.create(record.signature)
+            self.__confirm_files(record)
+            self.state = (None, None, None, None)
+
+    def invalidate(self):
+        with self.lock:
+            self.state = (None, None, None, None)
+
+    def __changed(self, _file_path, _event):
+        self.changed = True
+
+    def __revalidate(self):
+        # Changes reported while the files are read make the next get check them again
+        self.changed = False
+        psk, signature, stats, _ = self.state
+        file_stats = self.__file_stats()
+        while file_stats != stats:
+            stats = file_stats
+            psk, signature = self.__read(stats)
+            # Files could be changed while reading, then read them once more
+            file_stats = self.__file_stats()
+        self.state = (psk, signature, stats, time.monotonic())
+        return psk, signature
+
+    def __read(self, stats):
+        psk_stat, sig_stat, record_stat = stats
+        if record_stat is not None:
+            record = self.record_store.read()
+            if record is None:
+                return None, None
+            if record.file_stats is None or record.file_stats == _stat_lists(psk_stat, sig_stat):
+                return record.psk, record.signature
+            log.info("Pre-shared key files were changed outside the runner, reloading them")
+            return self.__adopt_files(psk_stat, sig_stat)
+        if psk_stat is None or sig_stat is None:
+            return None, None
+        try:
+            return self.psk_file_manager.read(), self.psk_sig_file_manager.read()
+        except FileNotFoundError:
+            return None, None
+
+    def __adopt_files(self, psk_stat, sig_stat):
+        """
+        Writes the record from the separate files, which were read with the given stats.
+        Without the PSK file the record is removed.
+        """
+        # Read past the caches of the file managers, their change events may not have arrived yet
+        psk = _read_path_or_none(self.psk_file_manager.file_path)
+        signature = _read_path_or_none(self.psk_sig_file_manager.file_path)
+        if psk is None:
+            self.record_store.remove()
+            return None, None
+        self.record_store.write(PskRecord(psk, signature, file_stats=_stat_lists(psk_stat, sig_stat)))
+        return psk, signature
+
+    def __current_record(self) -> Optional[PskRecord]:
+        record = self.record_store.read()
+        if record is not None or not self.psk_file_manager.exists():
+            return record
+        return PskRecord(_read_or_none(self.psk_file_manager), _read_or_none(self.psk_sig_file_manager))
+
+    def __roll_back(self, previous: Optional[PskRecord]):
+        """
+        Commits the previous pair again, its files are written from it by `sync_files`.
+        """
+        if previous is None:
+            self.record_store.remove()
+            for file_manager in (self.psk_file_manager, self.psk_sig_file_manager):
+                if file_manager.exists():
+                    file_manager.remove()
+        else:
+            self.record_store.write(replace(previous, file_stats=None))
+        self.state = (None, None, None, None)
+
+    def __confirm_files(self, record: PskRecord):
+        psk_stat, sig_stat, _ = self.__file_stats()
+        self.record_store.write(replace(record, file_stats=_stat_lists(psk_stat, sig_stat)))
+
+    def __file_stats(self):
+        return (_file_stat(self.psk_file_manager.file_path), _file_stat(self.psk_sig_file_manager.file_path),
+                _file_stat(self.record_store.file_path) if self.record_store is not None else None)
+
+
+@dataclass(frozen=True)
+class PskEpoch:
+    psk: str
+    signature: str
+    block_number: Optional[int]
+    # Peer id of the psk creator which signature was verified, or "peers" when the peers agreed on the psk
+    source: str
+    recorded_at: float
+
+
+class PskJournal:
+    """
+    Keeps the recently verified PSKs in an append-only file, so a restart can reuse the last one
+    and a peer lagging behind can still get the PSK of the block it asks for.
+    Every record is a line with a CRC32 of its JSON and is synced to disk before `record` returns,
+    a record torn by a crash fails the checksum and is skipped.
+    Once the file holds twice `max_entries` records it's rewritten with the last `max_entries` through an atomic rename.
+    PSKs recorded more than `max_age` seconds ago are dropped too, except the last one.
+    """
+
+    def __init__(self, file_path, max_entries, max_age=0):
+        self.file_path = file_path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.lock = Lock()
+        self.epochs = None
+        # Block number to the last epoch recorded for it
+        self.blocks = {}
+        self.record_count = 0
+
+    def record(self, psk: str, signature: str, block_number: Optional[int], source: str) -> PskEpoch:
+        epoch = PskEpoch(psk, signature, block_number, source, time.time())
+        with self.lock:
+            self.__load()
+            with open(self.file_path, "a") as file:
+                file.write(_journal_line(epoch))
+                file.flush()
+                os.fsync(file.fileno())
+            self.__retain(self.epochs + [epoch])
+            self.record_count += 1
+            if self.record_count >= 2 * self.max_entries:
+                self.__compact()
+        return epoch
+
+    def last(self) -> Optional[PskEpoch]:
+        with self.lock:
+            self.__load()
+            return self.epochs[-1] if self.epochs else None
+
+    def get(self, block_number: int) -> Optional[PskEpoch]:
+        with self.lock:
+            self.__load()
+            epoch = self.blocks.get(block_number)
+            if epoch is not None and self.__expired(epoch) and epoch is not self.epochs[-1]:
+                return None
+            return epoch
+
+    def __load(self):
+        if self.epochs is not None:
+            return
+        epochs = []
+        if os.path.exists(self.file_path):
+            with open(self.file_path, "r") as file:
+                for line in file:
+                    epoch = _parse_journal_line(line)
+                    if epoch is not None:
+                        epochs.append(epoch)
+        self.record_count = len(epochs)
+        self.__retain(epochs)
+
+    def __retain(self, epochs):
+        epochs = epochs[-self.max_entries:]
+        self.epochs = [epoch for epoch in epochs[:-1] if not self.__expired(epoch)] + epochs[-1:]
+        self.blocks = {epoch.block_number: epoch for epoch in self.epochs if epoch.block_number is not None}
+
+    def __expired(self, epoch: PskEpoch) -> bool:
+        return self.max_age > 0 and time.time() - epoch.recorded_at > self.max_age
+
+    def __compact(self):
+        write_atomically(self.file_path, "".join(_journal_line(epoch) for epoch in self.epochs).encode())
+        self.record_count = len(self.epochs)
+
+
+def _journal_line(epoch: PskEpoch) -> str:
+    data = json.dumps(asdict(epoch), separators=(",", ":"))
+    return f"{zlib.crc32(data.encode()):08x} {data}\n"
+
+
+def _parse_journal_line(line: str) -> Optional[PskEpoch]:
+    checksum, _, data = line.rstrip("\n").partition(" ")
+    try:
+        if int(checksum, 16) != zlib.crc32(data.encode()):
+            return None
+        return PskEpoch(**json.loads(data))
+    except (ValueError, TypeError):
+        return None
+
+
+def _read_or_none(file_manager: FileManager) -> Optional[str]:
+    try:
+        return file_manager.read()
+    except FileNotFoundError:
+        return None
+
+
+def _read_path_or_none(file_path) -> Optional[str]:
+    try:
+        with open(file_path, 'r') as file:
+            return file.read()
+    except FileNotFoundError:
+        return None
+
+
+def watch_files(file_watcher):
+    for file_manager in (psk_file_manager, psk_sig_file_manager, node_key_file_manager):
+        file_manager.watch(file_watcher)
+    psk_state.watch(file_watcher)
+
+
+def _stat_lists(*stats) -> list:
+    """
+    File stats in the form they have in a record read back from JSON.
+    """
+    return [list(stat) if stat is not None else None for stat in stats]
+
+
+def _file_stat(file_path):
+    try:
+        stat = os.stat(file_path)
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+    except FileNotFoundError:
+        return None
+
 
-global psk_file_manager, node_key_file_manager, psk_sig_file_manager
+global psk_file_manager, node_key_file_manager, psk_sig_file_manager, psk_state, psk_journal
 
 
 def initialise_file_managers():
-    global psk_file_manager, node_key_file_manager, psk_sig_file_manager
+    global psk_file_manager, node_key_file_manager, psk_sig_file_manager, psk_state, psk_journal
     psk_file_manager = FileManager(common.config.config_service.config.psk_file_path)
     node_key_file_manager = FileManager(common.config.config_service.config.node_key_file_path)
     psk_sig_file_manager = FileManager(common.config.config_service.config.psk_sig_file_path)
+    psk_record_store = PskRecordStore(common.config.config_service.config.psk_record_path
+                                      or f"{common.config.config_service.config.psk_file_path}.record")
+    psk_state = PskState(psk_file_manager, psk_sig_file_manager,
+                         common.config.config_service.config.psk_state_check_interval, psk_record_store)
+    psk_journal = PskJournal(common.config.config_service.config.psk_journal_path
+                             or f"{common.config.config_service.config.psk_file_path}.journal",
+                             common.config.config_service.config.psk_journal_size,
+                             common.config.config_service.config.psk_journal_max_age)
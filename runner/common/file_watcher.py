@@ -0,0 +1,237 @@
+import ctypes
+import ctypes.util
+import os
+import selectors
+import struct
+from threading import Event, Lock, Thread
+from typing import Callable, Optional
+
+import common.config
+from common.logger import log
+
+CREATED = "created"
+MODIFIED = "modified"
+DELETED = "deleted"
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+# Files are replaced by renaming temporary files over them, so their directories are watched instead of the files
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR
+# struct inotify_event without the name which follows it
+EVENT_HEADER = struct.Struct("iIII")
+READ_SIZE = 64 * 1024
+
+
+class FileWatcher:
+    """
+    Calls the subscribers of a file when it's created, modified or deleted.
+    Callbacks run on the watcher thread with the file path and the event, they should return quickly.
+    """
+
+    def __init__(self):
+        self.subscribers = {}
+        self.lock = Lock()
+        self.thread = None
+
+    def subscribe(self, file_path, callback: Callable[[str, str], None]):
+        """
+        Raises OSError when the file can't be watched.
+        """
+        file_path = os.path.abspath(file_path)
+        with self.lock:
+            watched = file_path in self.subscribers
+        if not watched:
+            self._watch(file_path)
+        with self.lock:
+            self.subscribers.setdefault(file_path, []).append(callback)
+
+    def unsubscribe(self, file_path, callback):
+        file_path = os.path.abspath(file_path)
+        with self.lock:
+            callbacks = self.subscribers.get(file_path, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def start(self):
+        self.thread = Thread(target=self._run, name="file-watcher", daemon=True)
+        self.thread.start()
+
+    def _watch(self, file_path):
+        pass
+
+    def _run(self):
+        pass
+
+    def _notify(self, file_path, event):
+        with self.lock:
+            callbacks = list(self.subscribers.get(file_path, ()))
+        for callback in callbacks:
+            try:
+                callback(file_path, event)
+            except Exception as e:
+                log.error(f"Handling {event} event of {file_path} failed: {e}")
+
+
+class InotifyFileWatcher(FileWatcher):
+    """
+    Watches files through Linux inotify, called with ctypes so no extra dependency is needed.
+    """
+
+    def __init__(self):
+        super().__init__()
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.inotify_add_watch = libc.inotify_add_watch
+        self.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, f"inotify_init1 failed: {os.strerror(error)}")
+        # Watch descriptor to the watched directory
+        self.directories = {}
+        self.stop_reader, self.stop_writer = os.pipe()
+
+    def stop(self):
+        os.write(self.stop_writer, b"\0")
+        if self.thread is not None:
+            self.thread.join()
+        for fd in (self.fd, self.stop_reader, self.stop_writer):
+            os.close(fd)
+
+    def _watch(self, file_path):
+        directory = os.path.dirname(file_path)
+        watch_descriptor = self.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if watch_descriptor < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, f"Couldn't watch {directory}: {os.strerror(error)}")
+        with self.lock:
+            self.directories[watch_descriptor] = directory
+
+    def _run(self):
+        selector = selectors.DefaultSelector()
+        selector.register(self.fd, selectors.EVENT_READ)
+        selector.register(self.stop_reader, selectors.EVENT_READ)
+        while True:
+            for key, _mask in selector.select():
+                if key.fd == self.stop_reader:
+                    selector.close()
+                    return
+                self.__read_events()
+
+    def __read_events(self):
+        try:
+            data = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            watch_descriptor, mask, _cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+            offset += EVENT_HEADER.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost, every file could have changed
+                with self.lock:
+                    file_paths = list(self.subscribers)
+                for file_path in file_paths:
+                    self._notify(file_path, MODIFIED)
+                continue
+            with self.lock:
+                directory = self.directories.get(watch_descriptor)
+                if mask & IN_IGNORED:
+                    self.directories.pop(watch_descriptor, None)
+            if directory is None or not name:
+                continue
+            event = self.__event(mask)
+            if event is not None:
+                self._notify(os.path.join(directory, os.fsdecode(name)), event)
+
+    @staticmethod
+    def __event(mask) -> Optional[str]:
+        if mask & (IN_CREATE | IN_MOVED_TO):
+            return CREATED
+        if mask & IN_CLOSE_WRITE:
+            return MODIFIED
+        if mask & (IN_DELETE | IN_MOVED_FROM):
+            return DELETED
+        return None
+
+
+class PollingFileWatcher(FileWatcher):
+    """
+    Watches files by comparing their inode, modification time and size every `interval` seconds,
+    used where inotify isn't available.
+    """
+
+    def __init__(self, interval):
+        super().__init__()
+        self.interval = interval
+        self.stats = {}
+        self.stop_event = Event()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def _watch(self, file_path):
+        with self.lock:
+            self.stats[file_path] = self.__stat(file_path)
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            with self.lock:
+                stats = list(self.stats.items())
+            for file_path, previous_stat in stats:
+                stat = self.__stat(file_path)
+                if stat == previous_stat:
+                    continue
+                with self.lock:
+                    self.stats[file_path] = stat
+                if previous_stat is None:
+                    self._notify(file_path, CREATED)
+                elif stat is None:
+                    self._notify(file_path, DELETED)
+                else:
+                    self._notify(file_path, MODIFIED)
+
+    @staticmethod
+    def __stat(file_path):
+        try:
+            stat = os.stat(file_path)
+            return stat.st_ino, stat.st_mtime_ns, stat.st_size
+        except FileNotFoundError:
+            return None
+
+
+def create_file_watcher(kind, poll_interval) -> Optional[FileWatcher]:
+    if kind == "none":
+        return None
+    if kind == "inotify":
+        try:
+            return InotifyFileWatcher()
+        except (OSError, AttributeError) as e:
+            log.warning(f"inotify isn't available, files are polled instead: {e}")
+    return PollingFileWatcher(poll_interval)
+
+
+file_watcher = None
+file_watcher_lock = Lock()
+
+
+def get_file_watcher() -> Optional[FileWatcher]:
+    global file_watcher
+    with file_watcher_lock:
+        if file_watcher is None:
+            config = common.config.config_service.config
+            file_watcher = create_file_watcher(config.file_watcher, config.file_watch_poll_interval)
+            if file_watcher is not None:
+                file_watcher.start()
+        return file_watcher
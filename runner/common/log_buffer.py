@@ -0,0 +1,57 @@
+from collections import deque
+from itertools import islice
+from threading import Condition, Lock
+
+import common.config
+
+
+class LogRingBuffer:
+    """
+    Keeps the most recent node log lines in memory.
+    Every line gets a sequence number, subscribers follow the log by remembering the next sequence number they want,
+    so all of them share the same line objects instead of each getting its own queue.
+    """
+
+    def __init__(self, capacity):
+        self.lines = deque(maxlen=capacity)
+        self.next_sequence = 0
+        self.condition = Condition()
+
+    def append(self, line: bytes):
+        with self.condition:
+            self.lines.append(line)
+            self.next_sequence += 1
+            self.condition.notify_all()
+
+    def tail(self, count) -> list:
+        with self.condition:
+            if count <= 0:
+                return []
+            return list(islice(self.lines, max(len(self.lines) - count, 0), None))
+
+    def end(self) -> int:
+        with self.condition:
+            return self.next_sequence
+
+    def read_from(self, sequence, timeout=None) -> tuple:
+        """
+        Waits until there are lines newer than `sequence` and returns them with the sequence number to read from next.
+        Lines which already left the buffer are skipped, an empty list is returned when the timeout passes.
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.next_sequence > sequence, timeout)
+            first_sequence = self.next_sequence - len(self.lines)
+            start = max(sequence, first_sequence) - first_sequence
+            return list(islice(self.lines, start, None)), self.next_sequence
+
+
+node_log_buffer = None
+node_log_buffer_lock = Lock()
+
+
+def get_node_log_buffer() -> LogRingBuffer:
+    global node_log_buffer
+    with node_log_buffer_lock:
+        if node_log_buffer is None:
+            node_log_buffer = LogRingBuffer(common.config.config_service.config.node_log_buffer_lines)
+        return node_log_buffer
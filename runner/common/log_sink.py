@@ -0,0 +1,152 @@
+import gzip
+import os
+import queue
+import shutil
+import sys
+import time
+from datetime import datetime
+from threading import Lock, Thread
+
+import common.config
+from common.logger import log
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAX_BATCH_LINES = 1024
+
+
+class NodeLogSink:
+    """
+    Writes the node output to a file in batches from a background thread.
+    The file is rotated when it exceeds `max_bytes` or gets older than `max_age` seconds,
+    and rotated files can be compressed with gzip or zstd.
+    Lines are queued without ever blocking the writer, when the queue is full they're dropped and counted.
+    """
+
+    def __init__(self, file_path, max_bytes=0, max_age=0, backup_count=5, compression=None, flush_interval=1.0,
+                 queue_size=10000, mirror_to_console=True):
+        self.file_path = file_path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.backup_count = backup_count
+        self.compression = compression
+        self.flush_interval = flush_interval
+        self.mirror_to_console = mirror_to_console
+        self.lines = queue.Queue(maxsize=queue_size)
+        self.dropped_lines = 0
+        self.file = None
+        self.opened_at = None
+        self.thread = None
+        self.closed = False
+        self.compress_lock = Lock()
+
+    @staticmethod
+    def from_config() -> "NodeLogSink":
+        config = common.config.config_service.config
+        return NodeLogSink(config.node_logs_path,
+                           max_bytes=config.node_log_max_bytes,
+                           max_age=config.node_log_max_age,
+                           backup_count=config.node_log_backup_count,
+                           compression=config.node_log_compression,
+                           flush_interval=config.node_log_flush_interval,
+                           queue_size=config.node_log_queue_size,
+                           mirror_to_console=config.node_log_console)
+
+    def start(self):
+        self.thread = Thread(target=self.__write_lines, name="node-log-sink", daemon=True)
+        self.thread.start()
+
+    def write(self, line: bytes):
+        try:
+            self.lines.put_nowait(line)
+        except queue.Full:
+            self.dropped_lines += 1
+
+    def close(self):
+        self.closed = True
+        if self.thread is not None:
+            self.thread.join()
+
+    def __write_lines(self):
+        last_flush = time.monotonic()
+        while not (self.closed and self.lines.empty()):
+            batch = self.__next_batch()
+            if self.dropped_lines:
+                dropped_lines, self.dropped_lines = self.dropped_lines, 0
+                batch.insert(0, f"... {dropped_lines} node log lines dropped ...\n".encode())
+            if batch:
+                self.__write_batch(b"".join(batch))
+            if self.file is not None and time.monotonic() - last_flush >= self.flush_interval:
+                self.file.flush()
+                last_flush = time.monotonic()
+        if self.file is not None:
+            self.file.close()
+
+    def __next_batch(self) -> list:
+        try:
+            batch = [self.lines.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        while len(batch) < MAX_BATCH_LINES:
+            try:
+                batch.append(self.lines.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def __write_batch(self, data: bytes):
+        if self.mirror_to_console:
+            sys.stdout.buffer.write(data)
+            sys.stdout.flush()
+
+        if self.file is None:
+            self.__open()
+        self.file.write(data)
+
+        if self.__should_rotate():
+            self.__rotate()
+
+    def __open(self):
+        self.file = open(self.file_path, "ab")
+        self.opened_at = time.monotonic()
+
+    def __should_rotate(self) -> bool:
+        if self.max_bytes and self.file.tell() >= self.max_bytes:
+            return True
+        return bool(self.max_age) and time.monotonic() - self.opened_at >= self.max_age
+
+    def __rotate(self):
+        self.file.close()
+        self.file = None
+        rotated_path = f"{self.file_path}.{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}"
+        os.rename(self.file_path, rotated_path)
+        Thread(target=self.__compress_and_prune, args=(rotated_path,), daemon=True).start()
+
+    def __compress_and_prune(self, rotated_path):
+        with self.compress_lock:
+            self.__compress(rotated_path)
+            self.__prune()
+
+    def __compress(self, rotated_path):
+        try:
+            if self.compression == "gzip":
+                with open(rotated_path, "rb") as source, gzip.open(f"{rotated_path}.gz", "wb") as target:
+                    shutil.copyfileobj(source, target)
+                os.remove(rotated_path)
+            elif self.compression == "zstd" and zstandard is not None:
+                with open(rotated_path, "rb") as source, open(f"{rotated_path}.zst", "wb") as target:
+                    zstandard.ZstdCompressor().copy_stream(source, target)
+                os.remove(rotated_path)
+            elif self.compression == "zstd":
+                log.warning("zstandard is not installed, rotated node logs are not compressed")
+        except OSError as e:
+            log.error(f"Couldn't compress rotated node logs {rotated_path}: {e}")
+
+    def __prune(self):
+        log_dir, log_name = os.path.split(self.file_path)
+        rotated = sorted(name for name in os.listdir(log_dir or ".") if name.startswith(f"{log_name}."))
+        for name in rotated[:max(len(rotated) - self.backup_count, 0)]:
+            os.remove(os.path.join(log_dir, name))
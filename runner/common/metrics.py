@@ -0,0 +1,232 @@
+import math
+import threading
+from bisect import bisect_left
+from threading import Lock
+
+# Default latency buckets in seconds, from local calls up to the KME and peer timeouts
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Shards registered before the ones of exited threads are folded in for the first time
+MIN_SHARDS_BEFORE_RETIRE = 64
+
+registry = []
+
+
+class _ShardedValues:
+    """
+    Fixed-size list of numbers kept per thread, so recording doesn't take a lock or allocate.
+    A shard is allocated on the first record of a thread, shards of exited threads are folded into `retired`
+    when the values are collected, and when registering a shard would grow the list past twice the shards
+    left after the last fold, so short-lived threads don't pile up shards while nobody collects.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.local = threading.local()
+        self.shards = []
+        self.retired = [0] * size
+        self.lock = Lock()
+        self.retire_at = MIN_SHARDS_BEFORE_RETIRE
+
+    def shard(self) -> list:
+        try:
+            return self.local.values
+        except AttributeError:
+            values = [0] * self.size
+            with self.lock:
+                if len(self.shards) >= self.retire_at:
+                    self.__retire_exited()
+                self.shards.append((threading.current_thread(), values))
+            self.local.values = values
+            return values
+
+    def collect(self) -> list:
+        with self.lock:
+            self.__retire_exited()
+            totals = list(self.retired)
+            for _thread, values in self.shards:
+                for index, value in enumerate(values):
+                    totals[index] += value
+        return totals
+
+    def __retire_exited(self):
+        alive = []
+        for thread, values in self.shards:
+            if thread.is_alive():
+                alive.append((thread, values))
+            else:
+                self.retired = [retired + value for retired, value in zip(self.retired, values)]
+        self.shards = alive
+        self.retire_at = max(2 * len(alive), MIN_SHARDS_BEFORE_RETIRE)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.children = {}
+        self.lock = Lock()
+        registry.append(self)
+
+    def labels(self, *label_values):
+        """
+        Returns the metric for the label values, keep it to avoid the lookup on hot paths.
+        """
+        child = self.children.get(label_values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(label_values, self._create_child())
+        return child
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for label_values, child in sorted(self.children.items()):
+            lines.extend(self._render_child(label_values, child))
+        return lines
+
+    def _create_child(self):
+        raise NotImplementedError
+
+    def _render_child(self, label_values, child) -> list:
+        raise NotImplementedError
+
+
+class _CounterChild:
+
+    def __init__(self):
+        self.values = _ShardedValues(1)
+
+    def inc(self, amount=1):
+        self.values.shard()[0] += amount
+
+    def value(self):
+        return self.values.collect()[0]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _create_child(self):
+        return _CounterChild()
+
+    def _render_child(self, label_values, child):
+        return [f"{self.name}{_format_labels(self.label_names, label_values)} {_format_value(child.value())}"]
+
+
+class _GaugeChild:
+
+    def __init__(self):
+        self.current = 0
+
+    def set(self, value):
+        self.current = value
+
+    def value(self):
+        return self.current
+
+
+class Gauge(_Metric):
+    """
+    Holds the last value set, a single assignment needs no lock.
+    """
+    type = "gauge"
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def _create_child(self):
+        return _GaugeChild()
+
+    def _render_child(self, label_values, child):
+        return [f"{self.name}{_format_labels(self.label_names, label_values)} {_format_value(child.value())}"]
+
+
+class _HistogramChild:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # Count of each bucket and of +Inf, then the count and the sum of all the observations
+        self.values = _ShardedValues(len(buckets) + 3)
+
+    def observe(self, value):
+        values = self.values.shard()
+        values[bisect_left(self.buckets, value)] += 1
+        values[-2] += 1
+        values[-1] += value
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, label_names=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def _create_child(self):
+        return _HistogramChild(self.buckets)
+
+    def _render_child(self, label_values, child):
+        values = child.values.collect()
+        labels = _format_labels(self.label_names, label_values)
+        lines = []
+        cumulative = 0
+        for bound, count in zip((*self.buckets, math.inf), values):
+            cumulative += count
+            bucket_labels = _format_labels((*self.label_names, "le"), (*label_values, _format_value(bound)))
+            lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+        lines.append(f"{self.name}_count{labels} {values[-2]}")
+        lines.append(f"{self.name}_sum{labels} {_format_value(values[-1])}")
+        return lines
+
+
+def render() -> str:
+    """
+    Returns all the metrics in the Prometheus text format.
+    """
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def _format_labels(label_names, label_values) -> str:
+    if not label_names:
+        return ""
+    labels = ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(label_names, label_values))
+    return f"{{{labels}}}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return repr(value)
+    return str(value)
+
+
+kme_request_seconds = Histogram("qmc_kme_request_seconds", "Time to get a QKD key from the KME or the key pool",
+                                ("operation", "provider", "peer"))
+qrng_request_seconds = Histogram("qmc_qrng_request_seconds", "Time of the QRNG Api calls")
+psk_fetch_seconds = Histogram("qmc_psk_fetch_seconds", "Time to fetch and decrypt the PSK from a peer", ("peer",))
+psk_verify_seconds = Histogram("qmc_psk_verify_seconds", "Time to verify a PSK signature")
+psk_rotation_seconds = Histogram("qmc_psk_rotation_seconds", "Time of a PSK rotation from its start to its end",
+                                 ("state",))
+fallback_entropy_total = Counter("qmc_fallback_entropy_total",
+                                 "Number of times the PSK was generated without QRNG entropy")
+psk_validation_failures_total = Counter("qmc_psk_validation_failures_total",
+                                        "Number of PSKs from the peers which failed the validation")
+node_restarts_total = Counter("qmc_node_restarts_total", "Number of node restarts", ("reason",))
+node_peers = Gauge("qmc_node_peers", "Number of peers of the node at the last health check")
@@ -0,0 +1,174 @@
+import os
+import sys
+import time
+from collections import Counter
+from contextlib import nullcontext
+from functools import wraps
+from threading import Event, Lock, Thread, get_ident
+
+import common.config
+from common.logger import log
+
+# Distinct stacks kept, the samples of any other stack are counted under TRUNCATED_STACK
+MAX_STACKS = 10000
+MAX_STACK_DEPTH = 64
+TRUNCATED_STACK = "[truncated]"
+
+_not_profiled = nullcontext()
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of the threads running a profiled section every `interval` seconds from its own thread.
+    Entering a section only records the thread, so a request pays one dict update while profiling is on
+    and a flag check while it's off. The time spent sampling is measured and reported as the overhead.
+    Stacks are kept collapsed, one line per distinct stack, as flame graph tools read them.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.enabled = False
+        # Thread id to the label of the section it runs
+        self.active = {}
+        self.stacks = Counter()
+        self.samples = 0
+        self.sampling_time = 0.0
+        self.enabled_at = None
+        self.lock = Lock()
+        self.stop_event = Event()
+        self.thread = None
+
+    def start(self, interval=None):
+        with self.lock:
+            if interval is not None:
+                self.interval = interval
+            if self.enabled:
+                return
+            self.enabled = True
+            self.enabled_at = time.monotonic()
+            self.stop_event = Event()
+            self.thread = Thread(target=self.__run, args=(self.stop_event,), name="profiler", daemon=True)
+            self.thread.start()
+        log.info(f"Profiling started, sampling every {self.interval}s")
+
+    def stop(self):
+        with self.lock:
+            if not self.enabled:
+                return
+            self.enabled = False
+            self.stop_event.set()
+            thread = self.thread
+        thread.join()
+        self.active.clear()
+        log.info("Profiling stopped")
+
+    def profiled(self, label):
+        """
+        Returns the context in which the thread is sampled under the label.
+        """
+        if not self.enabled:
+            return _not_profiled
+        return _ProfiledSection(self, label)
+
+    def snapshot(self) -> Counter:
+        with self.lock:
+            return Counter(self.stacks)
+
+    def collapsed(self, since: Counter = None) -> str:
+        """
+        Returns the stacks sampled after the `since` snapshot, or all of them, in the collapsed format.
+        """
+        stacks = self.snapshot()
+        if since is not None:
+            stacks.subtract(since)
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common() if count > 0)
+
+    def stats(self) -> dict:
+        with self.lock:
+            elapsed = time.monotonic() - self.enabled_at if self.enabled_at is not None else 0
+            return {
+                "enabled": self.enabled,
+                "interval": self.interval,
+                "samples": self.samples,
+                "stacks": len(self.stacks),
+                "sampling_time": self.sampling_time,
+                "overhead": self.sampling_time / elapsed if self.enabled and elapsed > 0 else 0.0,
+            }
+
+    def __run(self, stop_event):
+        while not stop_event.wait(self.interval):
+            started_at = time.perf_counter()
+            frames = sys._current_frames()
+            active = list(self.active.items())
+            stacks = [f"{label};{_collapse(frames[thread_id])}" for thread_id, label in active if thread_id in frames]
+            with self.lock:
+                for stack in stacks:
+                    if stack not in self.stacks and len(self.stacks) >= MAX_STACKS:
+                        stack = TRUNCATED_STACK
+                    self.stacks[stack] += 1
+                self.samples += 1
+                self.sampling_time += time.perf_counter() - started_at
+
+
+class _ProfiledSection:
+
+    def __init__(self, profiler, label):
+        self.profiler = profiler
+        self.label = label
+        self.outer_label = None
+
+    def __enter__(self):
+        thread_id = get_ident()
+        self.outer_label = self.profiler.active.get(thread_id)
+        self.profiler.active[thread_id] = self.label
+
+    def __exit__(self, *_exc_info):
+        if self.outer_label is None:
+            self.profiler.active.pop(get_ident(), None)
+        else:
+            self.profiler.active[get_ident()] = self.outer_label
+
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+profiler = None
+profiler_lock = Lock()
+
+
+def get_profiler() -> SamplingProfiler:
+    global profiler
+    with profiler_lock:
+        if profiler is None:
+            config = common.config.config_service.config
+            profiler = SamplingProfiler(config.profiler_interval)
+            if config.profiler_enabled:
+                profiler.start()
+        return profiler
+
+
+def profiled(label):
+    """
+    Returns the context in which the thread is sampled under the label, nothing is done until profiling is started.
+    """
+    current = profiler
+    if current is None:
+        return _not_profiled
+    return current.profiled(label)
+
+
+def wrap(function, label):
+    @wraps(function)
+    def profiled_function(*args, **kwargs):
+        current = profiler
+        if current is None or not current.enabled:
+            return function(*args, **kwargs)
+        with _ProfiledSection(current, label):
+            return function(*args, **kwargs)
+    return profiled_function
@@ -0,0 +1,159 @@
+import time
+from dataclasses import dataclass, asdict
+from threading import Lock
+
+import requests
+
+import common.config
+from common import metrics
+from common.exceptions import NodeRpcError
+from common.logger import log
+from core.node_subscription import HeadSubscriptionMonitor, create_head_subscription_monitor
+
+HEALTH_METHODS = ["system_peers", "system_health", "chain_getHeader", "system_syncState"]
+
+
+class NodeRpcClient:
+    """
+    Calls the JSON-RPC Api of the node over a kept-alive connection, every call is limited by a timeout.
+    """
+
+    def __init__(self, url, timeout):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def call(self, method, params=None):
+        return self.batch([(method, params)])[method]
+
+    def batch(self, calls) -> dict:
+        """
+        Sends all `(method, params)` calls in a single JSON-RPC batch and returns the results by method name.
+        """
+        data = [{"id": i, "jsonrpc": "2.0", "method": method, "params": params or []}
+                for i, (method, params) in enumerate(calls)]
+        try:
+            response = self.session.post(self.url, json=data, timeout=self.timeout)
+            response.raise_for_status()
+            responses = {item["id"]: item for item in response.json()}
+        except (requests.exceptions.RequestException, ValueError, TypeError, KeyError) as e:
+            raise NodeRpcError(f"Node RPC batch call failed: {e}") from e
+
+        results = {}
+        for i, (method, _params) in enumerate(calls):
+            item = responses.get(i)
+            if item is None or "error" in item:
+                raise NodeRpcError(f"Node RPC method {method} failed: {item and item['error']}")
+            results[method] = item["result"]
+        return results
+
+
+@dataclass(frozen=True)
+class NodeHealth:
+    reachable: bool
+    checked_at: float
+    peers: int = 0
+    is_syncing: bool = False
+    should_have_peers: bool = True
+    best_block: int = None
+    current_block: int = None
+    highest_block: int = None
+    blocks_stalled: bool = False
+    finality_stalled: bool = False
+
+    @property
+    def stalled(self) -> bool:
+        return self.blocks_stalled or self.finality_stalled
+
+    @property
+    def degraded(self) -> bool:
+        return (not self.reachable or self.is_syncing or (self.should_have_peers and self.peers == 0)
+                or self.stalled)
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), "degraded": self.degraded}
+
+
+class NodeHealthMonitor:
+    """
+    Collects the health of the node with one batched RPC call per check.
+    Checks where the node is unreachable or its heads are stalled count as consecutive failures.
+    The check interval drops to `min_interval` when the node looks degraded and doubles up to `max_interval`
+    while it stays healthy. A head subscription can wake it up before the interval passes.
+    """
+
+    def __init__(self, client, min_interval, max_interval, head_subscription: HeadSubscriptionMonitor = None):
+        self.client = client
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.head_subscription = head_subscription
+        self.interval = max_interval
+        self.consecutive_failures = 0
+        self.health = None
+        self.lock = Lock()
+        self.on_wake = None
+
+    def wake(self):
+        """
+        Asks for a check before the interval passes.
+        """
+        if self.on_wake is not None:
+            self.on_wake()
+
+    def check(self) -> NodeHealth:
+        subscription = self.head_subscription.status() if self.head_subscription is not None else {}
+        try:
+            results = self.client.batch([(method, None) for method in HEALTH_METHODS])
+            system_health = results["system_health"]
+            sync_state = results["system_syncState"]
+            health = NodeHealth(
+                reachable=True,
+                checked_at=time.time(),
+                peers=len(results["system_peers"]),
+                is_syncing=system_health["isSyncing"],
+                should_have_peers=system_health["shouldHavePeers"],
+                best_block=int(results["chain_getHeader"]["number"], 16),
+                current_block=sync_state["currentBlock"],
+                highest_block=sync_state["highestBlock"],
+                blocks_stalled=subscription.get("blocks_stalled", False),
+                finality_stalled=subscription.get("finality_stalled", False),
+            )
+        except (NodeRpcError, KeyError, TypeError, ValueError) as e:
+            log.warning(f"Node health check failed: {e}")
+            health = NodeHealth(reachable=False, checked_at=time.time())
+
+        if health.reachable:
+            metrics.node_peers.set(health.peers)
+        with self.lock:
+            self.health = health
+            failed = not health.reachable or health.stalled
+            self.consecutive_failures = self.consecutive_failures + 1 if failed else 0
+            self.interval = self.min_interval if health.degraded else min(self.interval * 2, self.max_interval)
+        return health
+
+    def reset(self):
+        with self.lock:
+            self.interval = self.max_interval
+            self.consecutive_failures = 0
+
+    def latest(self) -> NodeHealth:
+        with self.lock:
+            return self.health
+
+
+health_monitor = None
+health_monitor_lock = Lock()
+
+
+def get_health_monitor() -> NodeHealthMonitor:
+    global health_monitor
+    with health_monitor_lock:
+        if health_monitor is None:
+            config = common.config.config_service.config
+            client = NodeRpcClient(f"http://localhost:{config.node_http_rpc_port}", config.node_rpc_timeout)
+            health_monitor = NodeHealthMonitor(client, config.node_health_min_interval,
+                                               config.recovery_check_interval)
+            if config.node_ws_rpc_port:
+                health_monitor.head_subscription = create_head_subscription_monitor(health_monitor.wake)
+                health_monitor.head_subscription.start()
+        return health_monitor
@@ -0,0 +1,158 @@
+import json
+import time
+from threading import Event, Lock, Thread
+
+from websockets.exceptions import ConnectionClosed, WebSocketException
+from websockets.sync.client import connect
+
+import common.config
+from common.logger import log
+
+SUBSCRIPTIONS = {
+    "chain_subscribeNewHeads": "chain_newHead",
+    "chain_subscribeFinalizedHeads": "chain_finalizedHead",
+}
+
+
+class HeadSubscriptionMonitor:
+    """
+    Follows new and finalized heads of the node over its WebSocket RPC.
+    When no new block is imported for `block_stall_timeout` seconds, or none is finalized for
+    `finality_stall_timeout` seconds, `on_stall` is called right away instead of waiting for the next poll.
+    The connection is retried with exponential backoff, while it's down `connected` is False and the runner
+    relies on HTTP polling only.
+    Callbacks in `head_listeners` get the number of every new best block.
+    """
+
+    def __init__(self, url, block_stall_timeout, finality_stall_timeout, reconnect_max_interval, on_stall=None,
+                 reconnect_min_interval=1):
+        self.url = url
+        self.block_stall_timeout = block_stall_timeout
+        self.finality_stall_timeout = finality_stall_timeout
+        self.reconnect_min_interval = reconnect_min_interval
+        self.reconnect_max_interval = reconnect_max_interval
+        self.on_stall = on_stall
+        self.head_listeners = []
+        self.connected = False
+        self.best_block = None
+        self.finalized_block = None
+        self.last_block_at = None
+        self.last_finalized_at = None
+        self.blocks_stalled = False
+        self.finality_stalled = False
+        self.lock = Lock()
+        self.stop_event = Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = Thread(target=self.__run, name="node-head-subscription", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def status(self) -> dict:
+        with self.lock:
+            return {
+                "connected": self.connected,
+                "best_block": self.best_block,
+                "finalized_block": self.finalized_block,
+                "blocks_stalled": self.blocks_stalled,
+                "finality_stalled": self.finality_stalled,
+            }
+
+    def __run(self):
+        reconnect_interval = self.reconnect_min_interval
+        while not self.stop_event.is_set():
+            try:
+                with connect(self.url, open_timeout=self.reconnect_max_interval) as websocket:
+                    self.__subscribe(websocket)
+                    reconnect_interval = self.reconnect_min_interval
+                    self.__follow(websocket)
+            except (OSError, TimeoutError, WebSocketException, ValueError, KeyError) as e:
+                if self.connected:
+                    log.warning(f"Lost WebSocket connection to the node: {e}")
+                else:
+                    log.debug(f"Couldn't subscribe to the node heads: {e}")
+            with self.lock:
+                self.connected = False
+            self.stop_event.wait(reconnect_interval)
+            reconnect_interval = min(reconnect_interval * 2, self.reconnect_max_interval)
+
+    def __subscribe(self, websocket):
+        for request_id, method in enumerate(SUBSCRIPTIONS, start=1):
+            websocket.send(json.dumps({"id": request_id, "jsonrpc": "2.0", "method": method, "params": []}))
+        now = time.monotonic()
+        with self.lock:
+            self.connected = True
+            self.last_block_at = now
+            self.last_finalized_at = now
+            self.blocks_stalled = False
+            self.finality_stalled = False
+        log.info("Subscribed to the node heads over WebSocket")
+
+    def __follow(self, websocket):
+        check_interval = min(self.block_stall_timeout, self.finality_stall_timeout) / 2
+        while not self.stop_event.is_set():
+            try:
+                message = json.loads(websocket.recv(timeout=check_interval))
+            except TimeoutError:
+                message = None
+            if message is not None and "error" in message:
+                raise ValueError(f"Subscription failed: {message['error']}")
+            if message is not None and message.get("method") in SUBSCRIPTIONS.values():
+                self.__record_head(message["method"], int(message["params"]["result"]["number"], 16))
+            self.__check_stalls()
+        self.__close(websocket)
+
+    @staticmethod
+    def __close(websocket):
+        """
+        Closes the connection while still reading, the close frame isn't handled until pending heads are received.
+        """
+        Thread(target=websocket.close, daemon=True).start()
+        try:
+            while True:
+                websocket.recv(timeout=1)
+        except (ConnectionClosed, TimeoutError):
+            pass
+
+    def __record_head(self, method, block_number):
+        with self.lock:
+            if method == "chain_newHead":
+                self.best_block = block_number
+                self.last_block_at = time.monotonic()
+                self.blocks_stalled = False
+            else:
+                self.finalized_block = block_number
+                self.last_finalized_at = time.monotonic()
+                self.finality_stalled = False
+        if method == "chain_newHead":
+            for listener in list(self.head_listeners):
+                listener(block_number)
+
+    def __check_stalls(self):
+        now = time.monotonic()
+        with self.lock:
+            blocks_stalled = now - self.last_block_at >= self.block_stall_timeout
+            finality_stalled = now - self.last_finalized_at >= self.finality_stall_timeout
+            newly_stalled = ((blocks_stalled and not self.blocks_stalled)
+                             or (finality_stalled and not self.finality_stalled))
+            self.blocks_stalled = blocks_stalled
+            self.finality_stalled = finality_stalled
+
+        if newly_stalled:
+            log.warning(f"Node heads stalled, blocks: {blocks_stalled}, finality: {finality_stalled}")
+            if self.on_stall is not None:
+                self.on_stall()
+
+
+def create_head_subscription_monitor(on_stall) -> HeadSubscriptionMonitor:
+    config = common.config.config_service.config
+    return HeadSubscriptionMonitor(f"ws://localhost:{config.node_ws_rpc_port}",
+                                   config.node_block_stall_timeout,
+                                   config.node_finality_stall_timeout,
+                                   config.node_ws_reconnect_max_interval,
+                                   on_stall=on_stall)
@@ -1,21 +1,60 @@
-import onetimepad
+import binascii
+import itertools
+import re
 
-from common.crypto import is_hex
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Above this size XOR-ing with NumPy is faster than with Python integers
+NUMPY_THRESHOLD = 64 * 1024
+
+HEX_PATTERN = re.compile("[0-9a-fA-F]+")
 
 
 def encrypt(plaintext, key):
     """
     Encrypts the plaintext using the specified key.
+    Hex strings are XOR-ed character by character and the result is hex encoded, bytes are XOR-ed directly.
     """
     __validate_input(plaintext, key)
-    return onetimepad.encrypt(plaintext, key)
+    if isinstance(plaintext, str):
+        if not plaintext.isascii():
+            return binascii.hexlify(__xor_str(plaintext, key).encode()).decode()
+        return xor_bytes(plaintext.encode("ascii"), key.encode("ascii")).hex()
+    return xor_bytes(plaintext, key)
 
 
 def decrypt(ciphertext, key):
     """
     Decrypts the ciphertext using the specified key.
     """
-    return onetimepad.decrypt(ciphertext, key)
+    if isinstance(ciphertext, str):
+        cipher_bytes = binascii.unhexlify(ciphertext.encode())
+        if not cipher_bytes.isascii() or not key.isascii() or len(cipher_bytes) != len(key):
+            return __xor_str(cipher_bytes.decode(), key)
+        return xor_bytes(cipher_bytes, key.encode("ascii")).decode("ascii")
+    return xor_bytes(ciphertext, key)
+
+
+def xor_bytes(data, key) -> bytes:
+    """
+    XORs two bytes-like objects of the same length.
+    """
+    length = len(data)
+    if numpy is not None and length >= NUMPY_THRESHOLD:
+        return numpy.bitwise_xor(numpy.frombuffer(data, dtype=numpy.uint8),
+                                 numpy.frombuffer(key, dtype=numpy.uint8)).tobytes()
+    return (int.from_bytes(data, "big") ^ int.from_bytes(key, "big")).to_bytes(length, "big")
+
+
+def __xor_str(text, key):
+    """
+    XORs strings character by character, repeating the key if it's shorter than the text.
+    Used for the inputs which can't be XOR-ed as bytes, to keep the output of the onetimepad package.
+    """
+    return "".join(chr(ord(x) ^ ord(y)) for x, y in zip(text, itertools.cycle(key)))
 
 
 def __validate_input(text, key):
@@ -26,5 +65,5 @@ def __validate_input(text, key):
     if len(text) != len(key):
         raise ValueError(f"Text and key must have the same length., text {len(text)}, key {len(key)}")
 
-    if not is_hex(key):
+    if isinstance(key, str) and HEX_PATTERN.fullmatch(key) is None:
         raise ValueError("Key must be a hexadecimal string.")
@@ -1,11 +1,17 @@
+import os
 import pickle
+import struct
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, TimeoutError
+from contextlib import closing
 from dataclasses import dataclass
-from typing import Optional
+from threading import Lock
+from typing import Iterable, Iterator, Optional, Sequence
 
 import requests
 
 import common.config
-from common import crypto
+from common import crypto, metrics
 from common.logger import log
 from core import onetimepad
 from .qkd.provider_factory import get_qkd_provider
@@ -13,6 +19,21 @@ from .qrng import generate_random_hex
 
 EncryptedPskResponse = tuple[str, str, str]
 
+# Binary encoding of the PSK:
+# version (1 byte) | flags (1 byte) | block number (8 bytes) | psk length (2 bytes) | psk | signature (64 bytes)
+# All the numbers are big-endian, block number is 0 and signature is left out when they're not set.
+PSK_ENCODING_VERSION = 1
+PSK_HEADER = struct.Struct(">BBQH")
+PSK_SIGNATURE_LENGTH = 64
+FLAG_BLOCK_NUMBER = 0x01
+FLAG_SIGNATURE = 0x02
+
+BINARY_ENCODING = "binary"
+PICKLE_ENCODING = "pickle"
+ENCODINGS = (BINARY_ENCODING, PICKLE_ENCODING)
+# Used when no config is loaded, it's the encoding every runner in the network understands
+DEFAULT_ENCODING = PICKLE_ENCODING
+
 
 @dataclass(frozen=True)
 class Psk:
@@ -20,8 +41,119 @@ class Psk:
     block_number: int = None
     signature: str = None
 
-    def serialize(self):
-        return pickle.dumps(self)
+    def serialize(self, encoding: str = None) -> bytes:
+        if (encoding or configured_encoding()) == PICKLE_ENCODING:
+            return pickle.dumps(self)
+        return encode_psk(self.psk, self.block_number, self.signature)
+
+    @staticmethod
+    def deserialize(data: bytes) -> "Psk":
+        return decode_psk(data)
+
+
+def encode_psk(psk: str, block_number: int = None, signature: str = None) -> bytes:
+    psk_bytes = bytes.fromhex(psk)
+    flags = 0
+    if block_number is not None:
+        flags |= FLAG_BLOCK_NUMBER
+    signature_bytes = b""
+    if signature is not None:
+        flags |= FLAG_SIGNATURE
+        signature_bytes = bytes.fromhex(signature)
+        if len(signature_bytes) != PSK_SIGNATURE_LENGTH:
+            raise ValueError(f"Signature must be {PSK_SIGNATURE_LENGTH} bytes long")
+    header = PSK_HEADER.pack(PSK_ENCODING_VERSION, flags, block_number or 0, len(psk_bytes))
+    return header + psk_bytes + signature_bytes
+
+
+def decode_psk(data: bytes) -> Psk:
+    version, flags, block_number, psk_length = PSK_HEADER.unpack_from(data)
+    if version != PSK_ENCODING_VERSION:
+        raise ValueError(f"Unsupported psk encoding version: {version}")
+    psk_end = PSK_HEADER.size + psk_length
+    signature_length = PSK_SIGNATURE_LENGTH if flags & FLAG_SIGNATURE else 0
+    if len(data) != psk_end + signature_length:
+        raise ValueError("Invalid length of encoded psk")
+    return Psk(data[PSK_HEADER.size:psk_end].hex(),
+               block_number=block_number if flags & FLAG_BLOCK_NUMBER else None,
+               signature=data[psk_end:].hex() if signature_length else None)
+
+
+def signing_payload(psk: str, block_number: int, encoding: str = None) -> bytes:
+    """
+    Returns the bytes the psk creator signs for the block.
+    """
+    if (encoding or configured_encoding()) == PICKLE_ENCODING:
+        return pickle.dumps(Psk(psk, block_number=block_number))
+    return encode_psk(psk, block_number)
+
+
+def configured_encoding() -> str:
+    config = common.config.config_service.config
+    return config.psk_encoding if config is not None else DEFAULT_ENCODING
+
+
+class PskVerifier:
+    """
+    Verifies PSK signatures made by a single psk creator for a single block.
+    Each distinct (psk, signature) pair is verified only once, also when it's checked from many threads at a time.
+    """
+
+    def __init__(self, block_number: int, psk_creator_peer_id: str):
+        self.block_number = block_number
+        self.public_key = crypto.public_key_from_peerid(psk_creator_peer_id)
+        self.results = {}
+        self.lock = Lock()
+        # Seconds spent checking signatures, summed over the threads
+        self.verify_time = 0.0
+
+    def verify(self, psk_obj: Psk) -> bool:
+        pair = (psk_obj.psk, psk_obj.signature)
+        with self.lock:
+            result = self.results.get(pair)
+            is_first_check = result is None
+            if is_first_check:
+                result = Future()
+                self.results[pair] = result
+
+        if is_first_check:
+            started_at = time.perf_counter()
+            try:
+                result.set_result(self.__verify(*pair))
+            except Exception as e:
+                result.set_exception(e)
+            verify_time = time.perf_counter() - started_at
+            metrics.psk_verify_seconds.observe(verify_time)
+            with self.lock:
+                self.verify_time += verify_time
+        return result.result()
+
+    def verify_all(self, psks: Sequence[Psk]):
+        distinct_psks = list({(psk_obj.psk, psk_obj.signature): psk_obj for psk_obj in psks}.values())
+        if len(distinct_psks) < 2:
+            return
+        with ThreadPoolExecutor(max_workers=min(len(distinct_psks), os.cpu_count() or 1)) as executor:
+            list(executor.map(self.verify, distinct_psks))
+
+    def __verify(self, psk: str, signature: str) -> bool:
+        try:
+            signature_bytes = bytes.fromhex(signature)
+        except (TypeError, ValueError):
+            log.error("Invalid signature")
+            return False
+
+        config = common.config.config_service.config
+        encodings = [config.psk_encoding]
+        if config.psk_accept_legacy_encoding:
+            encodings += [encoding for encoding in ENCODINGS if encoding != config.psk_encoding]
+        for encoding in encodings:
+            try:
+                payload = signing_payload(psk, self.block_number, encoding)
+            except ValueError:
+                continue
+            if crypto.verify(payload, signature_bytes, self.public_key):
+                return True
+        return False
 
 
 def generate_psk_from_qrng():
@@ -32,53 +164,117 @@ def generate_psk_from_qrng():
     return psk
 
 
-def get_psk_from_peers(block_number: int = None, psk_creator_peer_id: str = None) -> Psk:
-    psks_with_sig = __fetch_from_peers()
-    return __validate_psk(psks_with_sig, block_number, psk_creator_peer_id)
+def get_psk_from_peers(block_number: int = None, psk_creator_peer_id: str = None, timings: dict = None) -> Psk:
+    """
+    Fetches the PSK from the peers, the time spent checking signatures is added to `timings["verify"]` when given.
+    """
+    verifier = None if psk_creator_peer_id is None else PskVerifier(block_number, psk_creator_peer_id)
+    try:
+        with closing(__fetch_from_peers(verifier, block_number)) as psks_with_sig:
+            return __validate_psk(psks_with_sig, block_number, psk_creator_peer_id, verifier)
+    finally:
+        if timings is not None and verifier is not None:
+            timings["verify"] = timings.get("verify", 0.0) + verifier.verify_time
 
 
-def __fetch_from_peers() -> [Psk]:
+def __fetch_from_peers(verifier: PskVerifier = None, block_number: int = None) -> Iterator[Psk]:
+    """
+    Fetches and decrypts the PSK from all the peers concurrently.
+    Yields PSKs in the order peers respond, until every peer answered or the fetch deadline is reached.
+    Closing the generator abandons the peers which haven't answered yet.
+    With the verifier, signatures are checked in the fetching threads, so the different ones are checked in parallel.
+    With the block number, peers are asked for the PSK of that block instead of their current one.
+    """
     log.info("Fetching PSK from other peers...")
-    peers = common.config.config_service.config.peers
+    config = common.config.config_service.config
+    peers = config.peers
+
+    executor = ThreadPoolExecutor(max_workers=max(len(peers), 1), thread_name_prefix="psk-fetch")
+    futures = [executor.submit(__fetch_from_peer, peer_id, peer_config, verifier, block_number)
+               for peer_id, peer_config in peers.items()]
+    try:
+        for future in as_completed(futures, timeout=config.psk_fetch_deadline):
+            psk = future.result()
+            if psk is not None:
+                yield psk
+    except TimeoutError:
+        responded = sum(future.done() for future in futures)
+        log.warning(f"PSK fetch deadline reached, {responded} of {len(futures)} peers responded")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
 
-    psks_with_sig = []
 
-    for peer_id, peer_config in peers.items():
-        fetch_response = __fetch_encrypted_psk(peer_id, peer_config['server_addr'])
-        if fetch_response is not None:
-            encrypted_key, qkd_key_id, signature = fetch_response
-            psk = __decrypt_psk(encrypted_key, peer_config['qkd'], qkd_key_id)
-            log.debug(f"Fetched psk: {psk} and signature: {signature}")
-            psks_with_sig.append(Psk(psk, signature=signature))
+def __fetch_from_peer(peer_id: str, peer_config: dict, verifier: PskVerifier = None,
+                      block_number: int = None) -> Optional[Psk]:
+    started_at = time.perf_counter()
+    fetch_response = __fetch_encrypted_psk(peer_id, peer_config['server_addr'], block_number)
+    if fetch_response is None:
+        return None
 
-    return psks_with_sig
+    encrypted_key, qkd_key_id, signature = fetch_response
+    decrypt_started_at = time.perf_counter()
+    try:
+        psk = __decrypt_psk(encrypted_key, peer_config['qkd'], qkd_key_id)
+    except Exception as e:
+        log.error(f"Couldn't decrypt psk from {peer_id}: {e}")
+        return None
+    finished_at = time.perf_counter()
+    metrics.kme_request_seconds.labels("dec", peer_config['qkd']['provider'], peer_id) \
+        .observe(finished_at - decrypt_started_at)
+    metrics.psk_fetch_seconds.labels(peer_id).observe(finished_at - started_at)
+    log.debug(f"Fetched psk: {psk} and signature: {signature}")
+    psk_obj = Psk(psk, signature=signature)
+    if verifier is not None:
+        verifier.verify(psk_obj)
+    return psk_obj
 
 
-def __validate_psk(psks_with_sig: [Psk], block_number: int = None, psk_creator_peer_id: str = None) -> Optional[Psk]:
-    # Keys and signatures from all the peers should be equal if we don't have psk creator peer id to verify against
+def __validate_psk(psks_with_sig: Iterable[Psk], block_number: int = None, psk_creator_peer_id: str = None,
+                   verifier: PskVerifier = None) -> Optional[Psk]:
+    # Keys and signatures from all the peers should be equal if we don't have psk creator peer id to verify against.
+    # We stop as soon as the quorum of matching keys is reached.
     if psk_creator_peer_id is None:
-        if len(set(psks_with_sig)) == 1:
-            return psks_with_sig[0]
-        else:
+        quorum = common.config.config_service.config.psk_fetch_quorum
+        matching_psk = None
+        matching_count = 0
+        for psk_obj in psks_with_sig:
+            if matching_psk is not None and psk_obj != matching_psk:
+                log.warning("Psk validation failed...")
+                metrics.psk_validation_failures_total.inc()
+                return None
+            matching_psk = psk_obj
+            matching_count += 1
+            if quorum is not None and matching_count >= quorum:
+                return matching_psk
+
+        if matching_psk is None:
             log.warning("Psk validation failed...")
+            metrics.psk_validation_failures_total.inc()
+        return matching_psk
     # When we know psk creator peer id it's ok to get first verified key
     else:
+        if verifier is None:
+            verifier = PskVerifier(block_number, psk_creator_peer_id)
+        if isinstance(psks_with_sig, Sequence):
+            verifier.verify_all(psks_with_sig)
+
         for psk_obj in psks_with_sig:
             psk = psk_obj.psk
             signature = psk_obj.signature
             log.debug(f"validating psk: {psk}, signature: {signature}, psk_creator_peer_id: {psk_creator_peer_id}")
-            psk_bytes = Psk(psk, block_number=block_number).serialize()
-            if crypto.verify(psk_bytes, bytes.fromhex(signature),
-                             crypto.to_public_from_peerid(psk_creator_peer_id)):
+            if verifier.verify(psk_obj):
                 return Psk(psk, signature=signature)
             else:
                 log.warning("Psk validation failed...")
+                metrics.psk_validation_failures_total.inc()
 
 
-def __fetch_encrypted_psk(peer_id: str, peer_addr: str) -> Optional[EncryptedPskResponse]:
+def __fetch_encrypted_psk(peer_id: str, peer_addr: str, block_number: int = None) -> Optional[EncryptedPskResponse]:
     try:
         get_psk_url = f"{peer_addr}/peer/{common.config.config_service.config.local_peer_id}/psk"
-        get_psk_response = requests.get(get_psk_url)
+        params = {"block_num": block_number} if block_number is not None else None
+        get_psk_response = requests.get(get_psk_url, params=params,
+                                        timeout=common.config.config_service.config.psk_fetch_timeout)
         if get_psk_response.status_code != 200:
             log.error(f"{peer_id} didn't send the psk. Message: {get_psk_response.json()['message']}")
         else:
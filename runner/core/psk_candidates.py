@@ -0,0 +1,139 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from threading import Lock
+from typing import Callable, Optional
+
+import common.config
+import common.file
+from common import crypto
+from common.file_watcher import get_file_watcher
+from common.logger import log
+from core import node_rpc, pre_shared_key
+
+
+@dataclass(frozen=True)
+class PskCandidate:
+    psk: str
+    block_number: int
+    signature: str
+
+
+class PskCandidates:
+    """
+    Prepares the PSK this peer would create at the next rotation: the key is drawn from the QRNG ahead of time
+    and signed for each of the next `window` blocks while the chain advances, so a rotation request which chooses
+    this peer only takes the prepared candidate. A key is handed out once, its signatures for the other blocks
+    are discarded with it and only then a new key is prepared. Candidates are never written to disk.
+    """
+
+    def __init__(self, generate_psk: Callable[[], str], sign: Callable[[str, int], str], window: int):
+        self.generate_psk = generate_psk
+        self.sign = sign
+        self.window = window
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="psk-candidates")
+        self.lock = Lock()
+        self.psk = None
+        # Block number to the signature of `psk` for that block
+        self.signatures = {}
+        # Changed whenever the prepared psk is handed out or discarded
+        self.generation = 0
+        self.best_block = None
+        self.preparing = False
+
+    def advance(self, best_block: int):
+        """
+        Prepares candidates for the blocks starting at `best_block` in the background, called on every new head.
+        """
+        with self.lock:
+            if self.best_block is None or best_block > self.best_block:
+                self.best_block = best_block
+            if self.preparing:
+                return
+            self.preparing = True
+        self.executor.submit(self.__prepare)
+
+    def take(self, block_number: int) -> Optional[PskCandidate]:
+        """
+        Hands out the prepared psk signed for the block, it's signed right away when the block is out of the window.
+        Returns None when no psk is prepared.
+        """
+        with self.lock:
+            psk, signature = self.psk, self.signatures.get(block_number)
+            if psk is None:
+                return None
+            self.__discard()
+            best_block = self.best_block
+        if signature is None:
+            signature = self.sign(psk, block_number)
+        if best_block is not None:
+            self.advance(best_block)
+        return PskCandidate(psk, block_number, signature)
+
+    def discard(self):
+        with self.lock:
+            self.__discard()
+
+    def status(self) -> dict:
+        with self.lock:
+            return {"prepared": self.psk is not None, "blocks": sorted(self.signatures)}
+
+    def __discard(self):
+        self.psk = None
+        self.signatures = {}
+        self.generation += 1
+
+    def __prepare(self):
+        with self.lock:
+            self.preparing = False
+            psk, generation, best_block = self.psk, self.generation, self.best_block
+            missing = [block for block in range(best_block, best_block + self.window) if block not in self.signatures]
+        try:
+            new_psk = psk is None
+            if new_psk:
+                psk = self.generate_psk()
+            signatures = {block: self.sign(psk, block) for block in missing}
+        except Exception as e:
+            log.warning(f"Couldn't prepare the next pre-shared key: {e}")
+            return
+
+        with self.lock:
+            if self.generation != generation:
+                # The psk was handed out or discarded meanwhile, it mustn't be used again
+                return
+            self.psk = psk
+            self.signatures.update(signatures)
+            for block in [block for block in self.signatures if block < self.best_block]:
+                del self.signatures[block]
+
+
+def sign_psk(psk: str, block_number: int) -> str:
+    node_key = common.file.node_key_file_manager.read()
+    return crypto.sign(pre_shared_key.signing_payload(psk, block_number), node_key).hex()
+
+
+psk_candidates = None
+psk_candidates_lock = Lock()
+
+
+def get_psk_candidates() -> Optional[PskCandidates]:
+    """
+    Returns None when preparing candidates is turned off or the node heads can't be followed.
+    """
+    global psk_candidates
+    with psk_candidates_lock:
+        config = common.config.config_service.config
+        if psk_candidates is None and config.psk_candidate_window > 0:
+            head_subscription = node_rpc.get_health_monitor().head_subscription
+            if head_subscription is None:
+                return None
+            psk_candidates = PskCandidates(pre_shared_key.generate_psk_from_qrng, sign_psk,
+                                           config.psk_candidate_window)
+            head_subscription.head_listeners.append(psk_candidates.advance)
+            file_watcher = get_file_watcher()
+            if file_watcher is not None:
+                # Signatures made with a replaced node key are useless
+                try:
+                    file_watcher.subscribe(config.node_key_file_path, lambda _path, _event: psk_candidates.discard())
+                except OSError as e:
+                    log.warning(f"Couldn't watch the node key, prepared pre-shared keys are kept on its change: {e}")
+        return psk_candidates
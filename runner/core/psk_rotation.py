@@ -0,0 +1,174 @@
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from threading import Event, Lock
+from typing import Callable, Optional
+
+from common import metrics, profiler
+from common.logger import log
+
+JOB_HISTORY_SIZE = 100
+FINISHED_STATES = ("done", "failed", "cancelled")
+
+
+class RotationJob:
+    """
+    A single PSK rotation for a block, it stops trying once it's cancelled,
+    runs out of attempts or exceeds its time budget.
+    """
+
+    def __init__(self, block_number: int, peer_id: str, is_local_peer: bool, max_attempts: int, time_budget: float):
+        self.id = uuid.uuid4().hex
+        self.block_number = block_number
+        self.peer_id = peer_id
+        self.is_local_peer = is_local_peer
+        self.max_attempts = max_attempts
+        self.time_budget = time_budget
+        self.state = "pending"
+        self.attempts = 0
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.cancelled = Event()
+        self.finished_event = Event()
+        self.future = None
+        # Seconds spent in each phase of the rotation: qrng, sign, fetch, verify and write
+        self.phases = {}
+
+    @property
+    def finished(self) -> bool:
+        return self.state in FINISHED_STATES
+
+    def next_attempt(self) -> bool:
+        """
+        Counts an attempt, returns False when the job should give up instead.
+        """
+        if self.cancelled.is_set():
+            return False
+        if self.max_attempts and self.attempts >= self.max_attempts:
+            self.error = f"No psk after {self.attempts} attempts"
+            return False
+        if self.time_budget and self.started_at is not None and time.monotonic() - self.started_at >= self.time_budget:
+            self.error = f"No psk within {self.time_budget}s"
+            return False
+        self.attempts += 1
+        return True
+
+    @contextmanager
+    def phase(self, name):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - started_at
+
+    def wait(self, timeout=None) -> bool:
+        return self.finished_event.wait(timeout)
+
+    def cancel(self):
+        self.cancelled.set()
+        if self.future is not None and self.future.cancel():
+            self.finish("cancelled")
+
+    def finish(self, state):
+        self.state = state
+        self.finished_event.set()
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "state": self.state,
+            "block_number": self.block_number,
+            "peer_id": self.peer_id,
+            "is_local_peer": self.is_local_peer,
+            "attempts": self.attempts,
+            "phases": dict(self.phases),
+            "error": self.error,
+            "created_at": self.created_at,
+        }
+
+
+class RotationScheduler:
+    """
+    Runs PSK rotations on a bounded executor.
+    A request for a block which already has a running or successful job returns that job,
+    a request for a newer block cancels the jobs of the older ones
+    and a request for a block older than the newest one is cancelled right away.
+    Rotations write the PSK through `commit`, so a superseded job can't overwrite the PSK of a newer block.
+    """
+
+    def __init__(self, rotate: Callable[["RotationJob"], None], max_workers: int, max_attempts: int,
+                 time_budget: float):
+        self.rotate = rotate
+        self.max_attempts = max_attempts
+        self.time_budget = time_budget
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="psk-rotation")
+        self.jobs = OrderedDict()
+        self.lock = Lock()
+        self.commit_lock = Lock()
+        self.newest_block = None
+        self.committed_block = None
+
+    def submit(self, block_number: int, peer_id: str, is_local_peer: bool) -> RotationJob:
+        with self.lock:
+            for job in self.jobs.values():
+                if job.block_number == block_number and job.state in ("pending", "running", "done") \
+                        and not job.cancelled.is_set():
+                    log.debug(f"Rotation of the psk for block {block_number} is already scheduled")
+                    return job
+
+            job = RotationJob(block_number, peer_id, is_local_peer, self.max_attempts, self.time_budget)
+            self.jobs[job.id] = job
+            while len(self.jobs) > JOB_HISTORY_SIZE:
+                self.jobs.popitem(last=False)
+
+            if self.newest_block is not None and block_number < self.newest_block:
+                log.info(f"Rotation of the psk for block {block_number} is superseded by block {self.newest_block}")
+                job.cancelled.set()
+                job.finish("cancelled")
+                return job
+
+            for other_job in self.jobs.values():
+                if other_job is not job and not other_job.finished and other_job.block_number < block_number:
+                    log.info(f"Cancelling rotation of the psk for block {other_job.block_number}")
+                    other_job.cancel()
+            self.newest_block = block_number
+            job.future = self.executor.submit(self.__run, job)
+        return job
+
+    def get(self, job_id) -> Optional[RotationJob]:
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def commit(self, job: RotationJob, write: Callable[[], None]) -> bool:
+        """
+        Calls `write` unless the job was cancelled or a newer block's psk is already written.
+        """
+        with self.commit_lock:
+            if job.cancelled.is_set():
+                return False
+            if self.committed_block is not None and job.block_number < self.committed_block:
+                job.cancelled.set()
+                return False
+            write()
+            self.committed_block = job.block_number
+            return True
+
+    def __run(self, job: RotationJob):
+        job.state = "running"
+        job.started_at = time.monotonic()
+        try:
+            with profiler.profiled("rotation"):
+                self.rotate(job)
+        except Exception as e:
+            log.error(f"Rotation of the psk for block {job.block_number} failed: {e}")
+            job.error = str(e)
+        if job.cancelled.is_set():
+            job.finish("cancelled")
+        elif job.error is not None:
+            job.finish("failed")
+        else:
+            job.finish("done")
+        metrics.psk_rotation_seconds.labels(job.state).observe(time.monotonic() - job.started_at)
@@ -1,45 +1,69 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 import requests
 import validators
 
 from common import crypto
 from common.logger import log
+from .session import create_session
 
 
 @dataclass(frozen=True)
 class ETSI014Provider:
 
     config: dict
+    session: requests.Session = field(default=None, compare=False, repr=False)
+
+    def __post_init__(self):
+        if self.session is None:
+            object.__setattr__(self, "session", create_session(self.config))
 
     def get_enc_key(self):
         qkd_url = f"{self.config['url']}/enc_keys?size=256"
         if not validators.url(qkd_url):
             raise requests.exceptions.InvalidURL
 
-        response = self._call_qkd(qkd_url, self.config.get("client_cert_path"), self.config.get("cert_key_path"))
+        response = self._call_qkd(qkd_url)
         log.debug(f"response from qkd: {response}")
         return self.__unwrap_response(response)
 
+    def get_enc_keys(self, number):
+        qkd_url = f"{self.config['url']}/enc_keys?number={number}&size=256"
+        if not validators.url(qkd_url):
+            raise requests.exceptions.InvalidURL
+
+        response = self._call_qkd(qkd_url)
+        log.debug(f"response from qkd: {response}")
+        return [self.__unwrap_key(key) for key in response["keys"]]
+
+    def get_status(self):
+        qkd_url = f"{self.config['url']}/status"
+        if not validators.url(qkd_url):
+            raise requests.exceptions.InvalidURL
+
+        return self._call_qkd(qkd_url)
+
     def get_dec_key(self, key_id):
         qkd_url = f"{self.config['url']}/dec_keys?key_ID={key_id}"
         if not validators.url(qkd_url):
             raise requests.exceptions.InvalidURL
 
-        response = self._call_qkd(qkd_url, self.config.get("client_cert_path"), self.config.get("cert_key_path"))
+        response = self._call_qkd(qkd_url)
         log.debug(f"response from qkd: {response}")
         return self.__unwrap_response(response)
 
-    @staticmethod
-    def _call_qkd(qkd_url, cert_path=None, key_path=None):
-        if cert_path is None or key_path is None:
-            return requests.get(qkd_url).json()
+    def _call_qkd(self, qkd_url):
+        if self.session.cert is None:
+            return self.session.get(qkd_url).json()
         else:
-            return requests.get(qkd_url, cert=(cert_path, key_path), verify=False).json()
+            return self.session.get(qkd_url, verify=False).json()
 
     @staticmethod
     def __unwrap_response(response):
-        key = response["keys"][0]
+        return ETSI014Provider.__unwrap_key(response["keys"][0])
+
+    @staticmethod
+    def __unwrap_key(key):
         key_id = key["key_ID"]
         qkd_key = key["key"]
         decoded_qkd_key = crypto.base64_to_hex(qkd_key)
@@ -0,0 +1,146 @@
+import time
+from collections import deque
+from threading import Lock, Thread
+
+import common.config
+from common import metrics
+from common.logger import log
+from .etsi014 import ETSI014Provider
+from .provider_factory import get_qkd_provider
+
+
+class EncKeyPool:
+    """
+    Keeps encryption keys fetched in advance from the KME of a single peer.
+    Keys are fetched in batches whenever the pool drops below the low watermark, up to the high watermark,
+    leaving at least `kme_reserve` keys stored in the KME.
+    """
+
+    def __init__(self, peer_id, provider, low_watermark, high_watermark, batch_size, key_ttl, kme_reserve):
+        self.peer_id = peer_id
+        self.provider = provider
+        self.low_watermark = low_watermark
+        self.high_watermark = high_watermark
+        self.batch_size = batch_size
+        self.key_ttl = key_ttl
+        self.kme_reserve = kme_reserve
+        self.keys = deque()
+        self.lock = Lock()
+        self.refilling = False
+
+    def depth(self) -> int:
+        with self.lock:
+            self.__drop_expired_keys()
+            return len(self.keys)
+
+    def get_enc_key(self):
+        with self.lock:
+            self.__drop_expired_keys()
+            pooled_key = self.keys.popleft() if self.keys else None
+            depth = len(self.keys)
+
+        if depth < self.low_watermark:
+            self.refill_async()
+
+        if pooled_key is None:
+            log.warning(f"QKD key pool for peer {self.peer_id} is empty, fetching the key directly...")
+            return self.provider.get_enc_key()
+
+        key_id, qkd_key, _ = pooled_key
+        return key_id, qkd_key
+
+    def refill_async(self):
+        with self.lock:
+            if self.refilling:
+                return
+            self.refilling = True
+
+        Thread(target=self.refill, daemon=True).start()
+
+    def refill(self):
+        try:
+            fetched = 0
+            while fetched < self.high_watermark:
+                number = min(self.__keys_to_fetch(), self.high_watermark - fetched)
+                if number <= 0:
+                    return
+                fetched_at = time.monotonic()
+                keys = self.provider.get_enc_keys(number)
+                if not keys:
+                    return
+                fetched += len(keys)
+                with self.lock:
+                    self.keys.extend((key_id, qkd_key, fetched_at) for key_id, qkd_key in keys)
+                log.debug(f"Fetched {len(keys)} keys to QKD key pool for peer {self.peer_id}")
+        except Exception as e:
+            log.error(f"Couldn't refill QKD key pool for peer {self.peer_id}: {e}")
+        finally:
+            with self.lock:
+                self.refilling = False
+
+    def __keys_to_fetch(self) -> int:
+        with self.lock:
+            self.__drop_expired_keys()
+            missing = self.high_watermark - len(self.keys)
+        if missing <= 0:
+            return 0
+
+        status = self.provider.get_status()
+        available = status["stored_key_count"] - self.kme_reserve
+        return min(missing, self.batch_size, status.get("max_key_per_request", missing), available)
+
+    def __drop_expired_keys(self):
+        expiry = time.monotonic() - self.key_ttl
+        while self.keys and self.keys[0][2] < expiry:
+            self.keys.popleft()
+
+
+__pools = {}
+__pools_lock = Lock()
+
+
+def get_enc_key(peer_id: str, qkd_config: dict):
+    """
+    Returns the encryption key for the peer from its key pool, or straight from the KME if pooling is disabled.
+    """
+    started_at = time.perf_counter()
+    pool = __get_pool(peer_id, qkd_config)
+    if pool is None:
+        key = get_qkd_provider(qkd_config).get_enc_key()
+    else:
+        key = pool.get_enc_key()
+    metrics.kme_request_seconds.labels("enc", qkd_config["provider"], peer_id) \
+        .observe(time.perf_counter() - started_at)
+    return key
+
+
+def start_key_pools():
+    for peer_id, peer_config in common.config.config_service.config.peers.items():
+        pool = __get_pool(peer_id, peer_config["qkd"])
+        if pool is not None:
+            pool.refill_async()
+
+
+def pool_depths() -> dict:
+    with __pools_lock:
+        pools = list(__pools.values())
+    return {pool.peer_id: pool.depth() for pool in pools}
+
+
+def __get_pool(peer_id: str, qkd_config: dict):
+    config = common.config.config_service.config
+    provider = get_qkd_provider(qkd_config)
+    if config.qkd_key_pool_high_watermark <= 0 or not isinstance(provider, ETSI014Provider):
+        return None
+
+    with __pools_lock:
+        pool = __pools.get(peer_id)
+        if pool is None or pool.provider is not provider:
+            pool = EncKeyPool(peer_id, provider,
+                              low_watermark=config.qkd_key_pool_low_watermark,
+                              high_watermark=config.qkd_key_pool_high_watermark,
+                              batch_size=config.qkd_key_pool_batch_size,
+                              key_ttl=config.qkd_key_ttl,
+                              kme_reserve=config.qkd_kme_reserve)
+            __pools[peer_id] = pool
+        return pool
@@ -1,8 +1,25 @@
+from threading import Lock
+
 from core.qkd.etsi014 import ETSI014Provider
 from core.qkd.qnu_labs import QNULabsProvider
 
+# Providers keep their KME sessions open, so they are created once per KME endpoint
+__providers = {}
+__providers_lock = Lock()
+
 
 def get_qkd_provider(config):
+    provider_key = (config["provider"], config.get("url"), config.get("client_cert_path"),
+                    config.get("cert_key_path"), config.get("pool_size"))
+    with __providers_lock:
+        provider = __providers.get(provider_key)
+        if provider is None:
+            provider = __create_qkd_provider(config)
+            __providers[provider_key] = provider
+        return provider
+
+
+def __create_qkd_provider(config):
     if config["provider"] == "qnulabs":
         return QNULabsProvider(config)
     else:
@@ -1,23 +1,27 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 import requests
 import validators
 
 from common.logger import log
+from .session import create_session
 
 
 @dataclass(frozen=True)
 class QNULabsProvider:
     config: dict
+    session: requests.Session = field(default=None, compare=False, repr=False)
+
+    def __post_init__(self):
+        if self.session is None:
+            object.__setattr__(self, "session", create_session(self.config))
 
     def get_enc_key(self):
         qkd_url = f"{self.config['url']}/enc_keys?size=64"
         if not validators.url(qkd_url):
             raise requests.exceptions.InvalidURL
 
-        client_cert_path = self.config.get("client_cert_path")
-        cert_key_path = self.config.get("cert_key_path")
-        response = requests.get(qkd_url, cert=(client_cert_path, cert_key_path), verify=False).json()
+        response = self.session.get(qkd_url, verify=False).json()
         log.debug(f"response from qkd: {response}")
 
         key = response["keys"][0]
@@ -28,9 +32,7 @@ class QNULabsProvider:
         if not validators.url(qkd_url):
             raise requests.exceptions.InvalidURL
 
-        client_cert_path = self.config.get("client_cert_path")
-        cert_key_path = self.config.get("cert_key_path")
-        response = requests.get(qkd_url, cert=(client_cert_path, cert_key_path), verify=False).json()
+        response = self.session.get(qkd_url, verify=False).json()
         log.debug(f"response from qkd: {response}")
 
         return response["key_ID"], response["key"]
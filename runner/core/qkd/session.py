@@ -0,0 +1,59 @@
+import ssl
+from threading import Lock
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_POOL_SIZE = 10
+
+
+class MutualTLSAdapter(HTTPAdapter):
+    """
+    Shares a single SSL context, with the client certificate loaded once, between all pooled KME connections.
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE):
+        # KME certificates are not verified, as it was done before pooling
+        self.ssl_context = ssl.create_default_context()
+        self.ssl_context.check_hostname = False
+        self.ssl_context.verify_mode = ssl.CERT_NONE
+        self.loaded_cert = None
+        self.cert_lock = Lock()
+        super().__init__(pool_connections=1, pool_maxsize=pool_size)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["ssl_context"] = self.ssl_context
+        super().init_poolmanager(*args, **kwargs)
+
+    def cert_verify(self, conn, url, verify, cert):
+        super().cert_verify(conn, url, verify, cert)
+        if cert:
+            self.__load_cert(conn.cert_file, conn.key_file)
+            # The certificate is already in the shared context, urllib3 shouldn't load it for every connection
+            conn.cert_file = None
+            conn.key_file = None
+
+    def __load_cert(self, cert_path, key_path):
+        with self.cert_lock:
+            if self.loaded_cert != (cert_path, key_path):
+                self.ssl_context.load_cert_chain(cert_path, key_path)
+                self.loaded_cert = (cert_path, key_path)
+
+
+def create_session(config: dict) -> requests.Session:
+    """
+    Creates a long-lived session for a KME endpoint, keeping its connections alive between the calls.
+    """
+    pool_size = config.get("pool_size") or DEFAULT_POOL_SIZE
+    client_cert_path = config.get("client_cert_path")
+    cert_key_path = config.get("cert_key_path")
+
+    session = requests.Session()
+    if client_cert_path is None or cert_key_path is None:
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    else:
+        adapter = MutualTLSAdapter(pool_size)
+        session.cert = (client_cert_path, cert_key_path)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
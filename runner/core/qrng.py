@@ -1,23 +1,154 @@
+import math
+import time
+from threading import Condition, Lock, Thread
+
 from common.logger import log
 import requests
 import validators
 from Crypto import Random
 import common.config
+from common import metrics
+
+QRNG_BLOCK_LENGTH = 32
+
+
+class EntropyPool:
+    """
+    Buffers random bytes fetched from QRNG in large blocks, so generating a PSK doesn't wait for the QRNG Api.
+    The buffer is refilled in the background once it drops below the refill threshold, by at most one refill
+    at a time. After a failed refill the next one waits, doubling the delay up to `retry_max_delay`.
+    """
+
+    def __init__(self, buffer_size, refill_threshold, retry_min_delay=1, retry_max_delay=300):
+        self.buffer_size = buffer_size
+        self.refill_threshold = refill_threshold
+        self.retry_min_delay = retry_min_delay
+        self.retry_max_delay = retry_max_delay
+        self.buffer = bytearray()
+        self.lock = Lock()
+        self.refilled = Condition(self.lock)
+        self.refilling = False
+        self.retry_delay = retry_min_delay
+        self.retry_at = None
+        self.quantum_bytes = 0
+        self.fallback_bytes = 0
+
+    def get_random_bytes(self, length) -> bytes:
+        with self.lock:
+            if len(self.buffer) >= length:
+                random_bytes = bytes(self.buffer[:length])
+                del self.buffer[:length]
+                self.quantum_bytes += length
+            else:
+                random_bytes = None
+            buffered = len(self.buffer)
+
+        if buffered < self.refill_threshold:
+            self.refill_async()
+
+        if random_bytes is None:
+            log.warning("QRNG entropy buffer is empty: Proceeding to fallback random psk...")
+            random_bytes = Random.get_random_bytes(length)
+            metrics.fallback_entropy_total.inc()
+            with self.lock:
+                self.fallback_bytes += length
+        return random_bytes
+
+    def refill_async(self):
+        if self.__start_refill():
+            Thread(target=self.__run_refill, daemon=True).start()
+
+    def refill(self):
+        """
+        Refills the buffer in the calling thread, unless another refill is in flight.
+        """
+        if self.__start_refill(ignore_backoff=True):
+            self.__run_refill()
+
+    def prime(self, timeout) -> bool:
+        """
+        Starts a refill and waits up to `timeout` seconds for it, so the first PSK is generated from QRNG.
+        Returns whether the buffer holds enough bytes for a PSK.
+        """
+        self.refill_async()
+        with self.lock:
+            self.refilled.wait_for(lambda: not self.refilling, timeout)
+            primed = len(self.buffer) >= QRNG_BLOCK_LENGTH
+        if not primed:
+            log.warning("QRNG entropy buffer couldn't be filled before the first rotation")
+        return primed
+
+    def __start_refill(self, ignore_backoff=False) -> bool:
+        with self.lock:
+            if self.refilling:
+                return False
+            if not ignore_backoff and self.retry_at is not None and time.monotonic() < self.retry_at:
+                return False
+            self.refilling = True
+            return True
+
+    def __run_refill(self):
+        random_bytes = None
+        missing = 0
+        try:
+            with self.lock:
+                missing = self.buffer_size - len(self.buffer)
+            if missing <= 0:
+                return
+            random_bytes = self.__fetch_from_qrng(math.ceil(missing / QRNG_BLOCK_LENGTH))
+        finally:
+            with self.lock:
+                if random_bytes is not None:
+                    self.buffer.extend(random_bytes)
+                    self.retry_delay = self.retry_min_delay
+                    self.retry_at = None
+                elif missing > 0:
+                    self.retry_at = time.monotonic() + self.retry_delay
+                    self.retry_delay = min(self.retry_delay * 2, self.retry_max_delay)
+                self.refilling = False
+                self.refilled.notify_all()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "buffered_bytes": len(self.buffer),
+                "quantum_bytes": self.quantum_bytes,
+                "fallback_bytes": self.fallback_bytes,
+            }
+
+    @staticmethod
+    def __fetch_from_qrng(blocks):
+        config = common.config.config_service.config
+        url = (f"https://qrng.qbck.io/{config.qrng_api_key}"
+               f"/qbck/block/hex?size={blocks}&length={QRNG_BLOCK_LENGTH}")
+        if not validators.url(url):
+            log.error("Invalid URL, please make sure that you have correct qRNG API key configured")
+            return None
+        started_at = time.perf_counter()
+        try:
+            response = requests.get(url, timeout=config.qrng_timeout)
+            metrics.qrng_request_seconds.observe(time.perf_counter() - started_at)
+            response.raise_for_status()
+            data = response.json()
+            return b"".join(bytes.fromhex(block.removeprefix("0x")) for block in data['data']['result'])
+        except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+            log.warning(f"Failed to get random blocks from QRNG: {e}")
+            return None
+
+
+entropy_pool = None
+entropy_pool_lock = Lock()
+
+
+def get_entropy_pool() -> EntropyPool:
+    global entropy_pool
+    with entropy_pool_lock:
+        if entropy_pool is None:
+            config = common.config.config_service.config
+            entropy_pool = EntropyPool(config.qrng_buffer_size, config.qrng_refill_threshold,
+                                       config.qrng_retry_min_delay, config.qrng_retry_max_delay)
+        return entropy_pool
 
 
 def generate_random_hex(length=32) -> str:
-    url = (f"https://qrng.qbck.io/{common.config.config_service.config.qrng_api_key}"
-           f"/qbck/block/hex?size=1&length={length}")
-    if not validators.url(url):
-        log.error("Invalid URL, please make sure that you have correct qRNG API key configured - proceeding to "
-                  "fallback random psk...")
-        return f"{Random.get_random_bytes(length).hex()}"
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-    except (requests.exceptions.RequestException, requests.exceptions.HTTPError):
-        log.warning("Failed to get key from QRNG: Proceeding to fallback random psk...")
-        return f"{Random.get_random_bytes(length).hex()}"
-    else:
-        data = response.json()
-        return data['data']['result'][0]
+    return get_entropy_pool().get_random_bytes(length).hex()
@@ -1,48 +1,126 @@
 import subprocess
 import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
 
 from common.logger import log
-import sys
 import common.config
 from threading import Thread
 import common.file
-import requests
 import threading
-from core import pre_shared_key
+from common.log_sink import NodeLogSink
+from common import metrics
+from common.exceptions import NodeRpcError
+from core import node_rpc, pre_shared_key
+from supervisor import NodeSupervisor
 from time import sleep
 
+RESTART_HISTORY_SIZE = 100
+READY_POLL_MAX_INTERVAL = 1
+
+
+@dataclass
+class Restart:
+    id: str
+    state: str = "pending"
+    requested_at: float = None
+    downtime: float = None
+    error: str = None
+
+    @property
+    def finished(self) -> bool:
+        return self.state in ("ready", "failed")
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
 
 class Node:
     def __init__(self, startup_args):
         self.startup_args = startup_args
-        self.recovery_cron = None
         self.process = None
+        self.log_sink = None
+        self.supervisor = None
+        # Held while the process is replaced, so a crash restart of the supervisor can't start a second one
+        self.lock = threading.RLock()
 
     def start(self):
-        log.info("Starting QMC node...")
-
-        process = subprocess.Popen(self.startup_args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-
-        log.info(f"QMC process ID: {process.pid}")
-        self.process = process
-        write_node_logs_thread = Thread(target=write_logs_node_to_file, args=())
-        write_node_logs_thread.start()
-
-        self.stop_event = threading.Event()
-        self.recovery_cron = Thread(target=validate_node_to_network_connection, args=())
-        self.recovery_cron.start()
-
-    def restart(self):
+        """
+        Starts a new node process, a crash restart scheduled by the supervisor is cancelled.
+        """
+        with self.lock:
+            log.info("Starting QMC node...")
+            if self.log_sink is None:
+                self.log_sink = NodeLogSink.from_config()
+                self.log_sink.start()
+            if self.supervisor is None:
+                self.supervisor = NodeSupervisor(self, check_node_health)
+                self.supervisor.start()
+
+            process = subprocess.Popen(self.startup_args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+
+            log.info(f"QMC process ID: {process.pid}")
+            self.supervisor.cancel_respawn()
+            self.process = process
+            self.log_sink.write(b"====================================================")
+            self.log_sink.write(b"=================== NODE STARTED ===================")
+            self.log_sink.write(b"====================================================\n")
+            self.supervisor.attach(process)
+
+    def restart(self, restart: Restart = None) -> Restart:
+        """
+        Stops the node, starts it again and waits until its RPC answers, the downtime is recorded in `restart`.
+        """
         log.info("Restarting QMC node...")
-        self.terminate()
-        time.sleep(10)
-        self.start()
+        if restart is None:
+            restart = Restart(uuid.uuid4().hex, requested_at=time.time())
+        stopped_at = time.monotonic()
+        with self.lock:
+            restart.state = "stopping"
+            self.terminate()
+            restart.state = "starting"
+            self.start()
+        restart.state = "waiting_for_rpc"
+        ready = self.wait_until_ready(common.config.config_service.config.node_ready_timeout)
+        restart.downtime = time.monotonic() - stopped_at
+        restart.state = "ready" if ready else "failed"
+        if not ready:
+            restart.error = "Node RPC didn't answer after the restart"
+        log.info(f"QMC node restart finished in {restart.downtime:.2f}s, state: {restart.state}")
+        return restart
+
+    def wait_until_ready(self, timeout) -> bool:
+        client = node_rpc.get_health_monitor().client
+        deadline = time.monotonic() + timeout
+        poll_interval = 0.1
+        while time.monotonic() < deadline:
+            if self.process is None or self.process.poll() is not None:
+                return False
+            try:
+                client.call("system_health")
+                return True
+            except NodeRpcError:
+                sleep(poll_interval)
+                poll_interval = min(poll_interval * 2, READY_POLL_MAX_INTERVAL)
+        return False
 
     def terminate(self):
+        """
+        Sends SIGTERM to the node and SIGKILL if it doesn't exit within the grace period.
+        """
         log.info("Terminating QMC node...")
-        self.stop_event.set()
-        self.process.terminate()
-        self.process = None
+        with self.lock:
+            process = self.process
+            self.process = None
+            self.supervisor.detach(process)
+            process.terminate()
+            try:
+                process.wait(common.config.config_service.config.node_stop_grace_period)
+            except subprocess.TimeoutExpired:
+                log.warning("QMC node didn't exit within the grace period, killing it")
+                process.kill()
+                process.wait()
 
 
 class NodeTest:
@@ -51,59 +129,104 @@ class NodeTest:
         log.info("Starting QMC node...")
         if common.file.psk_file_manager.exists():
             common.file.psk_file_manager.remove()
+        common.file.psk_state.invalidate()
 
-    def restart(self):
+    def restart(self, restart: Restart = None) -> Restart:
         log.info("Restarting QMC node...")
         if common.file.psk_file_manager.exists():
             common.file.psk_file_manager.remove()
+        common.file.psk_state.invalidate()
+        if restart is None:
+            restart = Restart(uuid.uuid4().hex, requested_at=time.time())
+        restart.state = "ready"
+        restart.downtime = 0
+        return restart
 
 
 class NodeService:
     def __init__(self, node):
         self.current_node = node
+        self.restarts = OrderedDict()
+        self.restarts_lock = threading.Lock()
+        self.current_restart = None
+        # The journaled psk the node was last restarted with, it's not tried again until the node gets peers
+        self.warm_restart_psk = None
+
+    def request_restart(self, after_restart=None) -> Restart:
+        """
+        Restarts the node in the background and returns the restart to poll.
+        While a restart is in progress, requesting another one returns it instead of starting a new one.
+        """
+        with self.restarts_lock:
+            if self.current_restart is not None and not self.current_restart.finished:
+                return self.current_restart
+            restart = Restart(uuid.uuid4().hex, requested_at=time.time())
+            self.restarts[restart.id] = restart
+            while len(self.restarts) > RESTART_HISTORY_SIZE:
+                self.restarts.popitem(last=False)
+            self.current_restart = restart
+
+        metrics.node_restarts_total.labels("requested").inc()
+        Thread(target=self.__restart, args=(restart, after_restart), daemon=True).start()
+        return restart
+
+    def get_restart(self, restart_id) -> Restart:
+        with self.restarts_lock:
+            return self.restarts.get(restart_id)
+
+    def __restart(self, restart, after_restart):
+        try:
+            self.current_node.restart(restart)
+            if after_restart is not None:
+                after_restart()
+        except Exception as e:
+            log.error(f"QMC node restart failed: {e}")
+            restart.state = "failed"
+            restart.error = str(e)
 
 
 node_service = NodeService(None)
 
 
-def write_logs_node_to_file():
-    with open(common.config.config_service.config.node_logs_path, 'a') as logfile:
-        logfile.write("====================================================")
-        logfile.write("=================== NODE STARTED ===================")
-        logfile.write("====================================================\n")
-        for line in node_service.current_node.process.stdout:
-            sys.stdout.write(str(line, 'utf-8'))
-            logfile.write(str(line, 'utf-8'))
-    node_service.current_node.process.wait()
-
-
-def validate_node_to_network_connection():
-    while not node_service.current_node.stop_event.is_set():
-        time.sleep(common.config.config_service.config.recovery_check_interval)
-        url = f"http://localhost:{common.config.config_service.config.node_http_rpc_port}"
-        data = {"id": 1, "jsonrpc": "2.0", "method": "system_peers", "params": []}
-        response = requests.post(url, json=data)
-        if response.status_code == 200:
-            text = response.json()
-            peers_count = text["result"]
-            if len(peers_count) == 0:
-                log.info("Restarting the node, because it lost connection to the network")
-                if common.file.psk_file_manager.exists():
-                    common.file.psk_file_manager.remove()
-                if common.file.psk_sig_file_manager.exists():
-                    common.file.psk_sig_file_manager.remove()
-
-                psk_obj = None
-                while psk_obj is None:
-                    psk_obj = pre_shared_key.get_psk_from_peers()
-                    sleep(10)
-                common.file.psk_file_manager.create(psk_obj.psk)
-                common.file.psk_sig_file_manager.create(psk_obj.signature)
-
-                node_service.current_node.restart()
-                break
+def check_node_health() -> bool:
+    """
+    Checks the node health once and requests a restart when the node lost the network, stopped answering
+    or stopped importing or finalizing blocks.
+    Returns whether a restart was requested.
+    """
+    health_monitor = node_rpc.get_health_monitor()
+    health = health_monitor.check()
+    if health.reachable and health.peers > 0 and not health.stalled:
+        node_service.warm_restart_psk = None
+    elif health.reachable and health.peers == 0:
+        epoch = common.file.psk_journal.last()
+        if epoch is not None and epoch.psk != node_service.warm_restart_psk:
+            log.info("Restarting the node with the last verified pre-shared key, because it lost connection "
+                     "to the network")
+            node_service.warm_restart_psk = epoch.psk
+            common.file.psk_state.update(epoch.psk, epoch.signature, epoch.block_number)
+            node_service.request_restart()
+            return True
+
+        log.info("Restarting the node, because it lost connection to the network")
+        common.file.psk_state.clear()
+
+        psk_obj = None
+        while psk_obj is None:
+            psk_obj = pre_shared_key.get_psk_from_peers()
+            sleep(10)
+        common.file.psk_state.update(psk_obj.psk, psk_obj.signature, psk_obj.block_number)
+        common.file.psk_journal.record(psk_obj.psk, psk_obj.signature, psk_obj.block_number, "peers")
+
+        node_service.request_restart()
+        return True
+    elif health_monitor.consecutive_failures >= common.config.config_service.config.node_health_failure_threshold:
+        if health.reachable:
+            log.info(f"Restarting the node, because its heads stalled, blocks: {health.blocks_stalled}, "
+                     f"finality: {health.finality_stalled}")
         else:
             log.info("Restarting the node, because it not answering RPC methods calls")
-            common.file.psk_sig_file_manager.remove()
-            common.file.psk_file_manager.remove()
-            node_service.current_node.restart()
+        common.file.psk_state.clear()
+        node_service.request_restart()
+        return True
+    return False
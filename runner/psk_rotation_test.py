@@ -82,6 +82,10 @@ def start_test():
                 os.remove(config.psk_file_path)
             if path.exists(config.psk_sig_file_path):
                 os.remove(config.psk_sig_file_path)
+            if path.exists(f"{config.psk_file_path}.journal"):
+                os.remove(f"{config.psk_file_path}.journal")
+            if path.exists(f"{config.psk_file_path}.record"):
+                os.remove(f"{config.psk_file_path}.record")
 
         log.info("Closing QMC processes...")
 
@@ -92,13 +96,15 @@ def start_test():
 
 
 def check_psk_rotation(signer_name, signer_config, block_number):
-    send_psk_rotation_request(signer_config.local_server_port, signer_config.local_peer_id, True, block_number)
-    sleep_until_file_exists(signer_config.psk_file_path)
+    job_id = send_psk_rotation_request(signer_config.local_server_port, signer_config.local_peer_id, True,
+                                       block_number)
+    wait_for_rotation_job(signer_config.local_server_port, job_id)
 
     for node_name, node_config in nodes:
         if node_config.local_peer_id in signer_config.peers:
-            send_psk_rotation_request(node_config.local_server_port, signer_config.local_peer_id, False, block_number)
-            sleep_until_file_exists(node_config.psk_file_path)
+            job_id = send_psk_rotation_request(node_config.local_server_port, signer_config.local_peer_id, False,
+                                               block_number)
+            wait_for_rotation_job(node_config.local_server_port, job_id)
 
     with open(signer_config.psk_file_path, 'r') as file:
         psk = file.read()
@@ -109,9 +115,9 @@ def check_psk_rotation(signer_name, signer_config, block_number):
     for node_name, node_config in nodes:
         if node_name != signer_name:
             if not path.exists(node_config.psk_file_path):
-                send_psk_rotation_request(node_config.local_server_port, signer_config.local_peer_id, False,
-                                          block_number)
-                sleep_until_file_exists(node_config.psk_file_path)
+                job_id = send_psk_rotation_request(node_config.local_server_port, signer_config.local_peer_id, False,
+                                                   block_number)
+                wait_for_rotation_job(node_config.local_server_port, job_id)
 
             with open(node_config.psk_file_path, 'r') as file:
                 psk_node = file.read()
@@ -135,7 +141,7 @@ def check_psk_rotation(signer_name, signer_config, block_number):
 def send_psk_rotation_request(runner_port, peer_id, is_local, block_number):
     url = f"http://localhost:{runner_port}/psk"
     data = {'peer_id': peer_id, 'is_local_peer': is_local, 'block_num': block_number}
-    requests.post(url, json=data)
+    return requests.post(url, json=data).json()["id"]
 
 
 def send_psk_restart_node(runner_port):
@@ -143,12 +149,11 @@ def send_psk_restart_node(runner_port):
     requests.get(url)
 
 
-def sleep_until_file_exists(file_path):
-    timestamp = time.time()
-    while not path.exists(file_path):
-        if time.time() - timestamp > 60:
-            raise ValueError(f"No file at {file_path} after 1 minute")
-        time.sleep(1)
+def wait_for_rotation_job(runner_port, job_id):
+    url = f"http://localhost:{runner_port}/psk/jobs/{job_id}?wait=60"
+    job = requests.get(url).json()
+    if job["state"] != "done":
+        raise ValueError(f"Rotation job {job_id} didn't finish: {job}")
 
 
 start_test()
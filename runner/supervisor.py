@@ -0,0 +1,231 @@
+import os
+import queue
+import selectors
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+
+import common.config
+from common import metrics
+from common.log_buffer import get_node_log_buffer
+from common.logger import log
+from core import node_rpc
+
+READ_SIZE = 64 * 1024
+MAX_PARTIAL_LINE = 64 * 1024
+
+
+class NodeSupervisor:
+    """
+    Watches the node process from a single thread: its exit through a pidfd, its output pipe
+    and the health check timer are all handled by one selector loop.
+    Health checks run on one long-lived worker, so starting and stopping the node never creates new threads.
+    A node which exits without being terminated is started again with exponential backoff.
+    """
+
+    def __init__(self, node, check_health):
+        self.node = node
+        self.check_health = check_health
+        self.selector = selectors.DefaultSelector()
+        self.commands = queue.SimpleQueue()
+        self.wake_reader, self.wake_writer = os.pipe()
+        os.set_blocking(self.wake_reader, False)
+        os.set_blocking(self.wake_writer, False)
+        self.selector.register(self.wake_reader, selectors.EVENT_READ, self.__drain_wakeups)
+        self.health_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="node-health")
+        self.health_check = None
+        self.next_health_check_at = None
+        self.process = None
+        self.process_started_at = None
+        self.pidfd = None
+        self.respawn_at = None
+        self.crash_restart_delay = common.config.config_service.config.node_crash_restart_min_delay
+        self.thread = None
+
+    def start(self):
+        node_rpc.get_health_monitor().on_wake = self.check_health_now
+        self.thread = Thread(target=self.__run, name="node-supervisor", daemon=True)
+        self.thread.start()
+
+    def attach(self, process):
+        self.__send("attach", process)
+
+    def detach(self, process):
+        """
+        Marks the exit of the process as expected, its remaining output is still read.
+        """
+        self.__send("detach", process)
+
+    def cancel_respawn(self):
+        """
+        Drops a scheduled crash restart, called with the lock of the node held.
+        """
+        self.respawn_at = None
+
+    def check_health_now(self):
+        self.__send("check_health", None)
+
+    def __send(self, command, process):
+        self.commands.put((command, process))
+        try:
+            os.write(self.wake_writer, b"\0")
+        except BlockingIOError:
+            pass
+
+    def __run(self):
+        while True:
+            events = self.selector.select(self.__next_timeout())
+            self.__run_commands()
+            for key, _mask in events:
+                if key.fileobj in self.selector.get_map():
+                    key.data(key)
+            self.__run_timers()
+
+    def __next_timeout(self):
+        deadlines = [deadline for deadline in (self.next_health_check_at, self.respawn_at) if deadline is not None]
+        if not deadlines:
+            return None
+        return max(min(deadlines) - time.monotonic(), 0)
+
+    def __drain_wakeups(self, _key):
+        try:
+            while os.read(self.wake_reader, READ_SIZE):
+                pass
+        except BlockingIOError:
+            pass
+
+    def __run_commands(self):
+        while True:
+            try:
+                command, process = self.commands.get_nowait()
+            except queue.Empty:
+                return
+            if command == "attach":
+                self.__attach(process)
+            elif command == "detach":
+                self.respawn_at = None
+                if process is self.process:
+                    self.__stop_watching_exit()
+                    self.process = None
+                    self.next_health_check_at = None
+            elif command == "check_health" and self.process is not None:
+                self.next_health_check_at = time.monotonic()
+
+    def __attach(self, process):
+        self.process = process
+        self.process_started_at = time.monotonic()
+        self.respawn_at = None
+        os.set_blocking(process.stdout.fileno(), False)
+        self.selector.register(process.stdout, selectors.EVENT_READ, OutputReader(self, process))
+        try:
+            self.pidfd = os.pidfd_open(process.pid)
+            self.selector.register(self.pidfd, selectors.EVENT_READ, self.__handle_exit)
+        except (AttributeError, OSError):
+            self.pidfd = None
+        node_rpc.get_health_monitor().reset()
+        self.next_health_check_at = time.monotonic() + node_rpc.get_health_monitor().interval
+
+    def __stop_watching_exit(self):
+        if self.pidfd is not None:
+            self.selector.unregister(self.pidfd)
+            os.close(self.pidfd)
+            self.pidfd = None
+
+    def __handle_exit(self, _key):
+        self.__stop_watching_exit()
+        self.__handle_crash(self.process)
+
+    def __handle_crash(self, process):
+        """
+        Schedules a new node process after one exited without being terminated.
+        """
+        return_code = process.wait()
+        config = common.config.config_service.config
+        if time.monotonic() - self.process_started_at >= config.node_crash_restart_max_delay:
+            self.crash_restart_delay = config.node_crash_restart_min_delay
+        log.warning(f"QMC node exited with code {return_code}, starting it again in {self.crash_restart_delay}s")
+        metrics.node_restarts_total.labels("crash").inc()
+        self.process = None
+        self.next_health_check_at = None
+        self.respawn_at = time.monotonic() + self.crash_restart_delay
+        self.crash_restart_delay = min(self.crash_restart_delay * 2, config.node_crash_restart_max_delay)
+
+    def __run_timers(self):
+        now = time.monotonic()
+        if self.respawn_at is not None and now >= self.respawn_at:
+            self.__respawn(now)
+
+        if self.health_check is not None and self.health_check.done():
+            error = self.health_check.exception()
+            if error is not None:
+                log.error(f"Node health check failed: {error}")
+            if error is None and self.health_check.result():
+                # A restart was requested, checks resume once the new process is attached
+                self.next_health_check_at = None
+            elif self.process is not None and self.next_health_check_at is None:
+                # A failed check is retried after the interval as well, so the monitoring never stops
+                self.next_health_check_at = now + node_rpc.get_health_monitor().interval
+            self.health_check = None
+
+        if self.health_check is None and self.next_health_check_at is not None and now >= self.next_health_check_at:
+            self.next_health_check_at = None
+            self.health_check = self.health_executor.submit(self.check_health)
+            self.health_check.add_done_callback(lambda _future: self.__send("health_checked", None))
+
+    def __respawn(self, now):
+        if not self.node.lock.acquire(blocking=False):
+            # The node is being restarted, it starts the new process itself
+            self.respawn_at = None
+            return
+        try:
+            if self.respawn_at is None:
+                return
+            self.respawn_at = None
+            self.node.start()
+        except OSError as e:
+            log.error(f"Couldn't start QMC node: {e}")
+            self.respawn_at = now + self.crash_restart_delay
+        finally:
+            self.node.lock.release()
+
+    def output_closed(self, process):
+        self.selector.unregister(process.stdout)
+        process.stdout.close()
+        if self.pidfd is None and process is self.process:
+            # Without a pidfd the end of the output is the only sign of the exit
+            self.__handle_crash(process)
+
+
+class OutputReader:
+    """
+    Splits the output of a node process into lines for the log sink and the in-memory log buffer.
+    """
+
+    def __init__(self, supervisor, process):
+        self.supervisor = supervisor
+        self.process = process
+        self.log_sink = supervisor.node.log_sink
+        self.log_buffer = get_node_log_buffer()
+        self.partial_line = b""
+
+    def __call__(self, key):
+        try:
+            data = os.read(key.fd, READ_SIZE)
+        except BlockingIOError:
+            return
+        if not data:
+            if self.partial_line:
+                self.__write_line(self.partial_line + b"\n")
+            self.supervisor.output_closed(self.process)
+            return
+
+        lines = (self.partial_line + data).splitlines(keepends=True)
+        self.partial_line = b""
+        if not lines[-1].endswith(b"\n") and len(lines[-1]) < MAX_PARTIAL_LINE:
+            self.partial_line = lines.pop()
+        for line in lines:
+            self.__write_line(line)
+
+    def __write_line(self, line):
+        self.log_sink.write(line)
+        self.log_buffer.append(line)
@@ -0,0 +1,131 @@
+import asyncio
+import sys
+import threading
+import time
+
+import pytest
+import requests
+
+from web.asgi import WsgiToAsgi, create_asgi_server
+from web.external_server import ExternalServerWrapper
+
+
+def call_asgi_app(app, path, query_string=b""):
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "query_string": query_string,
+        "headers": [(b"host", b"localhost")],
+        "server": ("localhost", 5002),
+        "client": ("127.0.0.1", 40000),
+    }
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    return messages
+
+
+def response_of(messages):
+    return messages[0], b"".join(message.get("body", b"") for message in messages[1:])
+
+
+def test_asgi_app_uses_flask_error_handlers():
+    app = WsgiToAsgi(ExternalServerWrapper().external_server, max_workers=2)
+
+    response_start, response_body = response_of(call_asgi_app(app, "/peer/unknown_peer/psk"))
+
+    assert response_start["status"] == 404
+    assert response_body == b'{"message": "Peer misconfigured"}'
+
+
+def test_asgi_app_returns_not_found_for_unknown_route():
+    app = WsgiToAsgi(ExternalServerWrapper().external_server, max_workers=2)
+
+    response_start, response_body = response_of(call_asgi_app(app, "/unknown"))
+
+    assert response_start["status"] == 404
+    assert response_body == b'{"error": "not found"}'
+
+
+def test_asgi_app_streams_chunks_as_they_are_produced():
+    def wsgi_app(environ, start_response):
+        start_response("200 OK", [("Content-Type", "text/plain")])
+        yield b"first"
+        yield b""
+        yield b"second"
+
+    messages = call_asgi_app(WsgiToAsgi(wsgi_app, max_workers=2), "/")
+
+    assert messages[0]["status"] == 200
+    assert [message["body"] for message in messages[1:]] == [b"first", b"second", b""]
+    assert [message.get("more_body", False) for message in messages[1:]] == [True, True, False]
+
+
+def test_asgi_app_returns_server_error_when_app_fails_before_first_chunk():
+    def wsgi_app(environ, start_response):
+        start_response("200 OK", [("Content-Type", "text/plain")])
+        raise RuntimeError("failed")
+        yield b"never sent"
+
+    response_start, response_body = response_of(call_asgi_app(WsgiToAsgi(wsgi_app, max_workers=2), "/"))
+
+    assert response_start["status"] == 500
+    assert response_body == b"Internal Server Error"
+
+
+def test_asgi_app_replaces_headers_on_error_before_first_chunk():
+    def wsgi_app(environ, start_response):
+        start_response("200 OK", [("Content-Type", "text/plain")])
+        try:
+            raise RuntimeError("failed")
+        except RuntimeError:
+            start_response("503 Service Unavailable", [("Content-Type", "text/plain")], sys.exc_info())
+        return [b"unavailable"]
+
+    response_start, response_body = response_of(call_asgi_app(WsgiToAsgi(wsgi_app, max_workers=2), "/"))
+
+    assert response_start["status"] == 503
+    assert response_body == b"unavailable"
+
+
+def test_asgi_app_reraises_error_after_headers_were_sent():
+    def wsgi_app(environ, start_response):
+        start_response("200 OK", [("Content-Type", "text/plain")])
+        yield b"partial"
+        try:
+            raise RuntimeError("failed")
+        except RuntimeError:
+            start_response("500 Internal Server Error", [("Content-Type", "text/plain")], sys.exc_info())
+
+    with pytest.raises(RuntimeError, match="failed"):
+        call_asgi_app(WsgiToAsgi(wsgi_app, max_workers=2), "/")
+
+
+def test_asgi_server_keeps_connection_alive_and_shuts_down_gracefully():
+    server = create_asgi_server(ExternalServerWrapper().external_server, "127.0.0.1", 0)
+    server_thread = threading.Thread(target=server.run)
+    server_thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+
+    with requests.Session() as session:
+        first = session.get(f"http://127.0.0.1:{port}/peer/unknown_peer/psk")
+        second = session.get(f"http://127.0.0.1:{port}/peer/unknown_peer/psk")
+
+    server.should_exit = True
+    server_thread.join(timeout=5)
+
+    assert first.status_code == 404
+    assert second.status_code == 404
+    assert first.headers.get("connection") != "close"
+    assert not server_thread.is_alive()
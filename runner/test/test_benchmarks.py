@@ -0,0 +1,19 @@
+from benchmarks.suite import benchmarks, compare, measure
+
+
+def report(**seconds):
+    return {"results": {name.replace("_", "."): {"seconds": value} for name, value in seconds.items()}}
+
+
+def test_compare_flags_benchmarks_slower_than_threshold():
+    baseline = report(crypto_sign=1.0, crypto_verify=1.0)
+    current = report(crypto_sign=1.3, crypto_verify=1.1, Psk_serialize=1.0)
+
+    assert compare(current, baseline, 0.2) == ["crypto.sign"]
+
+
+def test_measure_returns_time_per_call():
+    result = measure(benchmarks["onetimepad.encrypt"](None), 1)
+
+    assert 0 < result["seconds"] <= result["median"]
+    assert result["number"] > 0
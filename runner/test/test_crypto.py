@@ -1,5 +1,5 @@
 from common.crypto import base58_to_hex, base64_to_hex, sign, verify, to_public, to_public_from_peerid, is_hex, \
-    hex_to_base64
+    hex_to_base64, public_key_from_peerid
 
 
 def test_public_key_conversion():
@@ -9,6 +9,17 @@ def test_public_key_conversion():
     assert to_public(private_key) == to_public_from_peerid(peer_id)
 
 
+def test_public_key_from_peerid_is_decoded_once():
+    peer_id = "12D3KooWKzWKFojk7A1Hw23dpiQRbLs6HrXFf4EGLsN4oZ1WsWCc"
+    private_key = "df432c8e967aa21fdd287d3ea61fa85640a8309577f65b4ea78d49d514661654"
+    data = "18617dff4efef20450dd5eafc060fd85faacca13d95ace3bda0be32e4694fcd7".encode()
+
+    public_key = public_key_from_peerid(peer_id)
+
+    assert public_key_from_peerid(peer_id) is public_key
+    assert verify(data, sign(data, private_key), public_key)
+
+
 def test_signature_flow_successful():
     private_key = "168bcc3789d741afc6e3f422f03da05fd4877e3e5518681758043ed7734967e9"
     data = "18617dff4efef20450dd5eafc060fd85faacca13d95ace3bda0be32e4694fcd7".encode()
@@ -1,9 +1,12 @@
 from unittest.mock import patch
 
+import common.file
+
 import pytest
 
 from common import exceptions
 from core.onetimepad import encrypt
+from common.file import FileManager, PskJournal, PskRecordStore, PskState
 from web.external_server import get_psk, ExternalServerWrapper
 
 psk = "336d297b4a4ac1876cd2958e321d772804b033c63a0337a88edc6e8b285906df"
@@ -11,11 +14,8 @@ signature = ("17d1dc882d5ed8346be27a2529d046afe42b56825e374236ae0a80ad448086027e
              "c7e5718651d076b430e9100")
 
 
-@patch('common.file.psk_file_manager.exists', return_value=True)
-@patch('common.file.psk_sig_file_manager.exists', return_value=True)
-@patch('common.file.psk_file_manager.read', return_value=psk)
-@patch('common.file.psk_sig_file_manager.read', return_value=signature)
-def test_get_psk_success(psk_sig_read, psk_read, psk_sig_exists, psk_exists, requests_mock):
+@patch('common.file.psk_state.get', return_value=(psk, signature))
+def test_get_psk_success(psk_state_get, requests_mock):
     sig = ("17d1dc882d5ed8346be27a2529d046afe42b56825e374236ae0a80ad448086027e2b2982a2eb8f38221cf3aebc223c01b332101b1c7"
            "e5718651d076b430e9100")
     peer_id = "12D3KooWKzWKFojk7A1Hw23dpiQRbLs6HrXFf4EGLsN4oZ1WsWCc"
@@ -45,6 +45,60 @@ def test_get_psk_success(psk_sig_read, psk_read, psk_sig_exists, psk_exists, req
     }
 
 
+@pytest.fixture()
+def psk_files(tmp_path, monkeypatch):
+    journal = PskJournal(str(tmp_path / "psk.journal"), 4)
+    psk_state = PskState(FileManager(str(tmp_path / "psk")), FileManager(str(tmp_path / "psk_sig")), 0,
+                         PskRecordStore(str(tmp_path / "psk.record")))
+    monkeypatch.setattr(common.file, "psk_journal", journal)
+    monkeypatch.setattr(common.file, "psk_state", psk_state)
+    return journal, psk_state
+
+
+def test_get_psk_of_block_returns_journaled_psk(requests_mock, psk_files):
+    peer_id = "12D3KooWKzWKFojk7A1Hw23dpiQRbLs6HrXFf4EGLsN4oZ1WsWCc"
+    journal, psk_state = psk_files
+    journal.record(psk, signature, 7, "peers")
+    journal.record("00" * 32, "11" * 64, 8, "peers")
+    psk_state.update("00" * 32, "11" * 64, 8)
+    requests_mock.get("http://localhost:9182/api/v1/keys/Alice1SAE/enc_keys?size=256",
+                      json={"keys": [{"key_ID": "key_id", "key": "qV4XorklC1EbehIbsovSaRGlWhyw3jETpt/laDSr3BQ="}]})
+    client = ExternalServerWrapper().external_server.test_client()
+
+    resp = client.get(f"/peer/{peer_id}/psk?block_num=7")
+
+    assert resp.get_json()["key"] == encrypt(psk, "a95e17a2b9250b511b7a121bb28bd26911a55a1cb0de3113a6dfe56834abdc14")
+    assert resp.get_json()["signature"] == signature
+    assert client.get(f"/peer/{peer_id}/psk?block_num=6").status_code == 404
+
+
+def test_get_psk_of_block_falls_back_to_current_psk_without_block_number(requests_mock, psk_files):
+    peer_id = "12D3KooWKzWKFojk7A1Hw23dpiQRbLs6HrXFf4EGLsN4oZ1WsWCc"
+    _journal, psk_state = psk_files
+    # Taken from the peers at startup, the block number isn't known
+    psk_state.update(psk, signature)
+    requests_mock.get("http://localhost:9182/api/v1/keys/Alice1SAE/enc_keys?size=256",
+                      json={"keys": [{"key_ID": "key_id", "key": "qV4XorklC1EbehIbsovSaRGlWhyw3jETpt/laDSr3BQ="}]})
+    client = ExternalServerWrapper().external_server.test_client()
+
+    resp = client.get(f"/peer/{peer_id}/psk?block_num=7")
+
+    assert resp.status_code == 200
+    assert resp.get_json()["signature"] == signature
+
+
+def test_get_psk_of_block_falls_back_to_current_psk_of_that_block(requests_mock, psk_files):
+    peer_id = "12D3KooWKzWKFojk7A1Hw23dpiQRbLs6HrXFf4EGLsN4oZ1WsWCc"
+    _journal, psk_state = psk_files
+    psk_state.update(psk, signature, 7)
+    requests_mock.get("http://localhost:9182/api/v1/keys/Alice1SAE/enc_keys?size=256",
+                      json={"keys": [{"key_ID": "key_id", "key": "qV4XorklC1EbehIbsovSaRGlWhyw3jETpt/laDSr3BQ="}]})
+    client = ExternalServerWrapper().external_server.test_client()
+
+    assert client.get(f"/peer/{peer_id}/psk?block_num=7").get_json()["signature"] == signature
+    assert client.get(f"/peer/{peer_id}/psk?block_num=8").status_code == 404
+
+
 def test_get_psk_peer_config_missing():
     peer_id = "0000000000000000000000000000000000000000000000000"
 
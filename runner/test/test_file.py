@@ -1,8 +1,11 @@
+import errno
+import os
 import tempfile
+from unittest.mock import patch
 
 import pytest
 
-from common.file import FileManager
+from common.file import FileManager, PskJournal, PskRecord, PskRecordStore, PskState, write_atomically
 
 
 data = "test_data"
@@ -38,3 +41,245 @@ def test_remove_when_file_does_not_exist_throws_an_error(before_each):
         return
 
     raise Exception("File was not removed but didn't receive error")
+
+
+@pytest.fixture()
+def psk_state():
+    psk_file_manager = FileManager(f"{tempfile.gettempdir()}/test_psk")
+    psk_sig_file_manager = FileManager(f"{tempfile.gettempdir()}/test_psk_sig")
+    record_store = PskRecordStore(f"{tempfile.gettempdir()}/test_psk_record")
+    yield PskState(psk_file_manager, psk_sig_file_manager, check_interval=0, record_store=record_store)
+    for file_path in (psk_file_manager.file_path, psk_sig_file_manager.file_path, record_store.file_path):
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+
+def test_psk_state_returns_none_when_files_are_missing(psk_state):
+    assert psk_state.get() is None
+
+
+def test_psk_state_serves_updated_psk_without_reading_files(psk_state):
+    psk_state.update("psk", "signature")
+
+    with patch.object(psk_state.psk_file_manager, "read") as psk_read:
+        assert psk_state.get() == ("psk", "signature")
+        psk_read.assert_not_called()
+
+
+def test_psk_state_reloads_files_changed_outside_the_process(psk_state):
+    psk_state.update("psk", "signature")
+
+    with open(psk_state.psk_file_manager.file_path, "w") as file:
+        file.write("new_psk_from_outside")
+
+    assert psk_state.get() == ("new_psk_from_outside", "signature")
+
+
+def test_psk_state_notices_removed_files(psk_state):
+    psk_state.update("psk", "signature")
+
+    psk_state.psk_sig_file_manager.remove()
+
+    assert psk_state.get() is None
+
+
+def test_psk_state_checks_files_once_per_interval(psk_state):
+    psk_state.check_interval = 60
+    psk_state.update("psk", "signature")
+
+    psk_state.psk_sig_file_manager.remove()
+
+    assert psk_state.get() == ("psk", "signature")
+
+
+def test_psk_state_removes_signature(psk_state):
+    psk_state.update("psk", "signature")
+
+    assert psk_state.remove_signature() == "signature"
+
+    assert not psk_state.psk_sig_file_manager.exists()
+    assert psk_state.get() is None
+
+
+def test_psk_state_keeps_signature_written_after_the_removed_one(psk_state):
+    psk_state.update("psk", "signature")
+    psk_state.remove_signature()
+    psk_state.update("next_psk", "next_signature")
+
+    assert psk_state.remove_signature("signature") is None
+
+    assert psk_state.get() == ("next_psk", "next_signature")
+
+
+def test_psk_state_reads_psk_and_signature_from_one_record(psk_state):
+    psk_state.update("psk", "signature", 7)
+    reopened = PskState(psk_state.psk_file_manager, psk_state.psk_sig_file_manager, 0, psk_state.record_store)
+
+    with patch.object(psk_state.psk_file_manager, "read") as psk_read:
+        assert reopened.get() == ("psk", "signature")
+        psk_read.assert_not_called()
+    assert psk_state.record_store.read().block_number == 7
+    assert psk_state.psk_file_manager.read() == "psk"
+
+
+def test_psk_state_does_not_serve_torn_record(psk_state):
+    psk_state.update("psk", "signature")
+    with open(psk_state.record_store.file_path, "w") as file:
+        file.write('{"psk": "ps')
+    reopened = PskState(psk_state.psk_file_manager, psk_state.psk_sig_file_manager, 0, psk_state.record_store)
+
+    assert reopened.get() is None
+
+
+def test_psk_state_never_pairs_psk_with_signature_of_another_one_after_a_crash(psk_state):
+    psk_state.update("aaaa", "0000")
+    # The runner stopped after the record of the next psk was written, but before the separate files were
+    psk_state.record_store.write(PskRecord("bbbb", "1111", 2))
+    with open(psk_state.psk_file_manager.file_path, "w") as file:
+        file.write("bbbb")
+    reopened = PskState(psk_state.psk_file_manager, psk_state.psk_sig_file_manager, 0, psk_state.record_store)
+
+    assert reopened.get() == ("bbbb", "1111")
+
+
+def test_psk_state_writes_files_from_record(psk_state):
+    psk_state.update("aaaa", "0000")
+    psk_state.record_store.write(PskRecord("bbbb", "1111", 2))
+
+    psk_state.sync_files()
+
+    assert psk_state.psk_file_manager.read() == "bbbb"
+    assert psk_state.psk_sig_file_manager.read() == "1111"
+
+
+def test_psk_state_removes_signature_from_record(psk_state):
+    psk_state.update("psk", "signature", 7)
+
+    psk_state.remove_signature()
+    reopened = PskState(psk_state.psk_file_manager, psk_state.psk_sig_file_manager, 0, psk_state.record_store)
+
+    assert reopened.get() is None
+    record = psk_state.record_store.read()
+    assert (record.psk, record.signature, record.block_number) == ("psk", None, 7)
+
+
+def test_psk_state_clear_removes_record_and_files(psk_state):
+    psk_state.update("psk", "signature")
+
+    psk_state.clear()
+
+    assert psk_state.get() is None
+    assert not psk_state.record_store.exists()
+    assert not psk_state.psk_file_manager.exists()
+
+
+def test_psk_state_keeps_psk_file_provisioned_outside_the_runner(psk_state):
+    psk_state.update("psk", "signature", 7)
+    with open(psk_state.psk_file_manager.file_path, "w") as file:
+        file.write("provisioned_psk")
+
+    psk_state.sync_files()
+    reopened = PskState(psk_state.psk_file_manager, psk_state.psk_sig_file_manager, 0, psk_state.record_store)
+
+    assert psk_state.psk_file_manager.read() == "provisioned_psk"
+    assert psk_state.record_store.read().psk == "provisioned_psk"
+    assert reopened.get() == ("provisioned_psk", "signature")
+
+
+def test_psk_state_writes_files_in_place_when_they_cannot_be_replaced(psk_state):
+    psk_state.update("aaaa", "0000")
+    replace = os.replace
+    mounted_files = (psk_state.psk_file_manager.file_path, psk_state.psk_sig_file_manager.file_path)
+
+    def replace_unless_mounted(source, destination):
+        if destination in mounted_files:
+            raise OSError(errno.EBUSY, os.strerror(errno.EBUSY))
+        replace(source, destination)
+
+    with patch("os.replace", side_effect=replace_unless_mounted):
+        psk_state.update("bbbb", "1111", 2)
+    reopened = PskState(psk_state.psk_file_manager, psk_state.psk_sig_file_manager, 0, psk_state.record_store)
+
+    assert psk_state.psk_file_manager.read() == "bbbb"
+    assert psk_state.psk_sig_file_manager.read() == "1111"
+    assert psk_state.record_store.read().psk == "bbbb"
+    assert reopened.get() == ("bbbb", "1111")
+    assert not [name for name in os.listdir(tempfile.gettempdir()) if name.startswith("test_psk") and "tmp" in name]
+
+
+def test_psk_state_keeps_previous_psk_when_files_cannot_be_written(psk_state):
+    psk_state.update("aaaa", "0000", 1)
+
+    with patch.object(psk_state.psk_sig_file_manager, "create", side_effect=OSError(errno.ENOSPC, "No space")), \
+            pytest.raises(OSError):
+        psk_state.update("bbbb", "1111", 2)
+
+    assert psk_state.get() == ("aaaa", "0000")
+    psk_state.sync_files()
+    assert psk_state.psk_file_manager.read() == "aaaa"
+    assert psk_state.psk_sig_file_manager.read() == "0000"
+    assert psk_state.record_store.read().block_number == 1
+
+
+def test_write_atomically_leaves_no_temporary_files(tmp_path):
+    write_atomically(str(tmp_path / "file"), b"data")
+
+    assert os.listdir(tmp_path) == ["file"]
+
+
+def test_psk_journal_returns_last_recorded_psk_after_reopening(tmp_path):
+    journal_path = str(tmp_path / "psk.journal")
+    PskJournal(journal_path, 4).record("psk1", "sig1", 10, "peers")
+    PskJournal(journal_path, 4).record("psk2", "sig2", 20, "12D3KooWKzWKFojk7A1Hw23dpiQRbLs6HrXFf4EGLsN4oZ1WsWCc")
+
+    epoch = PskJournal(journal_path, 4).last()
+
+    assert (epoch.psk, epoch.signature, epoch.block_number) == ("psk2", "sig2", 20)
+    assert epoch.source == "12D3KooWKzWKFojk7A1Hw23dpiQRbLs6HrXFf4EGLsN4oZ1WsWCc"
+
+
+def test_psk_journal_skips_torn_records(tmp_path):
+    journal_path = tmp_path / "psk.journal"
+    PskJournal(str(journal_path), 4).record("psk1", "sig1", 10, "peers")
+    with open(journal_path, "a") as file:
+        file.write('1234abcd {"psk":"psk2","signa')
+
+    assert PskJournal(str(journal_path), 4).last().psk == "psk1"
+
+
+def test_psk_journal_is_compacted_to_max_entries(tmp_path):
+    journal_path = tmp_path / "psk.journal"
+    journal = PskJournal(str(journal_path), 2)
+
+    for i in range(4):
+        journal.record(f"psk{i}", f"sig{i}", i, "peers")
+
+    assert len(journal_path.read_text().splitlines()) == 2
+    assert PskJournal(str(journal_path), 2).last().psk == "psk3"
+    assert not (tmp_path / "psk.journal.tmp").exists()
+
+
+def test_psk_journal_finds_psk_by_block_after_reopening(tmp_path):
+    journal_path = str(tmp_path / "psk.journal")
+    journal = PskJournal(journal_path, 2)
+    for i in range(3):
+        journal.record(f"psk{i}", f"sig{i}", i, "peers")
+
+    reopened = PskJournal(journal_path, 2)
+
+    assert reopened.get(1).psk == "psk1"
+    assert reopened.get(2).psk == "psk2"
+    assert reopened.get(0) is None
+
+
+def test_psk_journal_drops_expired_psks_but_the_last(tmp_path):
+    journal = PskJournal(str(tmp_path / "psk.journal"), 4, max_age=60)
+    with patch("time.time", return_value=1000):
+        journal.record("psk1", "sig1", 1, "peers")
+        journal.record("psk2", "sig2", 2, "peers")
+
+    with patch("time.time", return_value=1100):
+        assert journal.get(1) is None
+        assert journal.get(2).psk == "psk2"
+        journal.record("psk3", "sig3", 3, "peers")
+        assert [epoch.psk for epoch in journal.epochs] == ["psk3"]
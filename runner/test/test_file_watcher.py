@@ -0,0 +1,90 @@
+import os
+import queue
+
+import pytest
+
+from common.file import FileManager, PskState, write_atomically
+from common.file_watcher import CREATED, DELETED, MODIFIED, InotifyFileWatcher, PollingFileWatcher
+
+
+def create_inotify_watcher():
+    try:
+        return InotifyFileWatcher()
+    except (OSError, AttributeError) as e:
+        pytest.skip(f"inotify isn't available: {e}")
+
+
+@pytest.fixture(params=["inotify", "polling"])
+def file_watcher(request):
+    watcher = create_inotify_watcher() if request.param == "inotify" else PollingFileWatcher(0.01)
+    watcher.start()
+    yield watcher
+    watcher.stop()
+
+
+def next_event(events, *accepted):
+    while True:
+        file_path, event = events.get(timeout=5)
+        if event in accepted:
+            return file_path
+
+
+def test_file_watcher_reports_created_modified_and_deleted_files(file_watcher, tmp_path):
+    file_path = str(tmp_path / "psk")
+    events = queue.SimpleQueue()
+    file_watcher.subscribe(file_path, lambda path, event: events.put((path, event)))
+
+    write_atomically(file_path, b"psk")
+    assert next_event(events, CREATED) == file_path
+
+    with open(file_path, "w") as file:
+        file.write("other psk")
+    assert next_event(events, MODIFIED) == file_path
+
+    os.remove(file_path)
+    assert next_event(events, DELETED) == file_path
+
+
+def test_file_watcher_ignores_other_files_in_directory(file_watcher, tmp_path):
+    events = queue.SimpleQueue()
+    file_watcher.subscribe(str(tmp_path / "psk"), lambda path, event: events.put((path, event)))
+
+    write_atomically(str(tmp_path / "other"), b"data")
+    write_atomically(str(tmp_path / "psk"), b"psk")
+
+    assert next_event(events, CREATED) == str(tmp_path / "psk")
+    assert events.empty()
+
+
+def test_watched_file_manager_is_read_again_only_after_change(file_watcher, tmp_path):
+    file_manager = FileManager(str(tmp_path / "node_key"))
+    file_manager.create("key")
+    file_manager.watch(file_watcher)
+    events = queue.SimpleQueue()
+    file_watcher.subscribe(file_manager.file_path, lambda path, event: events.put((path, event)))
+
+    assert file_manager.read() == "key"
+    # A file replaced by a rename is reported as created by inotify
+    write_atomically(file_manager.file_path, b"new key")
+    next_event(events, CREATED, MODIFIED)
+
+    assert file_manager.read() == "new key"
+    os.remove(file_manager.file_path)
+    next_event(events, DELETED)
+    assert not file_manager.exists()
+
+
+def test_watched_psk_state_is_checked_only_after_change(file_watcher, tmp_path):
+    psk_state = PskState(FileManager(str(tmp_path / "psk")), FileManager(str(tmp_path / "psk_sig")), 0)
+    psk_state.watch(file_watcher)
+    events = queue.SimpleQueue()
+    file_watcher.subscribe(psk_state.psk_sig_file_manager.file_path, lambda path, event: events.put((path, event)))
+    psk_state.update("psk", "signature")
+    next_event(events, CREATED)
+
+    assert psk_state.get() == ("psk", "signature")
+
+    os.remove(psk_state.psk_sig_file_manager.file_path)
+    next_event(events, DELETED)
+
+    assert psk_state.get() is None
@@ -0,0 +1,75 @@
+from core.qkd.etsi014 import ETSI014Provider
+from core.qkd.key_pool import EncKeyPool
+
+qkd_url = "http://correct.url"
+peer_id = "12D3KooWKzWKFojk7A1Hw23dpiQRbLs6HrXFf4EGLsN4oZ1WsWCc"
+
+
+def create_pool(low_watermark=0, high_watermark=4, batch_size=3, key_ttl=300, kme_reserve=10):
+    provider = ETSI014Provider({"url": qkd_url})
+    return EncKeyPool(peer_id, provider, low_watermark, high_watermark, batch_size, key_ttl, kme_reserve)
+
+
+def mock_kme(requests_mock, stored_key_count=100):
+    requests_mock.get(f"{qkd_url}/status", json={"stored_key_count": stored_key_count, "max_key_per_request": 128})
+
+    def enc_keys(request, _context):
+        number = int(request.qs["number"][0])
+        return {"keys": [{"key_ID": f"key_{i}", "key": "EjQ="} for i in range(number)]}
+
+    requests_mock.get(f"{qkd_url}/enc_keys", json=enc_keys)
+
+
+def test_refill_fetches_keys_in_batches_up_to_high_watermark(requests_mock):
+    mock_kme(requests_mock)
+    pool = create_pool()
+
+    pool.refill()
+
+    assert pool.depth() == 4
+    enc_keys_requests = [r for r in requests_mock.request_history if r.path.endswith("enc_keys")]
+    assert [r.qs["number"] for r in enc_keys_requests] == [["3"], ["1"]]
+
+
+def test_refill_leaves_reserve_in_kme(requests_mock):
+    mock_kme(requests_mock)
+    requests_mock.get(f"{qkd_url}/status", [{"json": {"stored_key_count": 12}}, {"json": {"stored_key_count": 10}}])
+    pool = create_pool()
+
+    pool.refill()
+
+    assert pool.depth() == 2
+
+
+def test_get_enc_key_serves_pooled_key_without_calling_kme(requests_mock):
+    mock_kme(requests_mock)
+    pool = create_pool()
+    pool.refill()
+    requests_mock.reset_mock()
+
+    key_id, qkd_key = pool.get_enc_key()
+
+    assert key_id == "key_0"
+    assert qkd_key == "1234"
+    assert pool.depth() == 3
+    assert requests_mock.call_count == 0
+
+
+def test_get_enc_key_fetches_key_directly_when_pool_is_empty(requests_mock):
+    requests_mock.get(f"{qkd_url}/enc_keys?size=256", json={"keys": [{"key_ID": "direct", "key": "EjQ="}]})
+    pool = create_pool()
+
+    key_id, qkd_key = pool.get_enc_key()
+
+    assert key_id == "direct"
+    assert qkd_key == "1234"
+
+
+def test_expired_keys_are_dropped(requests_mock):
+    mock_kme(requests_mock)
+    pool = create_pool()
+    pool.refill()
+
+    pool.key_ttl = -1
+
+    assert pool.depth() == 0
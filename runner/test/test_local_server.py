@@ -1,13 +1,24 @@
+import time
 from unittest import mock
 from unittest.mock import patch
 
 import pytest
 
+import common.config
+import common.file
+import common.log_buffer
+import common.profiler
 import node
+import web.local_server
 from common.crypto import sign
+from common.file import PskJournal, PskRecordStore
+from common.log_buffer import LogRingBuffer
+from common.profiler import SamplingProfiler
 from core.pre_shared_key import Psk
+from core.psk_candidates import PskCandidate
+from core.psk_rotation import RotationJob
 from node import NodeService, NodeTest
-from web.local_server import rotate_pre_shared_key
+from web.local_server import LocalServerWrapper, rotate_pre_shared_key
 
 psk = "c7ce4948991367f8f08c473f1bdf3a45945951eb4038f735a76e840d36c27b1a"
 block_number = 5
@@ -15,6 +26,15 @@ signature = sign(Psk(psk, block_number=block_number).serialize(),
                  "df432c8e967aa21fdd287d3ea61fa85640a8309577f65b4ea78d49d514661654").hex()
 
 
+@pytest.fixture(autouse=True)
+def psk_journal(tmp_path, monkeypatch):
+    journal = PskJournal(str(tmp_path / "psk.journal"), 4)
+    monkeypatch.setattr(common.file, "psk_journal", journal)
+    monkeypatch.setattr(common.file.psk_state, "record_store", PskRecordStore(str(tmp_path / "psk.record")))
+    monkeypatch.setattr(common.config.config_service.config, "psk_candidate_window", 0)
+    return journal
+
+
 @pytest.fixture()
 def before_each():
     node.node_service = node.node_service = NodeService(NodeTest())
@@ -43,6 +63,21 @@ def test_rotate_pre_shared_key_when_local_peer_is_chosen(psk_sig_remove, psk_sig
     psk_sig_create.assert_called_with(signature)
 
 
+@patch("core.pre_shared_key.generate_psk_from_qrng", return_value=psk)
+@patch('common.file.node_key_file_manager.read',
+       return_value="df432c8e967aa21fdd287d3ea61fa85640a8309577f65b4ea78d49d514661654")
+@patch('common.file.psk_file_manager.create')
+@patch('common.file.psk_sig_file_manager.create')
+def test_rotate_pre_shared_key_records_psk_in_journal(psk_sig_create, psk_create, node_key_read,
+                                                      generate_psk_from_qrng, psk_journal, before_each):
+    peer_id = "12D3KooWT1niMg9KUXFrcrworoNBmF9DTqaswSuDpdX8tBLjAvpW"
+
+    rotate_pre_shared_key({"is_local_peer": True, "peer_id": peer_id, "block_num": block_number})
+
+    epoch = psk_journal.last()
+    assert (epoch.psk, epoch.signature, epoch.block_number, epoch.source) == (psk, signature, block_number, peer_id)
+
+
 @patch("core.pre_shared_key.get_psk_from_peers", return_value=Psk(
     "c7ce4948991367f8f08c473f1bdf3a45945951eb4038f735a76e840d36c27b1a",
     signature="17d1dc882d5ed8346be27a2529d046afe42b56825e374236ae0a80ad448086027e2b2982a2eb8f38221cf3aebc223c01b332101b"
@@ -83,17 +118,184 @@ def test_rotate_pre_shared_key_when_other_peer_is_chosen_but_returns_none_for_th
     ]
 
 
-def test_rotate_pre_shared_key_missing_config():
-    body = {
-        "is_local_peer": True,
-    }
+@pytest.mark.parametrize("body", [
+    {"is_local_peer": True},
+    {"is_local_peer": False},
+    {"is_local_peer": "yes", "peer_id": "12D3KooWT1niMg9KUXFrcrworoNBmF9DTqaswSuDpdX8tBLjAvpW", "block_num": 5},
+    {"is_local_peer": True, "peer_id": "12D3KooWT1niMg9KUXFrcrworoNBmF9DTqaswSuDpdX8tBLjAvpW", "block_num": "5"},
+    ["is_local_peer", "peer_id", "block_num"],
+])
+@patch("web.local_server.get_rotation_scheduler")
+def test_rotate_pre_shared_key_missing_config(get_rotation_scheduler, body):
+    local_server = LocalServerWrapper().local_server
+
+    response = local_server.test_client().post("/psk", json=body)
 
-    response = rotate_pre_shared_key(body)
     assert response.status_code == 400
+    assert response.get_json() == {"message": "Bad request"}
+    get_rotation_scheduler.assert_not_called()
 
-    body = {
-        "is_local_peer": False,
-    }
 
-    response = rotate_pre_shared_key(body)
+@patch("web.local_server.get_rotation_scheduler")
+def test_rotate_pre_shared_key_rejects_body_which_is_not_json(get_rotation_scheduler):
+    response = LocalServerWrapper().local_server.test_client().post("/psk", data="block_num=5")
+
     assert response.status_code == 400
+    get_rotation_scheduler.assert_not_called()
+
+
+def test_get_node_logs_returns_tail_of_node_logs(monkeypatch):
+    node_log_buffer = LogRingBuffer(10)
+    for i in range(3):
+        node_log_buffer.append(f"line {i}\n".encode())
+    monkeypatch.setattr(common.log_buffer, "node_log_buffer", node_log_buffer)
+
+    response = LocalServerWrapper().local_server.test_client().get("/logs?tail=2")
+
+    assert response.status_code == 200
+    assert response.data == b"line 1\nline 2\n"
+
+
+def test_get_metrics_returns_prometheus_text():
+    response = LocalServerWrapper().local_server.test_client().get("/metrics")
+
+    assert response.status_code == 200
+    assert response.content_type.startswith("text/plain; version=0.0.4")
+    assert b"# TYPE qmc_node_restarts_total counter" in response.data
+
+
+def test_profiler_is_switched_on_and_off_at_runtime(monkeypatch):
+    sampling_profiler = SamplingProfiler(0.01)
+    monkeypatch.setattr(common.profiler, "profiler", sampling_profiler)
+    client = LocalServerWrapper().local_server.test_client()
+
+    assert client.get("/profiler/stacks").status_code == 409
+    response = client.post("/profiler", json={"enabled": True, "interval": 0.001})
+    assert response.status_code == 200
+    assert response.get_json()["enabled"]
+    assert sampling_profiler.interval == 0.001
+
+    sampling_profiler.stacks.update({"local:get_metrics;flask.py:dispatch": 2})
+    response = client.get("/profiler/stacks")
+    assert response.data == b"local:get_metrics;flask.py:dispatch 2\n"
+
+    response = client.post("/profiler", json={"enabled": False})
+    assert not response.get_json()["enabled"]
+    assert client.post("/profiler", json={"enabled": True, "interval": 0}).status_code == 400
+
+
+def test_stream_node_logs_follows_new_lines(monkeypatch):
+    node_log_buffer = LogRingBuffer(10)
+    node_log_buffer.append(b"old line\n")
+    monkeypatch.setattr(common.log_buffer, "node_log_buffer", node_log_buffer)
+
+    response = LocalServerWrapper().local_server.test_client().get("/logs/stream?tail=1", buffered=False)
+    stream = iter(response.response)
+    node_log_buffer.append(b"new line\n")
+
+    assert next(stream) == b"old line\n"
+    assert next(stream) == b"new line\n"
+    response.close()
+
+
+def test_restart_node_returns_restart_to_poll(before_each):
+    client = LocalServerWrapper().local_server.test_client()
+    common.file.psk_state.update(psk, signature)
+
+    response = client.get("/restart")
+    assert response.status_code == 200
+    assert not common.file.psk_sig_file_manager.exists()
+    restart_id = response.json["id"]
+
+    for _ in range(100):
+        restart = client.get(f"/restart/{restart_id}").json
+        if restart["state"] == "ready":
+            break
+        time.sleep(0.01)
+
+    assert restart["state"] == "ready"
+    assert restart["downtime"] == 0
+
+
+def test_get_restart_returns_not_found_for_unknown_id(before_each):
+    response = LocalServerWrapper().local_server.test_client().get("/restart/unknown")
+
+    assert response.status_code == 404
+
+
+@patch("core.pre_shared_key.get_psk_from_peers", return_value=None)
+def test_rotate_pre_shared_key_stops_when_job_is_cancelled(get_psk_from_peers, before_each):
+    job = RotationJob(block_number, "12D3KooWT1niMg9KUXFrcrworoNBmF9DTqaswSuDpdX8tBLjAvpW", False, 0, 0)
+    job.cancelled.set()
+
+    rotate_pre_shared_key({"is_local_peer": False, "peer_id": job.peer_id, "block_num": block_number}, job)
+
+    get_psk_from_peers.assert_not_called()
+
+
+@pytest.fixture()
+def rotation_scheduler(monkeypatch):
+    monkeypatch.setattr(web.local_server, "rotation_scheduler", None)
+
+
+@patch("core.pre_shared_key.generate_psk_from_qrng", return_value=psk)
+@patch('common.file.node_key_file_manager.read',
+       return_value="df432c8e967aa21fdd287d3ea61fa85640a8309577f65b4ea78d49d514661654")
+@patch('common.file.psk_file_manager.create')
+@patch('common.file.psk_sig_file_manager.create')
+def test_rotation_job_can_be_long_polled(psk_sig_create, psk_create, node_key_read, generate_psk_from_qrng,
+                                         rotation_scheduler, before_each):
+    client = LocalServerWrapper().local_server.test_client()
+    body = {"is_local_peer": True, "peer_id": "12D3KooWT1niMg9KUXFrcrworoNBmF9DTqaswSuDpdX8tBLjAvpW",
+            "block_num": block_number}
+
+    response = client.post("/psk", json=body)
+    assert response.status_code == 200
+    job = client.get(f"/psk/jobs/{response.json['id']}?wait=5").json
+
+    assert job["state"] == "done"
+    assert job["block_number"] == block_number
+    assert set(job["phases"]) == {"qrng", "sign", "write"}
+    assert job["error"] is None
+    psk_create.assert_called_with(psk)
+
+
+@patch("core.pre_shared_key.get_psk_from_peers", return_value=None)
+def test_rotation_job_reports_error(get_psk_from_peers, rotation_scheduler, monkeypatch, before_each):
+    monkeypatch.setattr(common.config.config_service.config, "psk_rotation_max_attempts", 1)
+    client = LocalServerWrapper().local_server.test_client()
+    body = {"is_local_peer": False, "peer_id": "12D3KooWT1niMg9KUXFrcrworoNBmF9DTqaswSuDpdX8tBLjAvpW",
+            "block_num": block_number}
+
+    job_id = client.post("/psk", json=body).json["id"]
+    job = client.get(f"/psk/jobs/{job_id}?wait=5").json
+
+    assert job["state"] == "failed"
+    assert job["attempts"] == 1
+    assert "fetch" in job["phases"]
+    assert job["error"] == "No psk after 1 attempts"
+
+
+def test_get_rotation_job_returns_not_found_for_unknown_id(rotation_scheduler, before_each):
+    response = LocalServerWrapper().local_server.test_client().get("/psk/jobs/unknown")
+
+    assert response.status_code == 404
+
+
+@patch("core.pre_shared_key.generate_psk_from_qrng")
+@patch("common.file.psk_file_manager.create")
+@patch("common.file.psk_sig_file_manager.create")
+def test_rotate_pre_shared_key_uses_prepared_candidate(psk_sig_create, psk_create, generate_psk_from_qrng,
+                                                       before_each):
+    candidates = mock.Mock()
+    candidates.take.return_value = PskCandidate(psk, block_number, signature)
+    body = {"is_local_peer": True, "peer_id": "12D3KooWT1niMg9KUXFrcrworoNBmF9DTqaswSuDpdX8tBLjAvpW",
+            "block_num": block_number}
+
+    with patch("core.psk_candidates.get_psk_candidates", return_value=candidates):
+        rotate_pre_shared_key(body)
+
+    candidates.take.assert_called_with(block_number)
+    generate_psk_from_qrng.assert_not_called()
+    psk_create.assert_called_with(psk)
+    psk_sig_create.assert_called_with(signature)
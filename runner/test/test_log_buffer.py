@@ -0,0 +1,47 @@
+from threading import Thread
+
+from common.log_buffer import LogRingBuffer
+
+
+def test_tail_returns_most_recent_lines():
+    buffer = LogRingBuffer(3)
+    for i in range(5):
+        buffer.append(f"line {i}\n".encode())
+
+    assert buffer.tail(2) == [b"line 3\n", b"line 4\n"]
+    assert buffer.tail(10) == [b"line 2\n", b"line 3\n", b"line 4\n"]
+    assert buffer.tail(0) == []
+
+
+def test_read_from_skips_lines_which_left_the_buffer():
+    buffer = LogRingBuffer(2)
+    for i in range(4):
+        buffer.append(f"line {i}\n".encode())
+
+    lines, next_sequence = buffer.read_from(0)
+
+    assert lines == [b"line 2\n", b"line 3\n"]
+    assert next_sequence == 4
+
+
+def test_read_from_returns_nothing_after_timeout():
+    buffer = LogRingBuffer(2)
+    buffer.append(b"line\n")
+
+    assert buffer.read_from(1, timeout=0.01) == ([], 1)
+
+
+def test_subscribers_share_appended_lines():
+    buffer = LogRingBuffer(10)
+    line = b"shared line\n"
+    results = []
+    subscribers = [Thread(target=lambda: results.append(buffer.read_from(0, timeout=5))) for _ in range(3)]
+    for subscriber in subscribers:
+        subscriber.start()
+
+    buffer.append(line)
+    for subscriber in subscribers:
+        subscriber.join()
+
+    assert len(results) == 3
+    assert all(lines[0] is line and next_sequence == 1 for lines, next_sequence in results)
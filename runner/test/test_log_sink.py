@@ -0,0 +1,67 @@
+import gzip
+import os
+import time
+
+from common.log_sink import NodeLogSink
+
+
+def test_lines_are_written_to_file(tmp_path):
+    log_path = tmp_path / "node.log"
+    sink = NodeLogSink(str(log_path), flush_interval=0.01, mirror_to_console=False)
+    sink.start()
+
+    sink.write(b"first line\n")
+    sink.write(b"second line\n")
+    sink.close()
+
+    assert log_path.read_bytes() == b"first line\nsecond line\n"
+
+
+def test_lines_are_mirrored_to_console(tmp_path, capfd):
+    sink = NodeLogSink(str(tmp_path / "node.log"), flush_interval=0.01)
+    sink.start()
+
+    sink.write(b"console line\n")
+    sink.close()
+
+    assert capfd.readouterr().out == "console line\n"
+
+
+def test_file_is_rotated_compressed_and_pruned(tmp_path):
+    log_path = tmp_path / "node.log"
+    sink = NodeLogSink(str(log_path), max_bytes=10, backup_count=2, compression="gzip", flush_interval=0.01,
+                       mirror_to_console=False)
+    sink.start()
+
+    for i in range(4):
+        sink.write(f"line number {i}\n".encode())
+        while not sink.lines.empty():
+            time.sleep(0.01)
+    sink.close()
+    __wait_for_rotated_files(tmp_path, 2)
+
+    rotated = sorted(name for name in os.listdir(tmp_path) if name != "node.log")
+    assert len(rotated) == 2
+    assert all(name.endswith(".gz") for name in rotated)
+    with gzip.open(tmp_path / rotated[-1]) as rotated_file:
+        assert rotated_file.read().endswith(b"line number 3\n")
+
+
+def test_lines_above_queue_size_are_dropped_and_counted(tmp_path):
+    log_path = tmp_path / "node.log"
+    sink = NodeLogSink(str(log_path), queue_size=2, flush_interval=0.01, mirror_to_console=False)
+
+    for i in range(5):
+        sink.write(f"line {i}\n".encode())
+    sink.start()
+    sink.close()
+
+    assert log_path.read_bytes() == b"... 3 node log lines dropped ...\nline 0\nline 1\n"
+
+
+def __wait_for_rotated_files(log_dir, count):
+    for _ in range(500):
+        names = os.listdir(log_dir)
+        if len(names) == count and all(name.endswith(".gz") for name in names):
+            return
+        time.sleep(0.01)
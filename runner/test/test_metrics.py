@@ -0,0 +1,69 @@
+import threading
+
+from common import metrics
+from common.metrics import Counter, Gauge, Histogram
+
+
+def test_counter_sums_increments_of_all_threads():
+    counter = Counter("test_counter_total", "Test counter", ("reason",))
+    child = counter.labels("crash")
+
+    threads = [threading.Thread(target=lambda: [child.inc() for _ in range(1000)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    child.inc(2)
+
+    assert child.value() == 4002
+    # Shards of the exited threads are folded in once and not counted again
+    assert child.value() == 4002
+    assert len(child.values.shards) == 1
+
+
+def test_shards_of_short_lived_threads_are_folded_in_without_collecting():
+    histogram = Histogram("test_short_lived_seconds", "Test histogram", ("peer",))
+    child = histogram.labels("alice")
+
+    for _ in range(2000):
+        thread = threading.Thread(target=child.observe, args=(0.01,))
+        thread.start()
+        thread.join()
+
+    assert len(child.values.shards) <= metrics.MIN_SHARDS_BEFORE_RETIRE
+    assert histogram.render()[-2] == 'test_short_lived_seconds_count{peer="alice"} 2000'
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("test_seconds", "Test histogram", ("peer",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.labels("alice").observe(value)
+
+    assert histogram.render() == [
+        "# HELP test_seconds Test histogram",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{peer="alice",le="0.1"} 2',
+        'test_seconds_bucket{peer="alice",le="1.0"} 3',
+        'test_seconds_bucket{peer="alice",le="+Inf"} 4',
+        'test_seconds_count{peer="alice"} 4',
+        'test_seconds_sum{peer="alice"} 2.65',
+    ]
+
+
+def test_gauge_renders_last_value():
+    gauge = Gauge("test_peers", "Test gauge")
+    gauge.set(3)
+    gauge.set(5)
+
+    assert gauge.render()[-1] == "test_peers 5"
+
+
+def test_label_values_are_escaped():
+    counter = Counter("test_escaped_total", "Test counter", ("peer",))
+    counter.labels('a"b\\c').inc()
+
+    assert counter.render()[-1] == 'test_escaped_total{peer="a\\"b\\\\c"} 1'
+
+
+def test_render_includes_runner_metrics():
+    assert "# TYPE qmc_psk_rotation_seconds histogram" in metrics.render()
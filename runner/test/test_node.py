@@ -0,0 +1,160 @@
+import subprocess
+import sys
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+import common.config
+import common.file
+import node
+from common.exceptions import NodeRpcError
+from common.file import PskJournal
+from core.node_rpc import NodeHealth
+from core.pre_shared_key import Psk
+from node import Node, NodeService, NodeTest
+
+IGNORE_SIGTERM = "import signal, time; signal.signal(signal.SIGTERM, signal.SIG_IGN); print(flush=True); time.sleep(60)"
+
+
+@pytest.fixture()
+def health_monitor():
+    monitor = mock.Mock()
+    with mock.patch("core.node_rpc.get_health_monitor", return_value=monitor):
+        yield monitor
+
+
+def create_node(args):
+    qmc_node = Node(args)
+    qmc_node.process = subprocess.Popen(args, stdout=subprocess.PIPE)
+    qmc_node.supervisor = mock.Mock()
+    return qmc_node
+
+
+def test_terminate_kills_node_after_grace_period(health_monitor, monkeypatch):
+    monkeypatch.setattr(common.config.config_service.config, "node_stop_grace_period", 0.2)
+    qmc_node = create_node([sys.executable, "-c", IGNORE_SIGTERM])
+    process = qmc_node.process
+    process.stdout.readline()
+
+    started_at = time.monotonic()
+    qmc_node.terminate()
+
+    assert time.monotonic() - started_at < 5
+    assert process.returncode == -9
+    qmc_node.supervisor.detach.assert_called_with(process)
+
+
+def test_terminate_returns_as_soon_as_node_exits(health_monitor, monkeypatch):
+    monkeypatch.setattr(common.config.config_service.config, "node_stop_grace_period", 30)
+    qmc_node = create_node([sys.executable, "-c", "import time; time.sleep(60)"])
+    process = qmc_node.process
+
+    started_at = time.monotonic()
+    qmc_node.terminate()
+
+    assert time.monotonic() - started_at < 5
+    assert process.returncode == -15
+
+
+def test_wait_until_ready_polls_node_rpc(health_monitor):
+    health_monitor.client.call.side_effect = [NodeRpcError("refused"), NodeRpcError("refused"), {"peers": 1}]
+    qmc_node = create_node([sys.executable, "-c", "import time; time.sleep(60)"])
+
+    assert qmc_node.wait_until_ready(5)
+    assert health_monitor.client.call.call_count == 3
+    qmc_node.process.kill()
+
+
+def test_wait_until_ready_fails_when_node_exits(health_monitor):
+    health_monitor.client.call.side_effect = NodeRpcError("refused")
+    qmc_node = create_node([sys.executable, "-c", "pass"])
+    qmc_node.process.wait()
+
+    assert not qmc_node.wait_until_ready(5)
+
+
+def test_request_restart_returns_restart_in_progress():
+    release = threading.Event()
+    node_service = NodeService(NodeTest())
+    node_service.current_node.restart = mock.Mock(side_effect=lambda restart: release.wait(5))
+
+    first = node_service.request_restart()
+    second = node_service.request_restart()
+    release.set()
+
+    assert first is second
+    assert node_service.get_restart(first.id) is first
+
+
+def test_node_not_answering_rpc_is_restarted_when_psk_files_are_missing(health_monitor, monkeypatch):
+    monkeypatch.setattr(common.config.config_service.config, "node_health_failure_threshold", 3)
+    health_monitor.check.return_value = mock.Mock(reachable=False, peers=0)
+    health_monitor.consecutive_failures = 3
+
+    with mock.patch("common.file.psk_sig_file_manager.exists", return_value=False), \
+            mock.patch("common.file.psk_file_manager.exists", return_value=False), \
+            mock.patch("node.node_service") as node_service:
+        assert node.check_node_health()
+
+    node_service.request_restart.assert_called()
+
+
+def test_node_with_peers_but_stalled_heads_is_restarted_at_threshold(health_monitor, monkeypatch):
+    monkeypatch.setattr(common.config.config_service.config, "node_health_failure_threshold", 3)
+    monkeypatch.setattr(common.file, "psk_state", mock.Mock())
+    health_monitor.check.return_value = NodeHealth(reachable=True, checked_at=0, peers=5, blocks_stalled=True)
+    node_service = NodeService(NodeTest())
+    node_service.warm_restart_psk = "psk1"
+    node_service.request_restart = mock.Mock()
+    monkeypatch.setattr(node, "node_service", node_service)
+
+    health_monitor.consecutive_failures = 2
+    assert not node.check_node_health()
+    assert node_service.warm_restart_psk == "psk1"
+
+    health_monitor.consecutive_failures = 3
+    assert node.check_node_health()
+    node_service.request_restart.assert_called_once()
+    common.file.psk_state.clear.assert_called_once()
+
+
+@pytest.fixture()
+def lost_network(health_monitor, tmp_path, monkeypatch):
+    health_monitor.check.return_value = mock.Mock(reachable=True, peers=0)
+    journal = PskJournal(str(tmp_path / "psk.journal"), 4)
+    monkeypatch.setattr(common.file, "psk_journal", journal)
+    monkeypatch.setattr(common.file, "psk_state", mock.Mock())
+    node_service = NodeService(NodeTest())
+    node_service.request_restart = mock.Mock()
+    monkeypatch.setattr(node, "node_service", node_service)
+    return journal, node_service
+
+
+@mock.patch("core.pre_shared_key.get_psk_from_peers")
+def test_lost_network_restarts_with_last_journaled_psk(get_psk_from_peers, lost_network):
+    journal, node_service = lost_network
+    journal.record("psk1", "sig1", 10, "peers")
+
+    assert node.check_node_health()
+
+    common.file.psk_state.update.assert_called_with("psk1", "sig1", 10)
+    node_service.request_restart.assert_called_once()
+    get_psk_from_peers.assert_not_called()
+
+
+@mock.patch("node.sleep")
+@mock.patch("core.pre_shared_key.get_psk_from_peers", return_value=Psk("psk2", signature="sig2"))
+def test_lost_network_fetches_psk_from_peers_when_journaled_psk_was_rejected(get_psk_from_peers, _sleep,
+                                                                             lost_network):
+    journal, node_service = lost_network
+    journal.record("psk1", "sig1", 10, "peers")
+    node_service.warm_restart_psk = "psk1"
+
+    with mock.patch("common.file.psk_file_manager"), mock.patch("common.file.psk_sig_file_manager"):
+        assert node.check_node_health()
+
+    get_psk_from_peers.assert_called_once()
+    common.file.psk_state.update.assert_called_with("psk2", "sig2", None)
+    assert journal.last().psk == "psk2"
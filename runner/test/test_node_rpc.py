@@ -0,0 +1,124 @@
+import json
+from unittest import mock
+
+import pytest
+
+from common.exceptions import NodeRpcError
+from core.node_rpc import NodeHealthMonitor, NodeRpcClient
+
+rpc_url = "http://localhost:9933"
+
+
+def mock_node(requests_mock, peers=None, is_syncing=False):
+    results = {
+        "system_peers": [{"peerId": "peer"}] if peers is None else peers,
+        "system_health": {"peers": 1, "isSyncing": is_syncing, "shouldHavePeers": True},
+        "chain_getHeader": {"number": "0x1a"},
+        "system_syncState": {"startingBlock": 0, "currentBlock": 26, "highestBlock": 30},
+    }
+
+    def batch(request, _context):
+        return [{"id": call["id"], "jsonrpc": "2.0", "result": results[call["method"]]} for call in request.json()]
+
+    requests_mock.post(rpc_url, json=batch)
+
+
+def create_monitor():
+    return NodeHealthMonitor(NodeRpcClient(rpc_url, 1), min_interval=5, max_interval=40)
+
+
+def test_batch_sends_all_calls_in_one_request(requests_mock):
+    mock_node(requests_mock)
+
+    results = NodeRpcClient(rpc_url, 1).batch([("system_peers", None), ("chain_getHeader", None)])
+
+    assert results == {"system_peers": [{"peerId": "peer"}], "chain_getHeader": {"number": "0x1a"}}
+    assert requests_mock.call_count == 1
+    assert [call["method"] for call in json.loads(requests_mock.last_request.text)] == ["system_peers",
+                                                                                        "chain_getHeader"]
+    assert requests_mock.last_request.timeout == 1
+
+
+def test_batch_raises_error_when_method_fails(requests_mock):
+    requests_mock.post(rpc_url, json=[{"id": 0, "jsonrpc": "2.0", "error": {"code": -32601}}])
+
+    with pytest.raises(NodeRpcError):
+        NodeRpcClient(rpc_url, 1).call("system_peers")
+
+
+def test_check_collects_node_health(requests_mock):
+    mock_node(requests_mock)
+    monitor = create_monitor()
+
+    health = monitor.check()
+
+    assert health.reachable
+    assert health.peers == 1
+    assert health.best_block == 26
+    assert health.highest_block == 30
+    assert not health.degraded
+    assert monitor.latest() == health
+
+
+def test_interval_drops_when_node_is_degraded_and_grows_when_healthy(requests_mock):
+    mock_node(requests_mock, is_syncing=True)
+    monitor = create_monitor()
+
+    monitor.check()
+    assert monitor.interval == 5
+
+    mock_node(requests_mock)
+    monitor.check()
+    assert monitor.interval == 10
+    monitor.check()
+    monitor.check()
+    monitor.check()
+    assert monitor.interval == 40
+
+
+def test_unreachable_node_counts_consecutive_failures(requests_mock):
+    requests_mock.post(rpc_url, status_code=500)
+    monitor = create_monitor()
+
+    monitor.check()
+    health = monitor.check()
+
+    assert not health.reachable
+    assert health.degraded
+    assert monitor.consecutive_failures == 2
+
+
+def test_check_reports_stalled_heads_as_degraded(requests_mock):
+    mock_node(requests_mock)
+    monitor = create_monitor()
+    monitor.head_subscription = mock.Mock(status=lambda: {"blocks_stalled": True, "finality_stalled": False})
+
+    health = monitor.check()
+
+    assert health.blocks_stalled
+    assert health.degraded
+    assert monitor.interval == 5
+
+
+def test_stalled_heads_count_as_consecutive_failures(requests_mock):
+    mock_node(requests_mock)
+    monitor = create_monitor()
+    status = {"blocks_stalled": False, "finality_stalled": True}
+    monitor.head_subscription = mock.Mock(status=lambda: status)
+
+    monitor.check()
+    monitor.check()
+    assert monitor.consecutive_failures == 2
+
+    status["finality_stalled"] = False
+    monitor.check()
+    assert monitor.consecutive_failures == 0
+
+
+def test_wake_asks_for_check():
+    monitor = create_monitor()
+    monitor.on_wake = mock.Mock()
+
+    monitor.wake()
+
+    monitor.on_wake.assert_called_once()
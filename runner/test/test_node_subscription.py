@@ -0,0 +1,100 @@
+import socket
+import time
+from threading import Event
+
+import pytest
+
+from core.node_subscription import HeadSubscriptionMonitor
+from web.node_ws_mock_server import NodeWsMockServerWrapper
+
+
+@pytest.fixture()
+def node_ws_server():
+    server = NodeWsMockServerWrapper(port=0, block_time=0.02)
+    server.start()
+    yield server
+    server.stop()
+
+
+def create_monitor(port, on_stall=None):
+    return HeadSubscriptionMonitor(f"ws://localhost:{port}", block_stall_timeout=0.3, finality_stall_timeout=0.3,
+                                   reconnect_max_interval=0.2, on_stall=on_stall, reconnect_min_interval=0.05)
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_monitor_follows_new_and_finalized_heads(node_ws_server):
+    monitor = create_monitor(node_ws_server.port)
+    monitor.start()
+
+    assert wait_until(lambda: (monitor.status()["finalized_block"] or 0) > 1)
+    status = monitor.status()
+    monitor.stop()
+
+    assert status["connected"]
+    assert status["best_block"] > status["finalized_block"]
+    assert not status["blocks_stalled"]
+    assert not status["finality_stalled"]
+
+
+def test_head_listeners_get_new_best_blocks(node_ws_server):
+    monitor = create_monitor(node_ws_server.port)
+    blocks = []
+    monitor.head_listeners.append(blocks.append)
+    monitor.start()
+
+    assert wait_until(lambda: len(blocks) >= 3)
+    monitor.stop()
+
+    assert blocks == sorted(blocks)
+
+
+def test_stalled_block_import_calls_on_stall(node_ws_server):
+    stalled = Event()
+    monitor = create_monitor(node_ws_server.port, on_stall=stalled.set)
+    monitor.start()
+    assert wait_until(lambda: monitor.status()["best_block"] is not None)
+
+    node_ws_server.blocks_stalled = True
+
+    assert stalled.wait(5)
+    assert monitor.status()["blocks_stalled"]
+    monitor.stop()
+
+
+def test_stalled_finality_calls_on_stall(node_ws_server):
+    stalled = Event()
+    monitor = create_monitor(node_ws_server.port, on_stall=stalled.set)
+    monitor.start()
+    assert wait_until(lambda: monitor.status()["finalized_block"] is not None)
+
+    node_ws_server.finality_stalled = True
+
+    assert stalled.wait(5)
+    status = monitor.status()
+    monitor.stop()
+    assert status["finality_stalled"]
+    assert not status["blocks_stalled"]
+
+
+def test_monitor_reconnects_when_server_comes_up():
+    with socket.socket() as free_socket:
+        free_socket.bind(("localhost", 0))
+        port = free_socket.getsockname()[1]
+    monitor = create_monitor(port)
+    monitor.start()
+    time.sleep(0.1)
+    assert not monitor.status()["connected"]
+
+    server = NodeWsMockServerWrapper(port=port, block_time=0.02)
+    server.start()
+    try:
+        assert wait_until(lambda: monitor.status()["best_block"] is not None)
+    finally:
+        monitor.stop()
+        server.stop()
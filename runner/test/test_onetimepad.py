@@ -1,6 +1,9 @@
+import os
+
+import onetimepad
 import pytest
 
-from core.onetimepad import encrypt, decrypt
+from core.onetimepad import encrypt, decrypt, xor_bytes, NUMPY_THRESHOLD
 
 
 def test_encrypt_decrypt_correct_lengths():
@@ -42,3 +45,39 @@ def test_non_hex_key():
     key = "a6c1g"
     with pytest.raises(ValueError, match="Key must be a hexadecimal string."):
         encrypt(text, key)
+
+
+@pytest.mark.parametrize("size", [1, 32, 4096])
+def test_encrypt_decrypt_match_onetimepad_package(size):
+    psk = os.urandom(size).hex()
+    qkd_key = os.urandom(size).hex().upper()
+
+    encrypted = encrypt(psk, qkd_key)
+
+    assert encrypted == onetimepad.encrypt(psk, qkd_key)
+    assert decrypt(encrypted, qkd_key) == onetimepad.decrypt(encrypted, qkd_key) == psk
+
+
+def test_decrypt_matches_onetimepad_package_when_key_is_shorter():
+    ciphertext = onetimepad.encrypt("f49d9ac6", "b5")
+
+    assert decrypt(ciphertext, "b5") == onetimepad.decrypt(ciphertext, "b5") == "f49d9ac6"
+
+
+def test_encrypt_decrypt_bytes():
+    data = os.urandom(32)
+    key = os.urandom(32)
+
+    encrypted = encrypt(data, key)
+
+    assert encrypted == bytes(x ^ y for x, y in zip(data, key))
+    assert decrypt(encrypted, key) == data
+
+
+def test_xor_bytes_with_numpy_for_large_buffers():
+    pytest.importorskip("numpy")
+    data = os.urandom(NUMPY_THRESHOLD)
+    key = os.urandom(NUMPY_THRESHOLD)
+
+    assert xor_bytes(memoryview(data), key) == (int.from_bytes(data, "big") ^ int.from_bytes(key, "big")).to_bytes(
+        NUMPY_THRESHOLD, "big")
@@ -0,0 +1,82 @@
+import time
+from threading import Event, Thread
+
+import pytest
+
+from common import profiler
+from common.profiler import SamplingProfiler
+
+
+@pytest.fixture()
+def sampling_profiler(monkeypatch):
+    sampling_profiler = SamplingProfiler(0.001)
+    monkeypatch.setattr(profiler, "profiler", sampling_profiler)
+    yield sampling_profiler
+    sampling_profiler.stop()
+
+
+def wait_for_samples(sampling_profiler, stack_part):
+    deadline = time.monotonic() + 5
+    while stack_part not in sampling_profiler.collapsed() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def profiled_work(stop):
+    stop.wait()
+
+
+def test_profiler_samples_only_profiled_threads(sampling_profiler):
+    sampling_profiler.start()
+    stop = Event()
+    wrapped = profiler.wrap(profiled_work, "local:work")
+    threads = [Thread(target=wrapped, args=(stop,)), Thread(target=profiled_work, args=(stop,))]
+    for thread in threads:
+        thread.start()
+
+    wait_for_samples(sampling_profiler, "profiled_work")
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    stacks = sampling_profiler.collapsed().splitlines()
+    assert stacks
+    assert all(stack.startswith("local:work;") for stack in stacks)
+    assert any("test_profiler.py:profiled_work;threading.py:wait" in stack for stack in stacks)
+    assert sampling_profiler.active == {}
+
+
+def test_profiler_does_nothing_until_started(sampling_profiler):
+    with profiler.profiled("rotation"):
+        assert sampling_profiler.active == {}
+
+    assert sampling_profiler.stats()["samples"] == 0
+
+
+def test_profiler_restores_outer_section(sampling_profiler):
+    sampling_profiler.start()
+
+    with profiler.profiled("rotation"):
+        with profiler.profiled("local:restart_node"):
+            assert list(sampling_profiler.active.values()) == ["local:restart_node"]
+        assert list(sampling_profiler.active.values()) == ["rotation"]
+    assert sampling_profiler.active == {}
+
+
+def test_profiler_returns_stacks_sampled_after_snapshot(sampling_profiler):
+    sampling_profiler.stacks.update({"rotation;a": 3})
+    since = sampling_profiler.snapshot()
+    sampling_profiler.stacks.update({"rotation;a": 2, "rotation;b": 1})
+
+    assert sampling_profiler.collapsed(since) == "rotation;a 2\nrotation;b 1\n"
+
+
+def test_profiler_reports_sampling_overhead(sampling_profiler):
+    sampling_profiler.start()
+    while sampling_profiler.stats()["samples"] < 3:
+        time.sleep(0.01)
+    sampling_profiler.stop()
+
+    stats = sampling_profiler.stats()
+    assert not stats["enabled"]
+    assert stats["sampling_time"] > 0
+    assert stats["overhead"] == 0.0
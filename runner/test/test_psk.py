@@ -1,7 +1,14 @@
+import threading
+import time
+from unittest.mock import patch
+
 import pytest
+import requests
 
 import common.config
-from core.pre_shared_key import get_psk_from_peers
+from common import crypto
+from core.pre_shared_key import get_psk_from_peers, Psk, PskVerifier, encode_psk, signing_payload, BINARY_ENCODING, \
+    PICKLE_ENCODING
 
 
 @pytest.fixture()
@@ -83,6 +90,9 @@ def test_get_psk_with_creator_id_returns_psk_when_one_key_is_valid(requests_mock
 
     result = get_psk_from_peers(block_number, peer_id)
 
+    assert all(request.qs.get("block_num") == [str(block_number)] for request in requests_mock.request_history
+               if request.path.endswith("/psk"))
+
     assert result.psk == expected_key
     assert result.signature == expected_signature
 
@@ -150,6 +160,68 @@ def test_get_psk_returns_none_when_peers_response_with_an_error(requests_mock):
     assert result is None
 
 
+def test_get_psk_with_creator_id_does_not_wait_for_slow_peers(requests_mock, before_each, monkeypatch):
+    encrypted_key = ("01040001520f54570802510f5d51540001015d005a04560d045455550b5052025a075201560154550552510e575d00055"
+                     "1520c5055050e030c0406005251555c")
+    expected_key = "d797492d1db79517ce899208aa3125739aa7227bce49491df0457f944a3be7c8"
+    expected_signature = ("1a8a170a4efffcb6b379fc9066aa61cbde42f78567442c3588ca699d70cde4f58f14710e2ae4bf3bd8f4df0527aa"
+                          "f244d43947db40ee0701e9cdf8597eaf5b02")
+    peer_id = "12D3KooWKzWKFojk7A1Hw23dpiQRbLs6HrXFf4EGLsN4oZ1WsWCc"
+    block_number = 1
+    monkeypatch.setattr(common.config.config_service.config, "psk_fetch_deadline", 5)
+    __create_alice_peer_response_mock(requests_mock, encrypted_key, expected_signature)
+    release_peer = __delay_peer_responses(monkeypatch, "http://localhost:5002", 2)
+    __create_bob_peer_response_mock(requests_mock, encrypted_key, expected_signature)
+
+    start = time.monotonic()
+    result = get_psk_from_peers(block_number, peer_id)
+
+    assert time.monotonic() - start < 1
+    assert result.psk == expected_key
+    assert result.signature == expected_signature
+    release_peer()
+
+
+def test_get_psk_without_creator_id_returns_psk_when_quorum_is_reached(requests_mock, before_each, monkeypatch):
+    encrypted_key = ("01040001520f54570802510f5d51540001015d005a04560d045455550b5052025a075201560154550552510e575d00055"
+                     "1520c5055050e030c0406005251555c")
+    expected_psk = "d797492d1db79517ce899208aa3125739aa7227bce49491df0457f944a3be7c8"
+    expected_signature = ("02cee86679916a597c8f74ee7def491de435a1c7f06abfb785ac4b156ddaba2ef32d89c8a5cbeb74d290e54a55c0"
+                          "f017b39166614ebc87009a43c123ee2db602")
+    block_number = 1
+    monkeypatch.setattr(common.config.config_service.config, "psk_fetch_quorum", 1)
+    __create_alice_peer_response_mock(requests_mock, encrypted_key, expected_signature)
+    release_peer = __delay_peer_responses(monkeypatch, "http://localhost:5002", 2)
+    __create_bob_peer_response_mock(requests_mock, encrypted_key, expected_signature)
+
+    start = time.monotonic()
+    result = get_psk_from_peers(block_number)
+
+    assert time.monotonic() - start < 1
+    assert result.psk == expected_psk
+    release_peer()
+
+
+def test_get_psk_without_creator_id_stops_waiting_at_deadline(requests_mock, before_each, monkeypatch):
+    encrypted_key = ("01040001520f54570802510f5d51540001015d005a04560d045455550b5052025a075201560154550552510e575d00055"
+                     "1520c5055050e030c0406005251555c")
+    expected_psk = "d797492d1db79517ce899208aa3125739aa7227bce49491df0457f944a3be7c8"
+    expected_signature = ("02cee86679916a597c8f74ee7def491de435a1c7f06abfb785ac4b156ddaba2ef32d89c8a5cbeb74d290e54a55c0"
+                          "f017b39166614ebc87009a43c123ee2db602")
+    block_number = 1
+    monkeypatch.setattr(common.config.config_service.config, "psk_fetch_deadline", 0.5)
+    __create_alice_peer_response_mock(requests_mock, encrypted_key, expected_signature)
+    release_peer = __delay_peer_responses(monkeypatch, "http://localhost:5002", 2)
+    __create_bob_peer_response_mock(requests_mock, encrypted_key, expected_signature)
+
+    start = time.monotonic()
+    result = get_psk_from_peers(block_number)
+
+    assert time.monotonic() - start < 1.5
+    assert result.psk == expected_psk
+    release_peer()
+
+
 def __create_alice_peer_response_mock(requests_mock, encrypted_key, signature):
     alice_server_addr = "http://localhost:5002"
     peers_response = {
@@ -172,3 +244,89 @@ def __create_bob_peer_response_mock(requests_mock, encrypted_key, signature):
 
     get_psk_url = f"{bob_server_addr}/peer/12D3KooWT1niMg9KUXFrcrworoNBmF9DTqaswSuDpdX8tBLjAvpW/psk"
     requests_mock.get(get_psk_url, json=peers_response)
+
+
+def __delay_peer_responses(monkeypatch, peer_addr, delay):
+    # requests_mock handles one request at a time, so the delay has to happen before it gets the request
+    get = requests.get
+    released = threading.Event()
+    delayed_threads = []
+
+    def delayed_get(url, *args, **kwargs):
+        if url.startswith(peer_addr):
+            delayed_threads.append(threading.current_thread())
+            released.wait(delay)
+        return get(url, *args, **kwargs)
+
+    def release():
+        released.set()
+        for thread in delayed_threads:
+            thread.join()
+
+    monkeypatch.setattr(requests, "get", delayed_get)
+    return release
+
+
+def test_psk_verifier_checks_each_distinct_signature_once(monkeypatch):
+    monkeypatch.setattr(common.config.config_service.config, "psk_encoding", "pickle")
+    monkeypatch.setattr(common.config.config_service.config, "psk_accept_legacy_encoding", False)
+    psk = "d797492d1db79517ce899208aa3125739aa7227bce49491df0457f944a3be7c8"
+    signature = ("1a8a170a4efffcb6b379fc9066aa61cbde42f78567442c3588ca699d70cde4f58f14710e2ae4bf3bd8f4df0527aaf244d4"
+                 "3947db40ee0701e9cdf8597eaf5b02")
+    verifier = PskVerifier(1, "12D3KooWKzWKFojk7A1Hw23dpiQRbLs6HrXFf4EGLsN4oZ1WsWCc")
+    candidates = [Psk(psk, signature=signature)] * 10 + [Psk(psk, signature="000000")] * 10
+
+    with patch("common.crypto.verify", wraps=crypto.verify) as verify:
+        verifier.verify_all(candidates)
+        results = [verifier.verify(candidate) for candidate in candidates]
+
+    assert results == [True] * 10 + [False] * 10
+    assert verify.call_count == 2
+
+
+def test_psk_verifier_treats_non_hex_signature_as_invalid():
+    verifier = PskVerifier(1, "12D3KooWKzWKFojk7A1Hw23dpiQRbLs6HrXFf4EGLsN4oZ1WsWCc")
+
+    assert not verifier.verify(Psk("d797492d1db79517ce899208aa3125739aa7227bce49491df0457f944a3be7c8",
+                                   signature="not a signature"))
+
+
+def test_binary_encoding_has_fixed_layout():
+    psk = "d797492d1db79517ce899208aa3125739aa7227bce49491df0457f944a3be7c8"
+
+    encoded = encode_psk(psk, 258)
+
+    assert encoded == bytes.fromhex("0101" + "0000000000000102" + "0020" + psk)
+
+
+def test_binary_encoding_round_trip():
+    psk = Psk("d797492d1db79517ce899208aa3125739aa7227bce49491df0457f944a3be7c8", block_number=7,
+              signature="1a8a170a4efffcb6b379fc9066aa61cbde42f78567442c3588ca699d70cde4f58f14710e2ae4bf3bd8f4df0527aaf2"
+                        "44d43947db40ee0701e9cdf8597eaf5b02")
+
+    assert Psk.deserialize(psk.serialize(BINARY_ENCODING)) == psk
+    assert Psk.deserialize(Psk(psk.psk).serialize(BINARY_ENCODING)) == Psk(psk.psk)
+
+
+def test_psk_verifier_accepts_legacy_encoding_only_when_enabled(monkeypatch):
+    private_key = "df432c8e967aa21fdd287d3ea61fa85640a8309577f65b4ea78d49d514661654"
+    peer_id = "12D3KooWKzWKFojk7A1Hw23dpiQRbLs6HrXFf4EGLsN4oZ1WsWCc"
+    psk = "d797492d1db79517ce899208aa3125739aa7227bce49491df0457f944a3be7c8"
+    binary_signature = crypto.sign(signing_payload(psk, 1, BINARY_ENCODING), private_key).hex()
+    pickle_signature = crypto.sign(signing_payload(psk, 1, PICKLE_ENCODING), private_key).hex()
+    monkeypatch.setattr(common.config.config_service.config, "psk_encoding", BINARY_ENCODING)
+
+    monkeypatch.setattr(common.config.config_service.config, "psk_accept_legacy_encoding", True)
+    assert PskVerifier(1, peer_id).verify(Psk(psk, signature=binary_signature))
+    assert PskVerifier(1, peer_id).verify(Psk(psk, signature=pickle_signature))
+
+    monkeypatch.setattr(common.config.config_service.config, "psk_accept_legacy_encoding", False)
+    assert PskVerifier(1, peer_id).verify(Psk(psk, signature=binary_signature))
+    assert not PskVerifier(1, peer_id).verify(Psk(psk, signature=pickle_signature))
+
+
+def test_psk_is_encoded_with_legacy_encoding_when_no_config_is_loaded(monkeypatch):
+    monkeypatch.setattr(common.config.config_service, "config", None)
+    psk = "d797492d1db79517ce899208aa3125739aa7227bce49491df0457f944a3be7c8"
+
+    assert Psk(psk, block_number=1).serialize() == signing_payload(psk, 1, PICKLE_ENCODING)
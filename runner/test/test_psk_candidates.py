@@ -0,0 +1,71 @@
+import threading
+from unittest import mock
+
+from core.psk_candidates import PskCandidates
+
+
+def create_candidates(window=3):
+    generated = iter(f"psk{index}" for index in range(100))
+    candidates = PskCandidates(lambda: next(generated), lambda psk, block: f"{psk}@{block}", window)
+    return candidates
+
+
+def test_psk_is_signed_for_upcoming_blocks():
+    candidates = create_candidates()
+
+    candidates.advance(10)
+    candidates.executor.shutdown(wait=True)
+
+    assert candidates.status() == {"prepared": True, "blocks": [10, 11, 12]}
+
+
+def test_taken_psk_is_not_handed_out_again():
+    candidates = create_candidates()
+    candidates.advance(10)
+    candidates.executor.submit(lambda: None).result()
+
+    candidate = candidates.take(11)
+    candidates.executor.submit(lambda: None).result()
+
+    assert (candidate.psk, candidate.signature) == ("psk0", "psk0@11")
+    assert candidates.take(11).psk == "psk1"
+
+
+def test_psk_is_signed_on_take_for_block_out_of_window():
+    candidates = create_candidates()
+    candidates.advance(10)
+    candidates.executor.submit(lambda: None).result()
+
+    assert candidates.take(50).signature == "psk0@50"
+
+
+def test_take_returns_none_when_nothing_is_prepared():
+    assert create_candidates().take(10) is None
+
+
+def test_signatures_of_passed_blocks_are_dropped():
+    candidates = create_candidates()
+    candidates.advance(10)
+    candidates.advance(12)
+    candidates.executor.shutdown(wait=True)
+
+    assert candidates.status()["blocks"] == [12, 13, 14]
+
+
+def test_psk_discarded_while_prepared_is_not_used():
+    signing = threading.Event()
+    release = threading.Event()
+
+    def sign(psk, block):
+        signing.set()
+        release.wait(5)
+        return f"{psk}@{block}"
+
+    candidates = PskCandidates(mock.Mock(return_value="psk0"), sign, 1)
+    candidates.advance(10)
+    signing.wait(5)
+    candidates.discard()
+    release.set()
+    candidates.executor.shutdown(wait=True)
+
+    assert candidates.take(10) is None
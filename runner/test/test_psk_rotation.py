@@ -0,0 +1,95 @@
+import time
+from threading import Event
+
+from core.psk_rotation import RotationScheduler
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def blocking_rotation(release: Event, written: list, scheduler_holder: list):
+    def rotate(job):
+        while not job.cancelled.is_set() and not release.is_set():
+            job.cancelled.wait(0.01)
+        scheduler_holder[0].commit(job, lambda: written.append(job.block_number))
+
+    return rotate
+
+
+def create_scheduler(rotate=None, max_attempts=0, time_budget=0):
+    release = Event()
+    written = []
+    holder = [None]
+    scheduler = RotationScheduler(rotate or blocking_rotation(release, written, holder), max_workers=2,
+                                  max_attempts=max_attempts, time_budget=time_budget)
+    holder[0] = scheduler
+    return scheduler, release, written
+
+
+def test_duplicate_requests_for_the_same_block_are_coalesced():
+    scheduler, release, written = create_scheduler()
+
+    first = scheduler.submit(10, "peer", False)
+    second = scheduler.submit(10, "peer", False)
+    release.set()
+
+    assert first is second
+    assert wait_until(lambda: first.state == "done")
+    assert written == [10]
+    assert scheduler.submit(10, "peer", False) is first
+
+
+def test_newer_block_cancels_older_rotation():
+    scheduler, release, written = create_scheduler()
+
+    older = scheduler.submit(10, "peer", False)
+    wait_until(lambda: older.state == "running")
+    newer = scheduler.submit(11, "peer", False)
+    release.set()
+
+    assert wait_until(lambda: older.finished and newer.finished)
+    assert older.state == "cancelled"
+    assert newer.state == "done"
+    assert written == [11]
+
+
+def test_request_for_older_block_is_cancelled_right_away():
+    scheduler, release, written = create_scheduler()
+    scheduler.submit(11, "peer", False)
+
+    older = scheduler.submit(10, "peer", False)
+    release.set()
+
+    assert older.state == "cancelled"
+
+
+def test_rotation_gives_up_after_max_attempts():
+    def rotate(job):
+        while job.next_attempt():
+            pass
+
+    scheduler, _release, _written = create_scheduler(rotate, max_attempts=3)
+
+    job = scheduler.submit(10, "peer", False)
+
+    assert wait_until(lambda: job.finished)
+    assert job.state == "failed"
+    assert job.attempts == 3
+
+
+def test_rotation_gives_up_after_time_budget():
+    def rotate(job):
+        while job.next_attempt():
+            time.sleep(0.01)
+
+    scheduler, _release, _written = create_scheduler(rotate, time_budget=0.1)
+
+    job = scheduler.submit(10, "peer", False)
+
+    assert wait_until(lambda: job.finished)
+    assert job.state == "failed"
+    assert "0.1s" in job.error
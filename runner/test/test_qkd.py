@@ -1,6 +1,10 @@
+from unittest.mock import patch
+
 from requests.exceptions import InvalidURL
 
 from core.qkd.etsi014 import ETSI014Provider
+from core.qkd.provider_factory import get_qkd_provider
+from core.qkd.session import MutualTLSAdapter
 
 
 def test_get_enc_key_http_success(requests_mock):
@@ -237,3 +241,35 @@ def test_get_dec_key_invalid_url(requests_mock):
         return
 
     raise Exception("Expected error, didn't receive one")
+
+
+def test_get_qkd_provider_reuses_provider_for_the_same_kme():
+    qkd_config = {
+        "provider": "etsi014",
+        "url": "http://correct.url",
+        "client_cert_path": None,
+        "cert_key_path": None,
+    }
+
+    provider = get_qkd_provider(qkd_config)
+
+    assert get_qkd_provider(dict(qkd_config)) is provider
+    assert get_qkd_provider(dict(qkd_config, url="http://other.url")) is not provider
+
+
+def test_mutual_tls_adapter_loads_client_certificate_once(tmp_path):
+    cert_path = tmp_path / "client.crt"
+    key_path = tmp_path / "client.key"
+    cert_path.touch()
+    key_path.touch()
+    adapter = MutualTLSAdapter()
+    conn = adapter.get_connection("https://correct.url")
+
+    with patch.object(adapter.ssl_context, "load_cert_chain") as load_cert_chain:
+        adapter.cert_verify(conn, "https://correct.url", False, (str(cert_path), str(key_path)))
+        adapter.cert_verify(conn, "https://correct.url", False, (str(cert_path), str(key_path)))
+
+    load_cert_chain.assert_called_once_with(str(cert_path), str(key_path))
+    assert conn.cert_file is None
+    assert conn.key_file is None
+    assert conn.conn_kw["ssl_context"] is adapter.ssl_context
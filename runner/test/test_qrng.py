@@ -1,30 +1,106 @@
-from core.qrng import generate_random_hex
+import threading
+import time
+from unittest.mock import patch
+
+import requests
+
+from core.qrng import EntropyPool
 import common.config
 
 
-url = f"https://qrng.qbck.io/{common.config.config_service.config.qrng_api_key}/qbck/block/hex?size=1&length=32"
+url = f"https://qrng.qbck.io/{common.config.config_service.config.qrng_api_key}/qbck/block/hex?size=2&length=32"
 
 
-def test_generate_random_hex_from_qrng(requests_mock):
-    expected_psk = "0xa9d6e6fd9b9fbdd2527b2b7919d0e19e2c5b64e9cb554760d8aa686c0131f282"
+def test_generate_random_bytes_from_qrng(requests_mock):
+    expected_psk = "a9d6e6fd9b9fbdd2527b2b7919d0e19e2c5b64e9cb554760d8aa686c0131f282"
+    next_psk = "0x18617dff4efef20450dd5eafc060fd85faacca13d95ace3bda0be32e4694fcd7"
     qrng_response = {
         "data": {
             "result": [
-                expected_psk
+                expected_psk,
+                next_psk
             ],
         }
     }
     requests_mock.get(url, json=qrng_response)
+    entropy_pool = EntropyPool(64, 0)
+    entropy_pool.refill()
+
+    result = entropy_pool.get_random_bytes(32)
+
+    assert result.hex() == expected_psk
+    assert entropy_pool.get_random_bytes(32).hex() == next_psk[2:]
+    assert entropy_pool.stats() == {"buffered_bytes": 0, "quantum_bytes": 64, "fallback_bytes": 0}
+
+
+def test_generate_random_bytes_from_local_entropy_when_qrng_fails(requests_mock):
+    requests_mock.get(url, json={}, status_code=500)
+    entropy_pool = EntropyPool(64, 0)
+    entropy_pool.refill()
+
+    result = entropy_pool.get_random_bytes(32)
+
+    assert len(result) == 32
+    assert entropy_pool.stats() == {"buffered_bytes": 0, "quantum_bytes": 0, "fallback_bytes": 32}
+
+
+def test_generate_random_bytes_refills_buffer_below_threshold(requests_mock):
+    qrng_response = {"data": {"result": ["00" * 32, "11" * 32]}}
+    requests_mock.get(url, json=qrng_response)
+    entropy_pool = EntropyPool(64, 32)
+    entropy_pool.refill()
 
-    result = generate_random_hex()
+    with patch.object(entropy_pool, "refill_async") as refill_async:
+        entropy_pool.get_random_bytes(16)
+        refill_async.assert_not_called()
 
-    assert result == expected_psk
+        entropy_pool.get_random_bytes(32)
+        refill_async.assert_called_once()
 
 
-def test_generate_random_hex_from_local_entropy_when_qrng_fails(requests_mock):
+def test_failed_refill_backs_off(requests_mock):
     requests_mock.get(url, json={}, status_code=500)
+    entropy_pool = EntropyPool(64, 64, retry_min_delay=60)
+
+    entropy_pool.get_random_bytes(32)
+    assert wait_until_refilled(entropy_pool)
+    entropy_pool.get_random_bytes(32)
+    entropy_pool.get_random_bytes(32)
+
+    assert requests_mock.call_count == 1
+    assert entropy_pool.retry_delay == 120
+
+
+def test_only_one_refill_is_in_flight():
+    release = threading.Event()
+    entropy_pool = EntropyPool(64, 64)
+
+    def slow_qrng(*_args, **_kwargs):
+        release.wait(5)
+        raise requests.exceptions.ConnectionError("unreachable")
+
+    with patch("core.qrng.requests.get", side_effect=slow_qrng) as get:
+        for _ in range(10):
+            entropy_pool.get_random_bytes(32)
+        release.set()
+        assert wait_until_refilled(entropy_pool)
+
+    assert get.call_count == 1
+    assert entropy_pool.stats()["fallback_bytes"] == 320
+
+
+def test_prime_waits_for_the_first_refill(requests_mock):
+    qrng_response = {"data": {"result": ["00" * 32, "11" * 32]}}
+    requests_mock.get(url, json=qrng_response)
+    entropy_pool = EntropyPool(64, 0)
+
+    assert entropy_pool.prime(5)
+
+    assert entropy_pool.stats()["buffered_bytes"] == 64
 
-    result = generate_random_hex()
 
-    assert len(result) == 64
-    assert int(result, 16)
+def wait_until_refilled(entropy_pool, timeout=5):
+    deadline = time.monotonic() + timeout
+    while entropy_pool.refilling and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return not entropy_pool.refilling
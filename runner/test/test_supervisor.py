@@ -0,0 +1,135 @@
+import sys
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+import common.config
+import common.log_buffer
+from common.log_buffer import LogRingBuffer
+from node import Node
+
+PRINT_AND_EXIT = "print('line 1'); print('line 2', end='')"
+PRINT_AND_SLEEP = "import time; print('started', flush=True); time.sleep(60)"
+
+
+@pytest.fixture()
+def node_environment(tmp_path, monkeypatch):
+    config = common.config.config_service.config
+    monkeypatch.setattr(config, "node_logs_path", str(tmp_path / "node.log"))
+    monkeypatch.setattr(config, "node_log_console", False)
+    monkeypatch.setattr(config, "node_crash_restart_min_delay", 0.05)
+    monkeypatch.setattr(config, "node_crash_restart_max_delay", 0.2)
+    monkeypatch.setattr(config, "node_stop_grace_period", 5)
+    log_buffer = LogRingBuffer(1000)
+    monkeypatch.setattr(common.log_buffer, "node_log_buffer", log_buffer)
+    health_monitor = mock.Mock(interval=60)
+    with mock.patch("core.node_rpc.get_health_monitor", return_value=health_monitor), \
+            mock.patch("node.check_node_health", return_value=False) as check_node_health:
+        yield log_buffer, health_monitor, check_node_health
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_node_output_is_split_into_lines(node_environment):
+    log_buffer, _health_monitor, _check_node_health = node_environment
+    # Both lines are written at once, so the node can't be terminated before the partial line is written
+    node = Node([sys.executable, "-c",
+                 "import sys, time; sys.stdout.write('line 1\\nline 2'); sys.stdout.flush(); time.sleep(60)"])
+    node.start()
+
+    assert wait_until(lambda: len(log_buffer.tail(2)) == 1)
+    node.terminate()
+    assert wait_until(lambda: len(log_buffer.tail(2)) == 2)
+    assert log_buffer.tail(2) == [b"line 1\n", b"line 2\n"]
+
+
+def test_crashed_node_is_started_again_with_backoff(node_environment):
+    node = Node([sys.executable, "-c", PRINT_AND_EXIT])
+    starts = []
+    start = node.start
+    node.start = lambda: (starts.append(time.monotonic()), start())
+    node.start()
+
+    assert wait_until(lambda: len(starts) >= 4)
+    node.start = lambda: None
+    delays = [later - earlier for earlier, later in zip(starts, starts[1:])]
+    assert delays[0] >= 0.05
+    assert delays[1] >= 0.1
+
+
+def test_terminated_node_is_not_started_again(node_environment):
+    node = Node([sys.executable, "-c", PRINT_AND_SLEEP])
+    node.start()
+    process = node.process
+
+    node.terminate()
+    time.sleep(0.3)
+
+    assert process.returncode is not None
+    assert node.process is None
+
+
+def test_crash_restart_is_dropped_while_node_is_restarted(node_environment):
+    node = Node([sys.executable, "-c", PRINT_AND_SLEEP])
+    starts = []
+    start = node.start
+    node.start = lambda: (starts.append(time.monotonic()), start())
+    node.start()
+    crashed = node.process
+
+    with node.lock:
+        crashed.kill()
+        # The crash restart is due while the restart holds the node
+        time.sleep(0.3)
+        node.terminate()
+        node.start()
+    time.sleep(0.3)
+
+    assert len(starts) == 2
+    assert node.process.poll() is None
+    assert node.supervisor.respawn_at is None
+    node.terminate()
+
+
+def test_health_check_runs_when_woken(node_environment):
+    _log_buffer, health_monitor, check_node_health = node_environment
+    node = Node([sys.executable, "-c", PRINT_AND_SLEEP])
+    node.start()
+
+    wait_until(lambda: health_monitor.on_wake is not None)
+    node.supervisor.check_health_now()
+
+    assert wait_until(lambda: check_node_health.called)
+    node.terminate()
+
+
+def test_health_check_is_scheduled_again_after_it_raised(node_environment):
+    _log_buffer, health_monitor, check_node_health = node_environment
+    health_monitor.interval = 0.05
+    check_node_health.side_effect = FileNotFoundError
+    node = Node([sys.executable, "-c", PRINT_AND_SLEEP])
+    node.start()
+
+    assert wait_until(lambda: check_node_health.call_count >= 2)
+    node.terminate()
+
+
+def test_thread_count_stays_flat_across_restarts(node_environment):
+    node = Node([sys.executable, "-c", PRINT_AND_SLEEP])
+    node.start()
+    node.terminate()
+    # Threads of other tests may exit meanwhile, only new threads are a leak
+    threads = set(threading.enumerate())
+
+    for _ in range(20):
+        node.start()
+        node.terminate()
+
+    assert set(threading.enumerate()) <= threads
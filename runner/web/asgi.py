@@ -0,0 +1,155 @@
+import asyncio
+import io
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import uvicorn
+
+import common.config
+from common.logger import log
+
+
+class WsgiToAsgi:
+    """
+    Serves a WSGI application to an ASGI server.
+    The application is called from a bounded thread pool, so the number of threads doesn't grow with connections.
+    """
+
+    def __init__(self, wsgi_app, max_workers):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="asgi-handler")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.__handle_lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self.__handle_http(scope, receive, send)
+
+    async def __handle_lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def __handle_http(self, scope, receive, send):
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body.extend(message.get("body", b""))
+            if not message.get("more_body", False):
+                break
+
+        environ = build_environ(scope, bytes(body))
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self.executor, self.__call_wsgi_app, environ, loop, send)
+
+    def __call_wsgi_app(self, environ, loop, send):
+        """
+        Runs the application in a worker and streams every chunk through the event loop as it is produced.
+        The headers are sent with the first non-empty chunk, so an error before that still becomes a 500.
+        """
+        response_start = {}
+        headers_sent = False
+
+        def send_from_worker(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info:
+                try:
+                    if headers_sent:
+                        raise exc_info[1].with_traceback(exc_info[2])
+                finally:
+                    exc_info = None
+            elif response_start:
+                raise AssertionError("start_response called twice without exc_info")
+            response_start["status"] = int(status.split(" ", 1)[0])
+            response_start["headers"] = [(name.lower().encode("latin1"), value.encode("latin1"))
+                                         for name, value in headers]
+            return write
+
+        def write(chunk):
+            nonlocal headers_sent
+            if not headers_sent:
+                send_from_worker({"type": "http.response.start", **response_start})
+                headers_sent = True
+            if chunk:
+                send_from_worker({"type": "http.response.body", "body": chunk, "more_body": True})
+
+        try:
+            response = self.wsgi_app(environ, start_response)
+            try:
+                for chunk in response:
+                    if chunk:
+                        write(chunk)
+                write(b"")
+            finally:
+                if hasattr(response, "close"):
+                    response.close()
+        except Exception:
+            if headers_sent:
+                raise
+            log.exception("WSGI application failed before sending the response headers")
+            send_from_worker({"type": "http.response.start", "status": 500,
+                              "headers": [(b"content-type", b"text/plain")]})
+            send_from_worker({"type": "http.response.body", "body": b"Internal Server Error"})
+            return
+        send_from_worker({"type": "http.response.body", "body": b""})
+
+
+def build_environ(scope, body: bytes) -> dict:
+    server_host, server_port = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf8").decode("latin1"),
+        "PATH_INFO": scope["path"].encode("utf8").decode("latin1"),
+        "QUERY_STRING": scope["query_string"].decode("latin1"),
+        "SERVER_NAME": server_host,
+        "SERVER_PORT": str(server_port),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"], environ["REMOTE_PORT"] = scope["client"][0], str(scope["client"][1])
+
+    for name, value in scope["headers"]:
+        name = name.decode("latin1").upper().replace("-", "_")
+        value = value.decode("latin1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name != "CONTENT_LENGTH":
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def create_asgi_server(wsgi_app, host, port) -> uvicorn.Server:
+    """
+    Creates an embedded asyncio server with keep-alive, a connection limit and graceful shutdown.
+    """
+    config = common.config.config_service.config
+    server_config = uvicorn.Config(
+        WsgiToAsgi(wsgi_app, config.asgi_workers),
+        host=host,
+        port=port,
+        lifespan="on",
+        limit_concurrency=config.asgi_max_connections,
+        timeout_keep_alive=config.asgi_keep_alive_timeout,
+        timeout_graceful_shutdown=config.asgi_graceful_shutdown_timeout,
+        log_config=None,
+        access_log=False,
+    )
+    return uvicorn.Server(server_config)
@@ -1,11 +1,12 @@
-from flask import Flask, jsonify
+from flask import Flask, jsonify, request
 
 import common.config
 import common.file
-from common import exceptions
+from common import exceptions, profiler
 from common.logger import log
 from core import onetimepad
-from core.qkd.provider_factory import get_qkd_provider
+from core.qkd import key_pool
+from web.asgi import create_asgi_server
 from web.error_handler import init_error_handlers
 
 
@@ -13,34 +14,58 @@ class ExternalServerWrapper:
 
     def __init__(self):
         self.external_server = Flask(__name__)
+        self.asgi_server = None
         init_error_handlers(self.external_server)
-        self.add_endpoint('/peer/<peer_id>/psk', 'get_psk', get_psk, methods=['GET'])
+        self.add_endpoint('/peer/<peer_id>/psk', 'get_psk', get_requested_psk, methods=['GET'])
 
     def add_endpoint(self, endpoint=None, endpoint_name=None, handler=None, methods=None, *args, **kwargs):
         if methods is None:
             methods = ['GET']
+        handler = profiler.wrap(handler, f"external:{endpoint_name}")
         self.external_server.add_url_rule(endpoint, endpoint_name, handler, methods=methods, *args, **kwargs)
 
     def run(self):
-        self.external_server.run("0.0.0.0", common.config.config_service.config.external_server_port, False)
+        config = common.config.config_service.config
+        if config.external_server_mode == "flask":
+            self.external_server.run("0.0.0.0", config.external_server_port, False)
+        else:
+            self.asgi_server = create_asgi_server(self.external_server, "0.0.0.0", config.external_server_port)
+            self.asgi_server.run()
+
+    def stop(self):
+        if self.asgi_server is not None:
+            self.asgi_server.should_exit = True
+
+
+def get_requested_psk(peer_id):
+    return get_psk(peer_id, request.args.get("block_num", type=int))
 
 
 # TODO add peer authorizationS
-def get_psk(peer_id):
+def get_psk(peer_id, block_number: int = None):
+    """
+    Returns the current psk, or the one of the block when it's given, encrypted with a QKD key of the peer.
+    """
     log.info(f"Fetching psk for peer with id: {peer_id}...")
     peer_config = common.config.config_service.config.peers.get(peer_id)
     if peer_config is None or peer_config["qkd"] is None:
         log.warning(f"Peer with id = {peer_id} is not configured")
         raise exceptions.PeerMisconfiguredError
 
-    if not common.file.psk_file_manager.exists() or not common.file.psk_sig_file_manager.exists():
-        log.warning("Couldn't find psk or signature file")
-        raise exceptions.PSKNotFoundError
+    if block_number is not None:
+        block_psk = __get_psk_of_block(block_number)
+        if block_psk is None:
+            log.warning(f"Couldn't find psk of block {block_number}")
+            raise exceptions.PSKNotFoundError
+        psk, psk_sig = block_psk
+    else:
+        current_psk = common.file.psk_state.get()
+        if current_psk is None:
+            log.warning("Couldn't find psk or signature file")
+            raise exceptions.PSKNotFoundError
+        psk, psk_sig = current_psk
 
-    psk = common.file.psk_file_manager.read()
-    psk_sig = common.file.psk_sig_file_manager.read()
-    qkd_provider = get_qkd_provider(peer_config['qkd'])
-    key_id, qkd_key = qkd_provider.get_enc_key()
+    key_id, qkd_key = key_pool.get_enc_key(peer_id, peer_config['qkd'])
     xored_psk = onetimepad.encrypt(psk, qkd_key)
 
     return jsonify({
@@ -48,3 +73,15 @@ def get_psk(peer_id):
         "key_id": key_id,
         "signature": psk_sig
     })
+
+
+def __get_psk_of_block(block_number: int):
+    epoch = common.file.psk_journal.get(block_number)
+    if epoch is not None:
+        return epoch.psk, epoch.signature
+    # PSKs taken from the peers at startup aren't journaled with a block number, the current one is served then
+    # and the signature check of the requesting peer rejects it when it's of another block
+    record = common.file.psk_state.get_record()
+    if record is not None and record.block_number is not None and record.block_number != block_number:
+        return None
+    return common.file.psk_state.get()
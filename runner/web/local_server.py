@@ -1,19 +1,24 @@
-from threading import Thread
+from contextlib import nullcontext
+from threading import Lock
 from time import sleep
 
 import node
-from flask import Flask, request, make_response, Response
-from core import pre_shared_key
+from flask import Flask, request, Response, jsonify
+from core import node_rpc, pre_shared_key, psk_candidates, qrng
+from core.psk_rotation import RotationJob, RotationScheduler
 from common.logger import log
-from common import crypto
-import json
+from common import crypto, log_buffer, metrics, profiler
 import common.config
 import common.file
-from core.pre_shared_key import Psk
+from core.qkd import key_pool
 from web.error_handler import init_error_handlers
 
 
 GET_PSK_WAITING_TIME = 1
+MAX_JOB_WAIT = 60
+DEFAULT_LOGS_TAIL = 100
+LOGS_STREAM_WAIT_TIMEOUT = 15
+MAX_PROFILE_WINDOW = 60
 
 
 class LocalServerWrapper:
@@ -21,55 +26,237 @@ class LocalServerWrapper:
     def __init__(self):
         self.local_server = Flask(__name__)
         init_error_handlers(self.local_server)
-        self.add_endpoint('/psk', 'rotate_pre_shared_key', start_thread_with_rotate_pre_shared_key, methods=['POST'])
+        self.add_endpoint('/psk', 'rotate_pre_shared_key', schedule_pre_shared_key_rotation, methods=['POST'])
+        self.add_endpoint('/psk/jobs/<job_id>', 'get_rotation_job', get_rotation_job, methods=['GET'])
         self.add_endpoint('/restart', 'restart_node', restart_node, methods=['GET'])
+        self.add_endpoint('/restart/<restart_id>', 'get_restart', get_restart, methods=['GET'])
+        self.add_endpoint('/qkd/pools', 'get_qkd_key_pools', get_qkd_key_pools, methods=['GET'])
+        self.add_endpoint('/qrng/stats', 'get_qrng_stats', get_qrng_stats, methods=['GET'])
+        self.add_endpoint('/node/health', 'get_node_health', get_node_health, methods=['GET'])
+        self.add_endpoint('/logs', 'get_node_logs', get_node_logs, methods=['GET'])
+        self.add_endpoint('/logs/stream', 'stream_node_logs', stream_node_logs, methods=['GET'])
+        self.add_endpoint('/metrics', 'get_metrics', get_metrics, methods=['GET'])
+        self.add_endpoint('/profiler', 'get_profiler', get_profiler, methods=['GET'], profiled=False)
+        self.add_endpoint('/profiler', 'set_profiler', set_profiler, methods=['POST'], profiled=False)
+        self.add_endpoint('/profiler/stacks', 'get_profiler_stacks', get_profiler_stacks, methods=['GET'],
+                          profiled=False)
 
-    def add_endpoint(self, endpoint=None, endpoint_name=None, handler=None, methods=None, *args, **kwargs):
+    def add_endpoint(self, endpoint=None, endpoint_name=None, handler=None, methods=None, *args, profiled=True,
+                     **kwargs):
         if methods is None:
             methods = ['GET']
+        if profiled:
+            handler = profiler.wrap(handler, f"local:{endpoint_name}")
         self.local_server.add_url_rule(endpoint, endpoint_name, handler, methods=methods, *args, **kwargs)
 
     def run(self):
         self.local_server.run(None, common.config.config_service.config.local_server_port, False)
 
 
-def start_thread_with_rotate_pre_shared_key():
-    body = request.get_json()
-    thread = Thread(target=rotate_pre_shared_key, args=(body,))
-    thread.start()
-    return make_response()
+def schedule_pre_shared_key_rotation():
+    body = request.get_json(silent=True)
+    if not __is_rotation_request(body):
+        return jsonify({"message": "Bad request"}), 400
+    job = get_rotation_scheduler().submit(body["block_num"], body["peer_id"], body["is_local_peer"])
+    return jsonify(job.to_dict())
+
+
+def __is_rotation_request(body) -> bool:
+    if not isinstance(body, dict):
+        return False
+    block_number = body.get("block_num")
+    return (isinstance(body.get("is_local_peer"), bool) and isinstance(body.get("peer_id"), str)
+            and isinstance(block_number, int) and not isinstance(block_number, bool) and block_number >= 0)
+
+
+def get_rotation_job(job_id):
+    """
+    Returns the rotation job, with `wait` it waits up to that many seconds for the job to finish.
+    """
+    job = get_rotation_scheduler().get(job_id)
+    if job is None:
+        return jsonify({"message": "Rotation job not found"}), 404
+    wait = request.args.get("wait", 0, type=float)
+    if wait > 0:
+        job.wait(min(wait, MAX_JOB_WAIT))
+    return jsonify(job.to_dict())
 
 
 def restart_node():
-    sleep(3)
-    node.node_service.current_node.restart()
-    common.file.psk_sig_file_manager.remove()
-    return make_response()
+    # The signature is removed before responding, the next rotation may be requested right after
+    signature = common.file.psk_state.remove_signature()
+    restart = node.node_service.request_restart(after_restart=lambda: __remove_psk_signature(signature))
+    return jsonify(restart.to_dict())
+
+
+def get_restart(restart_id):
+    restart = node.node_service.get_restart(restart_id)
+    if restart is None:
+        return jsonify({"message": "Restart not found"}), 404
+    return jsonify(restart.to_dict())
+
+
+def __remove_psk_signature(signature):
+    """
+    Removes the signature again once the node restarted, unless it was replaced by the next rotation.
+    """
+    if signature is not None:
+        common.file.psk_state.remove_signature(signature)
+
+
+def get_qkd_key_pools():
+    return jsonify(key_pool.pool_depths())
+
+
+def get_qrng_stats():
+    return jsonify(qrng.get_entropy_pool().stats())
+
+
+def get_metrics():
+    return Response(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def get_profiler():
+    return jsonify(profiler.get_profiler().stats())
+
+
+def set_profiler():
+    """
+    Switches profiling on or off, the sampling interval can be changed with `interval`.
+    """
+    body = request.get_json()
+    interval = body.get("interval")
+    if "enabled" not in body or (interval is not None and interval <= 0):
+        return jsonify({"message": "Bad request"}), 400
+    sampling_profiler = profiler.get_profiler()
+    if body["enabled"]:
+        sampling_profiler.start(interval)
+    else:
+        sampling_profiler.stop()
+    return jsonify(sampling_profiler.stats())
+
+
+def get_profiler_stacks():
+    """
+    Returns the collapsed stacks sampled since profiling started, with `seconds` only those sampled
+    during the next that many seconds.
+    """
+    sampling_profiler = profiler.get_profiler()
+    if not sampling_profiler.enabled:
+        return jsonify({"message": "Profiling is off"}), 409
+    seconds = request.args.get("seconds", 0, type=float)
+    since = None
+    if seconds > 0:
+        since = sampling_profiler.snapshot()
+        sleep(min(seconds, MAX_PROFILE_WINDOW))
+    return Response(sampling_profiler.collapsed(since), mimetype="text/plain")
 
 
-def rotate_pre_shared_key(body):
+def get_node_health():
+    health = node_rpc.get_health_monitor().latest()
+    if health is None:
+        return jsonify({"message": "Node health not checked yet"}), 404
+    return jsonify(health.to_dict())
+
+
+def get_node_logs():
+    tail = request.args.get("tail", DEFAULT_LOGS_TAIL, type=int)
+    return Response(b"".join(log_buffer.get_node_log_buffer().tail(tail)), mimetype="text/plain")
+
+
+def stream_node_logs():
+    tail = request.args.get("tail", 0, type=int)
+    node_log_buffer = log_buffer.get_node_log_buffer()
+    sequence = node_log_buffer.end() - max(tail, 0)
+
+    def follow_logs():
+        nonlocal sequence
+        while True:
+            lines, sequence = node_log_buffer.read_from(sequence, LOGS_STREAM_WAIT_TIMEOUT)
+            yield from lines
+
+    return Response(follow_logs(), mimetype="text/plain")
+
+
+def rotate_pre_shared_key(body, job: RotationJob = None):
     log.info("Rotating pre-shared key...")
-    try:
-        is_local_peer = body["is_local_peer"]
-        peer_id = body["peer_id"]
-        block_number = body["block_num"]
-
-    except KeyError:
-        return Response(json.dumps({"message": "Bad request"}), status=400, mimetype="application/json")
-
-    if is_local_peer:
-        psk = pre_shared_key.generate_psk_from_qrng()
-        psk_bytes = Psk(psk, block_number=block_number).serialize()
-        node_key = common.file.node_key_file_manager.read()
-        signature = crypto.sign(psk_bytes, node_key).hex()
+    is_local_peer = body["is_local_peer"]
+    peer_id = body["peer_id"]
+    block_number = body["block_num"]
+
+    candidate = __take_psk_candidate(block_number, job) if is_local_peer else None
+    if candidate is not None:
+        log.info(f"Using the pre-shared key prepared for block {block_number}")
+        psk = candidate.psk
+        signature = candidate.signature
+    elif is_local_peer:
+        with __phase(job, "qrng"):
+            psk = pre_shared_key.generate_psk_from_qrng()
+        with __phase(job, "sign"):
+            psk_bytes = pre_shared_key.signing_payload(psk, block_number)
+            node_key = common.file.node_key_file_manager.read()
+            signature = crypto.sign(psk_bytes, node_key).hex()
     else:
         get_psk_result = None
 
         while get_psk_result is None:
-            get_psk_result = pre_shared_key.get_psk_from_peers(block_number, peer_id)
-            sleep(GET_PSK_WAITING_TIME)
+            if job is not None and not job.next_attempt():
+                log.warning(f"Giving up rotation of the pre-shared key for block {block_number}")
+                return
+            get_psk_result = __get_psk_from_peers(block_number, peer_id, job)
+            if get_psk_result is None and job is not None:
+                job.cancelled.wait(GET_PSK_WAITING_TIME)
+            elif get_psk_result is None:
+                sleep(GET_PSK_WAITING_TIME)
         psk = get_psk_result.psk
         signature = get_psk_result.signature
 
-    common.file.psk_file_manager.create(psk)
-    common.file.psk_sig_file_manager.create(signature)
+    def write_psk():
+        common.file.psk_state.update(psk, signature, block_number)
+        common.file.psk_journal.record(psk, signature, block_number, peer_id)
+
+    if job is None:
+        write_psk()
+        return
+    with job.phase("write"):
+        committed = get_rotation_scheduler().commit(job, write_psk)
+    if not committed:
+        log.info(f"Pre-shared key for block {block_number} is superseded, it's not written")
+
+
+def __phase(job: RotationJob, name):
+    return nullcontext() if job is None else job.phase(name)
+
+
+def __take_psk_candidate(block_number, job: RotationJob):
+    candidates = psk_candidates.get_psk_candidates()
+    if candidates is None:
+        return None
+    with __phase(job, "sign"):
+        return candidates.take(block_number)
+
+
+def __get_psk_from_peers(block_number, peer_id, job: RotationJob):
+    if job is None:
+        return pre_shared_key.get_psk_from_peers(block_number, peer_id)
+    with job.phase("fetch"):
+        return pre_shared_key.get_psk_from_peers(block_number, peer_id, timings=job.phases)
+
+
+def __rotate_scheduled(job: RotationJob):
+    rotate_pre_shared_key({"is_local_peer": job.is_local_peer, "peer_id": job.peer_id,
+                           "block_num": job.block_number}, job)
+
+
+rotation_scheduler = None
+rotation_scheduler_lock = Lock()
+
+
+def get_rotation_scheduler() -> RotationScheduler:
+    global rotation_scheduler
+    with rotation_scheduler_lock:
+        if rotation_scheduler is None:
+            config = common.config.config_service.config
+            rotation_scheduler = RotationScheduler(__rotate_scheduled, config.psk_rotation_workers,
+                                                   config.psk_rotation_max_attempts, config.psk_rotation_time_budget)
+        return rotation_scheduler
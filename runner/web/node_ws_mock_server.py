@@ -0,0 +1,65 @@
+import json
+from threading import Thread
+
+from websockets.exceptions import ConnectionClosed
+from websockets.sync.server import serve
+
+NOTIFICATIONS = {
+    "chain_subscribeNewHeads": "chain_newHead",
+    "chain_subscribeFinalizedHeads": "chain_finalizedHead",
+}
+
+
+class NodeWsMockServerWrapper:
+    """
+    Stands in for the WebSocket RPC of the node, it produces a new head every `block_time` seconds
+    and finalizes the block before it. Block import and finality can be stalled to simulate a partitioned node.
+    """
+
+    def __init__(self, port=9944, block_time=6.0):
+        self.port = port
+        self.block_time = block_time
+        self.block_number = 0
+        self.blocks_stalled = False
+        self.finality_stalled = False
+        self.server = None
+
+    def run(self):
+        with serve(self.handle_connection, "localhost", self.port, compression=None) as server:
+            self.server = server
+            server.serve_forever()
+
+    def start(self):
+        self.server = serve(self.handle_connection, "localhost", self.port, compression=None)
+        self.port = self.server.socket.getsockname()[1]
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+
+    def handle_connection(self, websocket):
+        subscriptions = {}
+        try:
+            while True:
+                try:
+                    request = json.loads(websocket.recv(timeout=self.block_time))
+                    subscription_id = f"subscription_{request['id']}"
+                    subscriptions[subscription_id] = NOTIFICATIONS[request["method"]]
+                    websocket.send(json.dumps({"id": request["id"], "jsonrpc": "2.0", "result": subscription_id}))
+                except TimeoutError:
+                    self.__send_heads(websocket, subscriptions)
+        except ConnectionClosed:
+            pass
+
+    def __send_heads(self, websocket, subscriptions):
+        if not self.blocks_stalled:
+            self.block_number += 1
+        for subscription_id, method in subscriptions.items():
+            if method == "chain_newHead" and self.blocks_stalled:
+                continue
+            if method == "chain_finalizedHead" and self.finality_stalled:
+                continue
+            number = self.block_number if method == "chain_newHead" else max(self.block_number - 1, 0)
+            websocket.send(json.dumps({"jsonrpc": "2.0", "method": method,
+                                       "params": {"subscription": subscription_id,
+                                                  "result": {"number": hex(number)}}}))
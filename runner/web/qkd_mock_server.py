@@ -14,27 +14,35 @@ class QkdMockServerWrapper:
 
         self.add_endpoint('/alice/bob/enc_keys', 'generate_key', self.generate_key, methods=['GET'])
         self.add_endpoint('/alice/bob/dec_keys', 'get_key', self.get_key, methods=['GET'])
+        self.add_endpoint('/alice/bob/status', 'get_status', self.get_status, methods=['GET'])
 
         self.add_endpoint('/bob/alice/enc_keys', 'generate_key', self.generate_key, methods=['GET'])
         self.add_endpoint('/bob/alice/dec_keys', 'get_key', self.get_key, methods=['GET'])
+        self.add_endpoint('/bob/alice/status', 'get_status', self.get_status, methods=['GET'])
 
         self.add_endpoint('/alice/dave/enc_keys', 'generate_key', self.generate_key, methods=['GET'])
         self.add_endpoint('/alice/dave/dec_keys', 'get_key', self.get_key, methods=['GET'])
+        self.add_endpoint('/alice/dave/status', 'get_status', self.get_status, methods=['GET'])
 
         self.add_endpoint('/dave/alice/enc_keys', 'generate_key', self.generate_key, methods=['GET'])
         self.add_endpoint('/dave/alice/dec_keys', 'get_key', self.get_key, methods=['GET'])
+        self.add_endpoint('/dave/alice/status', 'get_status', self.get_status, methods=['GET'])
 
         self.add_endpoint('/bob/charlie/enc_keys', 'generate_key', self.generate_key, methods=['GET'])
         self.add_endpoint('/bob/charlie/dec_keys', 'get_key', self.get_key, methods=['GET'])
+        self.add_endpoint('/bob/charlie/status', 'get_status', self.get_status, methods=['GET'])
 
         self.add_endpoint('/charlie/bob/enc_keys', 'generate_key', self.generate_key, methods=['GET'])
         self.add_endpoint('/charlie/bob/dec_keys', 'get_key', self.get_key, methods=['GET'])
+        self.add_endpoint('/charlie/bob/status', 'get_status', self.get_status, methods=['GET'])
 
         self.add_endpoint('/charlie/dave/enc_keys', 'generate_key', self.generate_key, methods=['GET'])
         self.add_endpoint('/charlie/dave/dec_keys', 'get_key', self.get_key, methods=['GET'])
+        self.add_endpoint('/charlie/dave/status', 'get_status', self.get_status, methods=['GET'])
 
         self.add_endpoint('/dave/charlie/enc_keys', 'generate_key', self.generate_key, methods=['GET'])
         self.add_endpoint('/dave/charlie/dec_keys', 'get_key', self.get_key, methods=['GET'])
+        self.add_endpoint('/dave/charlie/status', 'get_status', self.get_status, methods=['GET'])
 
     def add_endpoint(self, endpoint=None, endpoint_name=None, handler=None, methods=['GET'], *args, **kwargs):
         self.qkd_mock_server.add_url_rule(endpoint, endpoint_name, handler, methods=methods, *args, **kwargs)
@@ -45,24 +53,30 @@ class QkdMockServerWrapper:
     def generate_key(self):
         args = request.args
         size = int(args.get('size'))
-        key = Random.get_random_bytes(int(size / 8)).hex()
-        key_base64 = hex_to_base64(key)
-
-        self.keys[self.counter_id] = key_base64
-
-        response = jsonify({
-            "keys": [
-                {
-                    "key": key_base64,
-                    "key_ID": self.counter_id
-                }
-            ]
+        number = int(args.get('number', 1))
+        keys = []
+        for _ in range(number):
+            key = Random.get_random_bytes(int(size / 8)).hex()
+            key_base64 = hex_to_base64(key)
+
+            self.keys[self.counter_id] = key_base64
+            keys.append({
+                "key": key_base64,
+                "key_ID": self.counter_id
+            })
+
+            self.counter_id = self.counter_id + 1
+
+        return jsonify({"keys": keys})
+
+    def get_status(self):
+        return jsonify({
+            "key_size": 256,
+            "stored_key_count": 25000,
+            "max_key_count": 25000,
+            "max_key_per_request": 128
         })
 
-        self.counter_id = self.counter_id + 1
-
-        return response
-
     def get_key(self):
         args = request.args
         key_id = int(args.get('key_ID'))